@@ -0,0 +1,152 @@
+import time
+import json
+import random
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {'id': 100500, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_test_bot'}
+
+
+class FakeTelegramServer:
+	"""
+	Локальная замена Bot API для нагрузочных тестов
+
+	Реализует getUpdates (long polling из очереди синтетических апдейтов),
+	sendMessage, sendPhoto и answerCallbackQuery. Задержка ответа и доля
+	ответов 429 (flood control) настраиваются. Остальные методы отвечают ok.
+	"""
+
+	def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+				 flood_rate: float = 0.0, retry_after: int = 1, seed: Optional[int] = None):
+		self.host = host
+		self.port = port
+		self.latency = latency
+		self.flood_rate = flood_rate
+		self.retry_after = retry_after
+		self._random = random.Random(seed)
+
+		self._updates: List[dict] = []
+		self._new_updates = asyncio.Event()
+		self._next_update_id = 1
+		self._next_message_id = 1
+		self._runner = None
+
+		# Наблюдаемые результаты
+		self.enqueued_at: Dict[str, float] = {}
+		self.answered_at: Dict[str, float] = {}
+		self.sent: List[dict] = []
+		self.calls: Dict[str, int] = {}
+		self.flooded = 0
+
+	@property
+	def base_url(self) -> str:
+		return f"http://{self.host}:{self.port}"
+
+	async def start(self):
+		app = web.Application()
+		app.router.add_post('/bot{token}/{method}', self._handle)
+		self._runner = web.AppRunner(app)
+		await self._runner.setup()
+		site = web.TCPSite(self._runner, self.host, self.port)
+		await site.start()
+		# Если порт был 0, узнаём выданный системой
+		self.port = site._server.sockets[0].getsockname()[1]
+
+	async def stop(self):
+		if self._runner:
+			await self._runner.cleanup()
+
+	def push_callback(self, user_id: int, data: str) -> str:
+		"""Кладёт в очередь нажатие кнопки и возвращает id callback query"""
+		update_id = self._next_update_id
+		self._next_update_id += 1
+		query_id = f"cq{update_id}"
+		self._updates.append({
+			'update_id': update_id,
+			'callback_query': {
+				'id': query_id,
+				'from': {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"},
+				'chat_instance': str(user_id),
+				'data': data,
+			}
+		})
+		self.enqueued_at[query_id] = time.perf_counter()
+		self._new_updates.set()
+		return query_id
+
+	@staticmethod
+	def _ok(result) -> web.Response:
+		return web.json_response({'ok': True, 'result': result})
+
+	async def _handle(self, request: web.Request) -> web.Response:
+		method = request.match_info['method']
+		params = dict(await request.post())
+		self.calls[method] = self.calls.get(method, 0) + 1
+
+		if method == 'getUpdates':
+			return self._ok(await self._get_updates(params))
+		if method == 'getMe':
+			return self._ok(BOT_USER)
+
+		if self.latency:
+			await asyncio.sleep(self.latency)
+
+		if self.flood_rate and self._random.random() < self.flood_rate:
+			self.flooded += 1
+			return web.json_response({
+				'ok': False,
+				'error_code': 429,
+				'description': f"Too Many Requests: retry after {self.retry_after}",
+				'parameters': {'retry_after': self.retry_after},
+			}, status=429)
+
+		if method == 'answerCallbackQuery':
+			self.answered_at.setdefault(params['callback_query_id'], time.perf_counter())
+			return self._ok(True)
+		if method in ('sendMessage', 'sendPhoto'):
+			return self._ok(self._message(method, params))
+		return self._ok(True)
+
+	async def _get_updates(self, params: dict) -> List[dict]:
+		offset = int(params.get('offset', 0))
+		timeout = float(params.get('timeout', 0))
+
+		# Подтверждённые бот апдейты больше не нужны
+		self._updates = [u for u in self._updates if u['update_id'] >= offset]
+		if not self._updates and timeout:
+			self._new_updates.clear()
+			try:
+				await asyncio.wait_for(self._new_updates.wait(), timeout)
+			except asyncio.TimeoutError:
+				pass
+		limit = int(params.get('limit', 100))
+		return self._updates[:limit]
+
+	def _message(self, method: str, params: dict) -> dict:
+		message_id = self._next_message_id
+		self._next_message_id += 1
+		self.sent.append({'method': method, 'chat_id': params.get('chat_id'), 'at': time.perf_counter()})
+
+		chat_id = params.get('chat_id', '0')
+		message = {
+			'message_id': message_id,
+			'date': int(time.time()),
+			'chat': {
+				'id': int(chat_id) if chat_id.lstrip('-').isdigit() else -1000000000000 - abs(hash(chat_id)) % 10 ** 9,
+				'type': 'channel',
+				'title': chat_id,
+			},
+		}
+		if method == 'sendMessage':
+			message['text'] = params.get('text', '')
+		else:
+			message['photo'] = [{'file_id': params.get('photo', ''), 'file_unique_id': 'u', 'width': 1, 'height': 1}]
+			message['caption'] = params.get('caption', '')
+		if params.get('reply_markup'):
+			message['reply_markup'] = json.loads(params['reply_markup'])
+		return message
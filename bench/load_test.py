@@ -0,0 +1,217 @@
+"""
+Нагрузочный тест бота против локальной замены Telegram Bot API
+
+Запуск из корня репозитория:
+    python -m bench.load_test --clicks 5000 --schedules 1000 --output bench_result.json
+
+Проверка регрессии относительно сохранённого результата:
+    python -m bench.load_test --baseline bench_result.json --tolerance 0.2
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+from bench.fake_telegram import FakeTelegramServer
+
+logger = logging.getLogger(__name__)
+
+BENCH_TOKEN = '123456:BENCH-TOKEN'
+# Сколько секунд без новых ответов считать окончанием шторма
+IDLE_TIMEOUT = 3
+
+# Метрики, для которых рост - это регрессия, и для которых регрессия - падение
+LOWER_IS_BETTER = ('callback_p50_ms', 'callback_p99_ms', 'scheduler_drain_s')
+HIGHER_IS_BETTER = ('updates_per_sec', 'scheduler_sends_per_sec')
+
+
+def percentile(values, q):
+	if not values:
+		return 0.0
+	ordered = sorted(values)
+	return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def seed_database(db_path: str, tests: int, options: int = 4):
+	"""Заполняет базу тестами; возвращает список (test_id, callback_data кнопок поста)"""
+	from utils.database import Database
+	from utils.test_versions import test_versions
+	from keyboards.keyboards import get_test_options_keyboard
+
+	db = Database(db_path)
+	seeded = []
+	for i in range(tests):
+		test_options = {f"Вариант{j}": f"Результат {j} для теста {i}" for j in range(options)}
+		test_id = db.add_test(f"Тест {i}", 'text', f"Описание {i}", None, f"Вопрос {i}?", test_options)
+		# Кнопки, как в опубликованном посте: tv_ВЕРСИЯ_НОМЕР
+		version = test_versions.current(db, test_id)
+		keyboard = get_test_options_keyboard([text for text, _ in version.options], version.id)
+		seeded.append((test_id, [row[0].callback_data for row in keyboard.inline_keyboard]))
+	return db, seeded
+
+
+def add_due_schedules(db, seeded, count: int, channels: int):
+	"""Добавляет count расписаний, время которых уже наступило"""
+	due = datetime.utcnow() - timedelta(minutes=1)
+	conn = db._connect()
+	conn.executemany(
+		'INSERT INTO schedule (test_id, channel_id, scheduled_time) VALUES (?, ?, ?)',
+		[(seeded[i % len(seeded)][0], f"@bench_channel_{i % channels}", due.isoformat()) for i in range(count)]
+	)
+	conn.commit()
+	conn.close()
+
+
+async def run_click_storm(server: FakeTelegramServer, seeded, clicks: int, users: int, timeout: float):
+	rng = random.Random(1)
+	started = time.perf_counter()
+	query_ids = []
+	for _ in range(clicks):
+		_, callbacks = seeded[rng.randrange(len(seeded))]
+		query_ids.append(server.push_callback(rng.randrange(1, users + 1), rng.choice(callbacks)))
+
+	# Ждём все ответы; часть может потеряться из-за 429, поэтому выходим и когда ответы перестали приходить
+	deadline = started + timeout
+	answered, last_progress = 0, time.perf_counter()
+	while len(server.answered_at) < len(query_ids) and time.perf_counter() < deadline:
+		await asyncio.sleep(0.01)
+		if len(server.answered_at) != answered:
+			answered, last_progress = len(server.answered_at), time.perf_counter()
+		elif time.perf_counter() - last_progress > IDLE_TIMEOUT:
+			break
+	elapsed = (time.perf_counter() if len(server.answered_at) == len(query_ids) else last_progress) - started
+
+	latencies = [
+		(server.answered_at[q] - server.enqueued_at[q]) * 1000
+		for q in query_ids if q in server.answered_at
+	]
+	return {
+		'clicks': clicks,
+		'answered': len(latencies),
+		'updates_per_sec': round(len(latencies) / elapsed, 1) if elapsed else 0,
+		'callback_p50_ms': round(percentile(latencies, 0.5), 2),
+		'callback_p99_ms': round(percentile(latencies, 0.99), 2),
+	}
+
+
+async def run_schedule_burst(server: FakeTelegramServer, bot, db, seeded, count: int, channels: int):
+	from utils.scheduler import SchedulerManager
+
+	add_due_schedules(db, seeded, count, channels)
+	scheduler = SchedulerManager(bot, db.db_path)
+	sent_before = len(server.sent)
+
+	started = time.perf_counter()
+	await scheduler.check_pending_schedules()
+	elapsed = time.perf_counter() - started
+
+	sent = len(server.sent) - sent_before
+	return {
+		'schedules': count,
+		'scheduler_sent': sent,
+		'scheduler_drain_s': round(elapsed, 3),
+		'scheduler_sends_per_sec': round(sent / elapsed, 1) if elapsed else 0,
+	}
+
+
+async def run(args) -> dict:
+	from aiogram import Bot, Dispatcher
+	from aiogram.client.session.aiohttp import AiohttpSession
+	from aiogram.client.telegram import TelegramAPIServer
+	from aiogram.fsm.storage.memory import MemoryStorage
+
+	server = FakeTelegramServer(latency=args.latency / 1000, flood_rate=args.flood_rate, seed=1)
+	await server.start()
+
+	db, seeded = seed_database(os.path.join(os.getcwd(), 'tests.db'), args.tests)
+
+	# Обработчики создают Database() при импорте, поэтому импорт после смены каталога
+	from handlers.admin_handlers import router as admin_router
+	from handlers.user_handlers import router as user_router
+	from handlers.settings_handlers import router as settings_router
+
+	session = AiohttpSession(api=TelegramAPIServer.from_base(server.base_url))
+	bot = Bot(token=BENCH_TOKEN, session=session)
+	dp = Dispatcher(storage=MemoryStorage())
+	dp.include_router(admin_router)
+	dp.include_router(user_router)
+	dp.include_router(settings_router)
+
+	polling = asyncio.create_task(dp.start_polling(bot, polling_timeout=1, handle_signals=False, close_bot_session=False))
+	try:
+		result = {
+			'started_at': datetime.now().isoformat(timespec='seconds'),
+			'params': vars(args).copy(),
+		}
+		result.update(await run_click_storm(server, seeded, args.clicks, args.users, args.timeout))
+		result.update(await run_schedule_burst(server, bot, db, seeded, args.schedules, args.channels))
+		result['flood_429'] = server.flooded
+		result['api_calls'] = dict(server.calls)
+		return result
+	finally:
+		await dp.stop_polling()
+		await polling
+		await bot.session.close()
+		await server.stop()
+
+
+def compare_with_baseline(result: dict, baseline: dict, tolerance: float) -> list:
+	"""Возвращает список регрессий относительно baseline"""
+	regressions = []
+	for key in LOWER_IS_BETTER:
+		if baseline.get(key) and result[key] > baseline[key] * (1 + tolerance):
+			regressions.append(f"{key}: {baseline[key]} -> {result[key]}")
+	for key in HIGHER_IS_BETTER:
+		if baseline.get(key) and result[key] < baseline[key] * (1 - tolerance):
+			regressions.append(f"{key}: {baseline[key]} -> {result[key]}")
+	return regressions
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Нагрузочный тест бота с фейковым Bot API")
+	parser.add_argument('--tests', type=int, default=100, help="Сколько тестов создать в базе")
+	parser.add_argument('--clicks', type=int, default=2000, help="Нажатий на кнопки в шторме")
+	parser.add_argument('--users', type=int, default=500, help="Уникальных пользователей")
+	parser.add_argument('--schedules', type=int, default=500, help="Расписаний в пачке для планировщика")
+	parser.add_argument('--channels', type=int, default=50, help="Каналов в пачке")
+	parser.add_argument('--latency', type=float, default=0.0, help="Задержка ответа Bot API, мс")
+	parser.add_argument('--flood-rate', type=float, default=0.0, help="Доля ответов 429")
+	parser.add_argument('--timeout', type=float, default=120, help="Максимальное время шторма, с")
+	parser.add_argument('--output', help="Куда сохранить результат (JSON)")
+	parser.add_argument('--baseline', help="Результат прошлого прогона для сравнения")
+	parser.add_argument('--tolerance', type=float, default=0.2, help="Допустимое ухудшение (доля)")
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.WARNING, format='%(message)s')
+
+	repo_root = os.getcwd()
+	with tempfile.TemporaryDirectory(prefix='bot-bench-') as workdir:
+		# Бот работает с tests.db в текущем каталоге, поэтому прогон идёт во временном
+		os.chdir(workdir)
+		try:
+			result = asyncio.run(run(args))
+		finally:
+			os.chdir(repo_root)
+
+	print(json.dumps(result, ensure_ascii=False, indent=2))
+	if args.output:
+		with open(args.output, 'w', encoding='utf-8') as f:
+			json.dump(result, f, ensure_ascii=False, indent=2)
+
+	if args.baseline:
+		with open(args.baseline, encoding='utf-8') as f:
+			baseline = json.load(f)
+		regressions = compare_with_baseline(result, baseline, args.tolerance)
+		if regressions:
+			print("Регрессия производительности:\n" + '\n'.join(regressions), file=sys.stderr)
+			sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
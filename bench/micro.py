@@ -0,0 +1,267 @@
+"""
+Микробенчмарки горячих функций бота
+
+Покрывает parse_channel_input, get_test_options_keyboard, handle_test_answer
+(с фейковым callback), send_test_to_channel (с фейковым ботом) и методы
+Database на таблицах из 10, 1k и 100k строк. Результат пишется в JSON,
+чтобы сравнивать коммиты между собой.
+
+Запуск из корня репозитория:
+    python -m bench.micro --output bench_micro.json
+    python -m bench.micro --compare bench_micro.json        # сравнить с прошлым прогоном
+    python -m bench.micro --filter db. --sizes 10,1000      # только часть бенчмарков
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+OPTIONS = {f"Вариант {i}": f"Результат {i}: " + "текст результата " * 5 for i in range(4)}
+
+
+def measure(fn, repeat: int = 5, min_time: float = 0.1) -> dict:
+	"""Подбирает число итераций так, чтобы замер длился не меньше min_time"""
+	number = 1
+	while True:
+		started = time.perf_counter()
+		for _ in range(number):
+			fn()
+		elapsed = time.perf_counter() - started
+		if elapsed >= min_time:
+			break
+		number *= 10 if elapsed < min_time / 10 else 2
+
+	timings = [elapsed / number]
+	for _ in range(repeat - 1):
+		started = time.perf_counter()
+		for _ in range(number):
+			fn()
+		timings.append((time.perf_counter() - started) / number)
+	return summarize(timings, number)
+
+
+def measure_async(coro_fn, repeat: int = 5, min_time: float = 0.1) -> dict:
+	"""То же для корутин: итерации крутятся внутри одного цикла событий"""
+
+	async def run_batch(number):
+		started = time.perf_counter()
+		for _ in range(number):
+			await coro_fn()
+		return time.perf_counter() - started
+
+	async def run():
+		number = 1
+		while True:
+			elapsed = await run_batch(number)
+			if elapsed >= min_time:
+				break
+			number *= 10 if elapsed < min_time / 10 else 2
+		timings = [elapsed / number]
+		for _ in range(repeat - 1):
+			timings.append(await run_batch(number) / number)
+		return summarize(timings, number)
+
+	return asyncio.run(run())
+
+
+def summarize(timings, number) -> dict:
+	median = statistics.median(timings)
+	return {
+		'median_us': round(median * 1e6, 3),
+		'min_us': round(min(timings) * 1e6, 3),
+		'ops_per_sec': round(1 / median) if median else 0,
+		'iterations': number,
+	}
+
+
+class FakeCallback:
+	"""Минимальная замена CallbackQuery для handle_test_answer"""
+
+	def __init__(self, data: str):
+		self.data = data
+
+	async def answer(self, *args, **kwargs):
+		pass
+
+
+class FakeBot:
+	"""Возвращает отправленное сообщение: send_test_to_channel записывает его в published_posts"""
+
+	# Как и Telegram, отвечает числовым id канала, даже если отправка шла по @username
+	CHAT_ID = -100123
+
+	async def send_message(self, chat_id, **kwargs):
+		return SimpleNamespace(message_id=1, chat=SimpleNamespace(id=self.CHAT_ID))
+
+	async def send_photo(self, chat_id, **kwargs):
+		return SimpleNamespace(message_id=1, chat=SimpleNamespace(id=self.CHAT_ID))
+
+
+def seed(db, rows: int):
+	"""Заполняет тесты и расписания rows строками одним executemany"""
+	options = json.dumps(OPTIONS, ensure_ascii=False)
+	due = datetime.now(pytz.utc) + timedelta(days=1)
+	conn = db._connect()
+	conn.executemany(
+		'INSERT INTO tests (title, content_type, text_content, question_text, options) VALUES (?, ?, ?, ?, ?)',
+		((f"Тест {i}", 'text', f"Описание {i}", f"Вопрос {i}?", options) for i in range(rows))
+	)
+	conn.executemany(
+		'INSERT INTO schedule (test_id, channel_id, scheduled_time) VALUES (?, ?, ?)',
+		((i % rows + 1, f"@channel_{i % 300}", (due + timedelta(minutes=i)).isoformat()) for i in range(rows))
+	)
+	conn.executemany('INSERT OR IGNORE INTO admins (user_id) VALUES (?)', ((i,) for i in range(min(rows, 1000))))
+	conn.commit()
+	conn.close()
+
+
+def bench_functions(results: dict, name_filter: str):
+	from utils.channel_utils import parse_channel_input
+	from keyboards.keyboards import get_test_options_keyboard
+
+	cases = {
+		'parse_channel_input.url': lambda: parse_channel_input('https://t.me/some_channel_name/123'),
+		'parse_channel_input.username': lambda: parse_channel_input('@some_channel_name'),
+		'parse_channel_input.id': lambda: parse_channel_input('-1001234567890'),
+		'parse_channel_input.bare': lambda: parse_channel_input('some_channel_name'),
+		'get_test_options_keyboard': lambda: get_test_options_keyboard(OPTIONS, 42),
+	}
+	for name, fn in cases.items():
+		if name_filter in name:
+			results[name] = measure(fn)
+
+
+def bench_handlers(results: dict, name_filter: str):
+	# Обработчики открывают tests.db в текущем каталоге при импорте
+	from utils.database import Database
+	seed(Database(), 1000)
+
+	from handlers.user_handlers import handle_test_answer, send_test_to_channel
+	from utils.test_versions import test_versions
+	from keyboards.keyboards import get_test_options_keyboard
+
+	option = next(iter(OPTIONS))
+	# Кнопка опубликованного поста: версия уже в кэше процесса
+	version = test_versions.current(Database(), 500)
+	button = get_test_options_keyboard([text for text, _ in version.options], version.id).inline_keyboard[0][0]
+	bot = FakeBot()
+	cases = {
+		'handle_test_answer.hit': lambda: handle_test_answer(FakeCallback(f"test_500_option_{option}")),
+		'handle_test_answer.miss': lambda: handle_test_answer(FakeCallback("test_500_option_нет такого")),
+		'handle_test_answer.tv_hit': lambda: handle_test_answer(FakeCallback(button.callback_data)),
+		# Неизвестная версия: промах кэша и запрос к базе на каждое нажатие
+		'handle_test_answer.tv_miss': lambda: handle_test_answer(FakeCallback("tv_000000000000_0")),
+		'send_test_to_channel': lambda: send_test_to_channel(500, '@bench_channel', bot),
+	}
+	for name, coro_fn in cases.items():
+		if name_filter in name:
+			results[name] = measure_async(coro_fn)
+
+
+def bench_database(results: dict, name_filter: str, sizes):
+	from utils.database import Database
+
+	for rows in sizes:
+		db = Database(f"bench_{rows}.db")
+		seed(db, rows)
+		middle = rows // 2 or 1
+		when = datetime.now(pytz.utc) + timedelta(days=2)
+		cases = {
+			'get_all_settings': lambda: db.get_all_settings(),
+			'get_setting': lambda: db.get_setting('timezone'),
+			'set_setting': lambda: db.set_setting('bench', 'value'),
+			'get_timezone': lambda: db.get_timezone(),
+			'is_admin': lambda: db.is_admin(middle),
+			'add_admin': lambda: db.add_admin(middle),
+			'add_test': lambda: db.add_test('Тест', 'text', 'Описание', None, 'Вопрос?', OPTIONS),
+			'delete_test': lambda: db.delete_test(middle),
+			'get_test': lambda: db.get_test(middle),
+			'get_all_tests': lambda: db.get_all_tests(),
+			'add_schedule': lambda: db.add_schedule(middle, '@bench_channel', when),
+			'has_active_schedules': lambda: db.has_active_schedules(middle),
+			'get_active_schedules': lambda: db.get_active_schedules(),
+			'delete_schedule': lambda: db.delete_schedule(rows + 1),
+		}
+		for method, fn in cases.items():
+			name = f"db.{method}[{rows}]"
+			if name_filter in name:
+				results[name] = measure(fn, repeat=3, min_time=0.05)
+
+
+def git_revision() -> str:
+	try:
+		return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return ''
+
+
+def compare(results: dict, baseline: dict):
+	print(f"{'бенчмарк':<45} {'было, мкс':>12} {'стало, мкс':>12} {'изменение':>10}")
+	for name, current in results.items():
+		previous = baseline.get(name)
+		if not previous:
+			print(f"{name:<45} {'-':>12} {current['median_us']:>12.2f}")
+			continue
+		change = (current['median_us'] / previous['median_us'] - 1) * 100 if previous['median_us'] else 0
+		print(f"{name:<45} {previous['median_us']:>12.2f} {current['median_us']:>12.2f} {change:>+9.1f}%")
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Микробенчмарки горячих функций бота")
+	parser.add_argument('--sizes', default='10,1000,100000', help="Размеры таблиц для методов Database")
+	parser.add_argument('--filter', default='', help="Запускать только бенчмарки, имя которых содержит строку")
+	parser.add_argument('--output', help="Куда сохранить результат (JSON)")
+	parser.add_argument('--compare', help="Результат прошлого прогона для сравнения")
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.ERROR, format='%(message)s')
+	sizes = [int(size) for size in args.sizes.split(',') if size]
+	compare_path = os.path.abspath(args.compare) if args.compare else None
+	output_path = os.path.abspath(args.output) if args.output else None
+
+	results = {}
+	repo_root = os.getcwd()
+	revision = git_revision()
+	with tempfile.TemporaryDirectory(prefix='bot-micro-') as workdir:
+		os.chdir(workdir)
+		try:
+			bench_functions(results, args.filter)
+			bench_handlers(results, args.filter)
+			bench_database(results, args.filter, sizes)
+		finally:
+			os.chdir(repo_root)
+
+	report = {
+		'revision': revision,
+		'created_at': datetime.now().isoformat(timespec='seconds'),
+		'python': platform.python_version(),
+		'results': results,
+	}
+
+	if compare_path:
+		with open(compare_path, encoding='utf-8') as f:
+			compare(results, json.load(f)['results'])
+	else:
+		json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+		print()
+
+	if output_path:
+		with open(output_path, 'w', encoding='utf-8') as f:
+			json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+	main()
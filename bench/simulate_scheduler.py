@@ -0,0 +1,206 @@
+"""
+Прогон планировщика на виртуальном времени
+
+Загружает набор расписаний (сгенерированный или из CSV), прокручивает сутки
+ускоренным виртуальным временем против фейкового бота и выводит распределение
+задержки публикации, отправки в секунду и количество запросов к базе за тик.
+
+Запуск из корня репозитория:
+    python -m bench.simulate_scheduler --rows 100000 --hours 24
+    python -m bench.simulate_scheduler --dataset schedule.csv   # test_id,channel_id,scheduled_time (UTC, ISO)
+"""
+import os
+import csv
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+
+class SimulationFinished(Exception):
+	pass
+
+
+class VirtualClock:
+	"""Виртуальные часы: sleep мгновенно сдвигает время вперёд"""
+
+	def __init__(self, start: datetime, end: datetime):
+		self.now = start
+		self.end = end
+
+	def __call__(self) -> datetime:
+		return self.now
+
+	async def sleep(self, seconds: float):
+		self.now += timedelta(seconds=seconds)
+		if self.now >= self.end:
+			raise SimulationFinished()
+		# Отдаём управление циклу, как настоящий sleep
+		await asyncio.sleep(0)
+
+
+class MockBot:
+	"""Фейковый бот: запоминает виртуальное время каждой отправки"""
+
+	def __init__(self, clock: VirtualClock):
+		self.clock = clock
+		self.sent = []
+		# Числовые id каналов, как их возвращает Telegram при отправке по @username
+		self._chat_ids = {}
+
+	async def send_message(self, chat_id, **kwargs):
+		self.sent.append((chat_id, self.clock.now))
+		numeric_id = self._chat_ids.setdefault(chat_id, -1000000000000 - len(self._chat_ids))
+		return SimpleNamespace(message_id=len(self.sent), chat=SimpleNamespace(id=numeric_id))
+
+	async def send_photo(self, chat_id, **kwargs):
+		return await self.send_message(chat_id, **kwargs)
+
+
+def percentile(values, q):
+	if not values:
+		return 0.0
+	ordered = sorted(values)
+	return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def generate_dataset(rows: int, start: datetime, hours: float, tests: int, channels: int):
+	rng = random.Random(1)
+	span = hours * 3600
+	for i in range(rows):
+		scheduled = start + timedelta(seconds=rng.uniform(0, span))
+		yield rng.randint(1, tests), f"@sim_channel_{i % channels}", scheduled.replace(microsecond=0).isoformat()
+
+
+def load_dataset(path: str):
+	with open(path, encoding='utf-8', newline='') as f:
+		for row in csv.DictReader(f):
+			yield int(row['test_id']), row['channel_id'], row['scheduled_time']
+
+
+def seed_tests(db, tests: int):
+	for i in range(tests):
+		db.add_test(f"Тест {i}", 'text', f"Описание {i}", None, f"Вопрос {i}?", {'Да': 'Результат 1', 'Нет': 'Результат 2'})
+
+
+async def simulate(args) -> dict:
+	from utils.database import Database
+	from utils.db_profiler import profiler
+	from utils.scheduler import SchedulerManager
+
+	start = datetime(2024, 1, 1, tzinfo=pytz.utc)
+	end = start + timedelta(hours=args.hours)
+
+	db = Database(os.path.join(os.getcwd(), 'tests.db'))
+	seed_tests(db, args.tests)
+
+	rows = load_dataset(args.dataset) if args.dataset else generate_dataset(args.rows, start, args.hours, args.tests, args.channels)
+	conn = db._connect()
+	conn.executemany('INSERT INTO schedule (test_id, channel_id, scheduled_time) VALUES (?, ?, ?)', rows)
+	conn.commit()
+	scheduled = {
+		schedule_id: datetime.fromisoformat(value).replace(tzinfo=pytz.utc)
+		for schedule_id, value in conn.execute('SELECT id, scheduled_time FROM schedule')
+	}
+	conn.close()
+
+	clock = VirtualClock(start, end)
+	bot = MockBot(clock)
+	scheduler = SchedulerManager(bot, db.db_path, clock=clock, sleep=clock.sleep, interval=args.interval)
+
+	# Запросы к базе считаем через профилировщик, без сэмплирования
+	profiler.enabled, profiler.sample_rate, profiler.slow_ms = True, 1.0, float('inf')
+	queries_per_tick = []
+	last_tick = [start]
+	check = scheduler.check_pending_schedules
+
+	async def counted_check():
+		last_tick[0] = clock.now
+		before = sum(stats.calls for stats in profiler.stats.values())
+		await check()
+		queries_per_tick.append(sum(stats.calls for stats in profiler.stats.values()) - before)
+
+	scheduler.check_pending_schedules = counted_check
+
+	wall_started = time.perf_counter()
+	try:
+		await scheduler.start_scheduler()
+	except SimulationFinished:
+		pass
+	wall = time.perf_counter() - wall_started
+	profiler.enabled = False
+
+	conn = db._connect()
+	sent_ids = [row[0] for row in conn.execute('SELECT id FROM schedule WHERE is_sent = 1')]
+	conn.close()
+
+	# Задержка публикации: отправки идут по порядку scheduled_time, как и в планировщике
+	send_times = sorted(sent_at for _, sent_at in bot.sent)
+	due_times = sorted(scheduled[i] for i in sent_ids)
+	lags = [(sent - due).total_seconds() for sent, due in zip(send_times, due_times)]
+
+	per_tick_sends = {}
+	for _, sent_at in bot.sent:
+		per_tick_sends[sent_at] = per_tick_sends.get(sent_at, 0) + 1
+
+	# Расписания после последней проверки в окне симуляции не успевают наступить
+	due_total = sum(1 for value in scheduled.values() if value <= last_tick[0])
+	return {
+		'rows': len(scheduled),
+		'due_by_last_tick': due_total,
+		'sent': len(bot.sent),
+		'virtual_hours': args.hours,
+		'wall_seconds': round(wall, 2),
+		'speedup': round(args.hours * 3600 / wall) if wall else 0,
+		'ticks': len(queries_per_tick),
+		'lag_p50_s': round(percentile(lags, 0.5), 1),
+		'lag_p99_s': round(percentile(lags, 0.99), 1),
+		'lag_max_s': round(max(lags), 1) if lags else 0,
+		'sends_per_sec_avg': round(len(bot.sent) / (args.hours * 3600), 3),
+		'sends_per_tick_max': max(per_tick_sends.values(), default=0),
+		'db_queries_per_tick_avg': round(sum(queries_per_tick) / len(queries_per_tick), 1) if queries_per_tick else 0,
+		'db_queries_per_tick_max': max(queries_per_tick, default=0),
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Симуляция планировщика на виртуальном времени")
+	parser.add_argument('--rows', type=int, default=100000, help="Сколько расписаний сгенерировать")
+	parser.add_argument('--hours', type=float, default=24, help="Длительность симуляции в часах")
+	parser.add_argument('--tests', type=int, default=50, help="Сколько тестов создать")
+	parser.add_argument('--channels', type=int, default=300, help="Сколько каналов в наборе")
+	parser.add_argument('--interval', type=float, default=30, help="Период проверки планировщика, с")
+	parser.add_argument('--dataset', help="CSV с колонками test_id,channel_id,scheduled_time")
+	parser.add_argument('--output', help="Куда сохранить результат (JSON)")
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.WARNING, format='%(message)s')
+	if args.dataset:
+		args.dataset = os.path.abspath(args.dataset)
+
+	repo_root = os.getcwd()
+	with tempfile.TemporaryDirectory(prefix='bot-sim-') as workdir:
+		# Обработчики открывают tests.db в текущем каталоге
+		os.chdir(workdir)
+		try:
+			result = asyncio.run(simulate(args))
+		finally:
+			os.chdir(repo_root)
+
+	print(json.dumps(result, ensure_ascii=False, indent=2))
+	if args.output:
+		with open(args.output, 'w', encoding='utf-8') as f:
+			json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+	main()
@@ -1,15 +1,29 @@
 import os
 import asyncio
+from datetime import timedelta
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from handlers.admin_handlers import router as admin_router
-from handlers.user_handlers import router as user_router
+from handlers.user_handlers import router as user_router, cached_answer
 from handlers.settings_handlers import router as settings_router
 from utils.database import Database
+from utils.fsm_storage import SQLiteStorage
 from utils.scheduler import SchedulerManager
-from utils.setup_logging import setup_logging
+from utils.channels import channel_registry
+from utils.retention import RetentionManager
+from utils.backup import backup_manager
+from utils.loop_watchdog import LoopWatchdog
+from utils.http_session import TunedSession
+from utils.circuit_breaker import channel_breaker
+from utils.test_versions import test_versions
+from utils.metrics import metrics, start_metrics_server
+from middlewares.latency import HandlerLatencyMiddleware, RequestLatencyMiddleware
+from middlewares.database import DatabaseMiddleware
+from middlewares.throttling import CallbackThrottleMiddleware
+from utils.setup_logging import setup_logging, stop_logging
+from utils.db_profiler import profiler
+from handlers.user_handlers import answers_summary
 from utils.emoji import Emoji as E
 
 # Загружаем переменные окружения
@@ -19,22 +33,83 @@ load_dotenv()
 logger = setup_logging()
 
 # Конфигурация - с fallback для Docker
-BOT_TOKEN = os.getenv('BOT_TOKEN')
+# Несколько ботов в одном процессе: BOT_TOKENS=токен1,токен2 (или один BOT_TOKEN)
+BOT_TOKENS = [x.strip() for x in (os.getenv('BOT_TOKENS') or os.getenv('BOT_TOKEN') or '').split(',') if x.strip()]
 ADMIN_IDS = [int(x.strip()) for x in os.getenv('ADMIN_IDS', '').split(',') if x.strip()]
+# Через сколько секунд бездействия состояние FSM считается брошенным
+FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', 24 * 60 * 60))
+FSM_MAX_STATES = int(os.getenv('FSM_MAX_STATES', 10000))
+FSM_SWEEP_INTERVAL = int(os.getenv('FSM_SWEEP_INTERVAL', 60))
+# Порт локального эндпоинта /metrics (если не задан - эндпоинт не поднимается)
+METRICS_PORT = os.getenv('METRICS_PORT')
+# Через сколько часов перепроверять канал (права бота, название, username)
+CHANNEL_REFRESH_HOURS = float(os.getenv('CHANNEL_REFRESH_HOURS', 24))
+# Через сколько дней отправленные расписания уходят в архив (0 - не архивировать)
+RETENTION_DAYS = float(os.getenv('RETENTION_DAYS', 30))
+RETENTION_INTERVAL_HOURS = float(os.getenv('RETENTION_INTERVAL_HOURS', 6))
+# Период резервного копирования базы в exports/ (0 - только по команде /backup)
+BACKUP_INTERVAL_HOURS = float(os.getenv('BACKUP_INTERVAL_HOURS', 24))
+# Сколько секунд при остановке ждать завершения текущей отправки (docker stop ждёт 10 с)
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', 8))
+# inline - планировщик отправляет сам, outbox - ставит в очередь для python -m utils.dispatcher
+DISPATCH_MODE = os.getenv('DISPATCH_MODE', 'inline')
+# Отдельный пул соединений для рассылки и фоновых проверок каналов (настройки HTTP_BULK_*),
+# чтобы массовая отправка не занимала соединения, нужные для ответов на нажатия кнопок
+HTTP_SPLIT_SESSIONS = os.getenv('HTTP_SPLIT_SESSIONS', '0') == '1'
+# Сколько нажатий на кнопки тестов пользователь может сделать за CALLBACK_WINDOW секунд,
+# лишние отсекаются до обработчика (0 - без ограничения)
+CALLBACK_LIMIT = int(os.getenv('CALLBACK_LIMIT', 5))
+CALLBACK_WINDOW = float(os.getenv('CALLBACK_WINDOW', 2))
+CALLBACK_MAX_USERS = int(os.getenv('CALLBACK_MAX_USERS', 10000))
 
 
 async def main():
-	if not BOT_TOKEN:
+	if not BOT_TOKENS:
 		logger.error(f"{E.ERROR} BOT_TOKEN не найден в переменных окружения")
 		return
 
+	schedulers = []
+	background_tasks = []
 	try:
-		bot = Bot(token=BOT_TOKEN)
-		storage = MemoryStorage()
+		# Боты делят один пул соединений (сессия не привязана к токену)
+		session = TunedSession.from_env()
+		bots = [Bot(token=token, session=session) for token in BOT_TOKENS]
+		# Те же токены, но свой пул соединений (или те же боты, если разделение выключено)
+		if HTTP_SPLIT_SESSIONS:
+			bulk_session = TunedSession.from_env('HTTP_BULK_')
+			bulk_bots = [Bot(token=token, session=bulk_session) for token in BOT_TOKENS]
+		else:
+			bulk_bots = bots
+		storage = SQLiteStorage(ttl=FSM_STATE_TTL, max_states=FSM_MAX_STATES)
 		dp = Dispatcher(storage=storage)
+		# Массовые действия из обработчиков (/posts) идут через пул рассылки: аргумент bulk_bots
+		dp['bulk_bots'] = {bulk_bot.id: bulk_bot for bulk_bot in bulk_bots}
+
+		# Метрики задержек обработчиков и запросов к Telegram API
+		latency_middleware = HandlerLatencyMiddleware()
+		dp.message.middleware(latency_middleware)
+		dp.callback_query.middleware(latency_middleware)
+		request_latency = RequestLatencyMiddleware()
+		session.middleware(request_latency)
+		if HTTP_SPLIT_SESSIONS:
+			bulk_session.middleware(request_latency)
+		metrics.register_gauge('fsm_states', lambda: storage.live_count)
+		metrics.register_gauge('fsm_states_expired', lambda: storage.expired_total)
+		metrics.register_gauge('open_circuits', lambda: len(channel_breaker.open_circuits()))
+		metrics.register_gauge('version_cache', lambda: len(test_versions))
+		if METRICS_PORT:
+			await start_metrics_server(port=int(METRICS_PORT))
 
 		# Инициализация базы данных с путем для Docker
 		db = Database()
+		# Читатели (процесс рассылки, резервная копия) не блокируют запись ботом
+		db.enable_wal()
+		# Тесты и расписания, созданные до появления нескольких ботов, принадлежат первому
+		assigned = db.assign_unowned(bots[0].id)
+		if assigned:
+			logger.info(f"{E.INFO} Боту {bots[0].id} переданы записи без владельца: {assigned}")
+		# Обработчики получают базу бота, которому пришёл апдейт
+		dp.update.outer_middleware(DatabaseMiddleware(db))
 
 		# Добавление администраторов
 		for admin_id in ADMIN_IDS:
@@ -43,6 +118,16 @@ async def main():
 				if success:
 					logger.info(f"{E.SUCCESS} Администратор {admin_id} добавлен")
 
+		# Поток нажатий одного пользователя ограничивается до обработчика ответов
+		if CALLBACK_LIMIT > 0:
+			callback_throttle = CallbackThrottleMiddleware(
+				limit=CALLBACK_LIMIT, window=CALLBACK_WINDOW, max_users=CALLBACK_MAX_USERS,
+				cached_answer=cached_answer
+			)
+			# Внутренний middleware: считаются только нажатия на кнопки тестов, не админки
+			user_router.callback_query.middleware(callback_throttle)
+			metrics.register_gauge('throttle_users', lambda: len(callback_throttle))
+
 		# Регистрация роутеров
 		dp.include_router(admin_router)
 		dp.include_router(user_router)
@@ -50,21 +135,67 @@ async def main():
 		logger.info(f"{E.SUCCESS} Все роутеры зарегистрированы")
 
 		# Запуск планировщика в фоне
-		scheduler = SchedulerManager(bot)
-		asyncio.create_task(scheduler.start_scheduler())
-		logger.info(f"{E.SUCCESS} Планировщик запущен")
+		if DISPATCH_MODE == 'outbox':
+			metrics.register_gauge('outbox_pending', lambda: db.get_outbox_counts().get('pending', 0))
+		# У каждого бота свой планировщик по своим расписаниям
+		for bulk_bot in bulk_bots:
+			scheduler = SchedulerManager(bulk_bot, mode=DISPATCH_MODE, bot_id=bulk_bot.id)
+			scheduler.start()
+			schedulers.append(scheduler)
+		logger.info(f"{E.SUCCESS} Планировщик запущен (режим {DISPATCH_MODE}, ботов: {len(schedulers)})")
+
+		# Остановка polling (SIGTERM/SIGINT): даём текущей отправке завершиться,
+		# пока HTTP-сессии ещё открыты
+		async def stop_schedulers():
+			await asyncio.gather(*(scheduler.shutdown(SHUTDOWN_TIMEOUT) for scheduler in schedulers))
+
+		dp.shutdown.register(stop_schedulers)
+
+		# Очистка брошенных состояний мастеров
+		background_tasks.append(asyncio.create_task(storage.start_sweeper(bots, FSM_SWEEP_INTERVAL)))
+
+		# Фоновая перепроверка каналов
+		background_tasks.append(asyncio.create_task(channel_registry.start_refresher(bulk_bots, timedelta(hours=CHANNEL_REFRESH_HOURS))))
+
+		# Архивирование отправленных расписаний и очистка удалённых тестов
+		if RETENTION_DAYS > 0:
+			retention = RetentionManager(db, RETENTION_DAYS)
+			background_tasks.append(asyncio.create_task(retention.start(RETENTION_INTERVAL_HOURS * 3600)))
+
+		# Резервные копии базы по расписанию
+		if BACKUP_INTERVAL_HOURS > 0:
+			background_tasks.append(asyncio.create_task(backup_manager.start(BACKUP_INTERVAL_HOURS * 3600)))
+
+		# Задержка цикла событий и поиск блокирующих вызовов
+		background_tasks.append(asyncio.create_task(LoopWatchdog.from_env().run()))
 
 		logger.info(f"{E.ROCKET} Бот запущен и готов к работе")
 
-		await dp.start_polling(bot)
+		# Сессии закрываются ниже, после остановки планировщиков
+		await dp.start_polling(*bots, close_bot_session=False)
 
 	except Exception as e:
 		logger.error(f"{E.ERROR} Критическая ошибка при запуске бота: {e}")
 		raise
 	finally:
+		# Обычно планировщики уже остановлены в dp.shutdown; здесь - при ошибке запуска
+		await asyncio.gather(*(scheduler.shutdown(SHUTDOWN_TIMEOUT) for scheduler in schedulers))
+
+		for task in background_tasks:
+			task.cancel()
+		await asyncio.gather(*background_tasks, return_exceptions=True)
+
 		await storage.close()
-		await bot.session.close()
+		await session.close()
+		if HTTP_SPLIT_SESSIONS:
+			await bulk_session.close()
+
+		# Сбрасываем накопленную статистику до остановки логирования
+		answers_summary.flush()
+		if profiler.enabled:
+			profiler.save()
 		logger.info(f"{E.STOPPED} Бот остановлен")
+		stop_logging()
 
 
 if __name__ == "__main__":
@@ -1,19 +1,40 @@
 import logging
 from aiogram import Router, F, types
+from aiogram.types import FSInputFile, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command, StateFilter
 from utils.database import Database
 from keyboards.keyboards import *
-from states import TestCreation, ScheduleCreation, TestDeletion, ScheduleDeletion
+from states import TestCreation, ScheduleCreation, TestDeletion, ScheduleDeletion, DataImport
 from utils.emoji import Emoji as E
-from utils.channel_utils import parse_channel_input
+from utils.channel_utils import parse_channel_input, parse_channel_list
+from utils.channels import channel_registry, ChannelInfo, ChannelRateLimited
+from utils.metrics import metrics
+from utils.circuit_breaker import channel_breaker
+from utils.backup import backup_manager
+from utils import profiling
+from utils.post_actions import PostActions, rate_limiter_for
+from utils.test_versions import test_versions
+from utils.recurrence import Recurrence, parse_recurrence
+from utils.test_io import (
+	RowError, parse_options_text, validate_options, detect_format, import_file,
+	export_tests, export_schedules, export_path, FORMATS
+)
+import os
+import re
 import json
-from datetime import datetime
+import html
+import time
+import asyncio
+import tempfile
+from datetime import datetime, timedelta
 import pytz
 
 logger = logging.getLogger(__name__)
 
 router = Router()
+# Тесты и расписания обработчики берут из базы своего бота (аргумент db, DatabaseMiddleware),
+# эта база - для общих данных и для запуска без нескольких ботов
 db = Database()
 
 
@@ -34,7 +55,7 @@ async def admin_start(message: types.Message):
 
 # Список тестов
 @router.message(F.text == f"{E.LIST} Мои тесты")
-async def show_my_tests(message: types.Message):
+async def show_my_tests(message: types.Message, db: Database = db):
 	if not db.is_admin(message.from_user.id):
 		return
 
@@ -153,49 +174,19 @@ async def process_question(message: types.Message, state: FSMContext):
 
 # Варианты ответов с валидацией
 @router.message(TestCreation.waiting_for_options)
-async def process_options(message: types.Message, state: FSMContext):
+async def process_options(message: types.Message, state: FSMContext, db: Database = db):
 	if message.text == f"{E.CANCEL} Отмена":
 		await state.clear()
 		await message.answer(f"{E.CANCEL} Создание теста отменено", reply_markup=get_admin_main_menu())
 		return
 
 	try:
-		options = {}
-		lines = message.text.split('\n')
-
-		# Парсим варианты ответа вида "Вариант1 :: Результат 1"
-		for line in lines:
-			if '::' in line:
-				option, result = line.split('::', 1)
-				option_text = option.strip()
-				result_text = result.strip()
-
-				if len(result_text) > 200:
-					await message.answer(
-						f"{E.ERROR} Результат для '{option_text}' слишком длинный ({len(result_text)} символов). "
-						f"Максимум 200 символов. Пожалуйста, введите варианты заново:"
-					)
-					return
-
-				options[option_text] = result_text
-
-		# ВАЛИДАЦИЯ: Проверяем на пустые результаты
-		empty_results = []
-		for option_text, result_text in options.items():
-			if not result_text.strip():
-				empty_results.append(option_text)
-
-		if empty_results:
-			await message.answer(
-				f"{E.ERROR} Для следующих вариантов не заполнен результат:\n"
-				f"{', '.join(empty_results)}\n\n"
-				f"Пожалуйста, введите варианты заново в формате:\n"
-				f"Вариант :: Результат"
-			)
-			return
-
-		if len(options) < 2:
-			await message.answer(f"{E.ERROR} Нужно как минимум 2 варианта ответа. Попробуйте еще раз:")
+		# Парсим варианты ответа вида "Вариант1 :: Результат 1"; те же правила использует импорт из файла
+		options = parse_options_text(message.text)
+		try:
+			validate_options(options)
+		except RowError as e:
+			await message.answer(f"{E.ERROR} {e}. Пожалуйста, введите варианты заново в формате:\nВариант :: Результат")
 			return
 
 		data = await state.get_data()
@@ -223,7 +214,7 @@ async def process_options(message: types.Message, state: FSMContext):
 ###  Планирование отправки
 
 @router.message(F.text == f"{E.CALENDAR} Запланировать отправку")
-async def start_scheduling(message: types.Message, state: FSMContext):
+async def start_scheduling(message: types.Message, state: FSMContext, db: Database = db):
 	if not db.is_admin(message.from_user.id):
 		return
 
@@ -246,13 +237,14 @@ async def process_test_selection(callback: types.CallbackQuery, state: FSMContex
 	await state.update_data(test_id=test_id)
 	await state.set_state(ScheduleCreation.waiting_for_channel)
 	await callback.message.answer(
-		"Введите ID или @username канала (например: @my_channel или -1001234567890):",
+		"Введите ID или @username канала (например: @my_channel или -1001234567890).\n"
+		"Чтобы отправить тест в несколько каналов, укажите их списком - по одному в строке:",
 		reply_markup=get_cancel_keyboard()
 	)
 	await callback.answer()
 
 
-# Выбор канала (@channel_name или https://t.me/channel_name)
+# Выбор канала (@channel_name или https://t.me/channel_name), можно списком
 @router.message(ScheduleCreation.waiting_for_channel)
 async def process_channel(message: types.Message, state: FSMContext):
 	if message.text == f"{E.CANCEL} Отмена":
@@ -260,33 +252,95 @@ async def process_channel(message: types.Message, state: FSMContext):
 		await message.answer(f"{E.CANCEL} Планирование отменено", reply_markup=get_admin_main_menu())
 		return
 
-	# Преобразуем ввод канала в стандартный формат
-	channel_id = parse_channel_input(message.text)
-	await state.update_data(channel_id=channel_id)
+	channel_refs, invalid = parse_channel_list(message.text)
+	if not channel_refs:
+		await message.answer(
+			f"{E.ERROR} Не удалось распознать ни одного канала.\n"
+			"Проверьте ссылки и введите каналы ещё раз:"
+		)
+		return
+
+	# Разрешаем каналы через Telegram один раз и дальше храним числовые id
+	resolved = await channel_registry.resolve_many(message.bot, channel_refs)
+	channels = [info for _, info in resolved if isinstance(info, ChannelInfo)]
+	rate_limited = [ref for ref, info in resolved if isinstance(info, ChannelRateLimited)]
+	not_found = [ref for ref, info in resolved if not isinstance(info, (ChannelInfo, ChannelRateLimited))]
+	no_rights = [info for info in channels if not info.can_post]
+
+	report = ""
+	if invalid:
+		report += f"{E.ERROR} Не распознаны ({len(invalid)}): " + ", ".join(html.escape(item) for item in invalid[:20]) + "\n"
+	if not_found:
+		report += f"{E.ERROR} Не найдены или бот не добавлен ({len(not_found)}): " + ", ".join(not_found[:20]) + "\n"
+	if rate_limited:
+		report += (
+			f"{E.CLOCK} Не проверены из-за ограничения Telegram ({len(rate_limited)}): "
+			+ ", ".join(rate_limited[:20]) + "\nПопробуйте добавить их ещё раз через минуту.\n"
+		)
+	if no_rights:
+		report += (
+			f"{E.WARNING} Нет прав на публикацию ({len(no_rights)}): "
+			+ ", ".join(html.escape(info.display_name) for info in no_rights[:20])
+			+ "\nВыдайте боту права администратора до времени отправки.\n"
+		)
+
+	if not channels:
+		await message.answer(report + "\nВведите каналы ещё раз:", parse_mode="HTML")
+		return
+
+	await state.update_data(
+		channel_ids=[str(info.chat_id) for info in channels],
+		channel_name=channels[0].display_name if len(channels) == 1 else f"{len(channels)} каналов"
+	)
 	await state.set_state(ScheduleCreation.waiting_for_time)
+
+	if len(channels) == 1:
+		recognized = f"{E.CHANNEL} Канал распознан как: <b>{html.escape(channels[0].display_name)}</b> (<code>{channels[0].chat_id}</code>)\n\n"
+	else:
+		recognized = f"{E.CHANNEL} Распознано каналов: <b>{len(channels)}</b>\n\n"
+
 	await message.answer(
-		f"{E.CHANNEL} Канал распознан как: <code>{channel_id}</code>\n\n"
+		recognized + (report + "\n" if report else "") +
 		f"{E.CLOCK} Введите время отправки в формате ДД.ММ.ГГГГ ЧЧ:ММ\n"
-		"Например: 25.12.2024 15:30",
+		"Например: 25.12.2024 15:30\n\n"
+		"Для нескольких каналов можно разнести отправку по времени: добавьте интервал в минутах, "
+		"например 25.12.2024 15:30 +10\n\n"
+		f"{E.REPEAT} Чтобы отправка повторялась, добавьте правило после слова повтор: интервал "
+		"(25.12.2024 15:30 повтор 7д) или выражение cron (25.12.2024 15:30 повтор 0 10 * * 1 - "
+		"по понедельникам в 10:00, начиная с указанной даты)",
 		parse_mode="HTML",
 		reply_markup=get_cancel_keyboard()
 	)
 
 
-# Время отправки теста
+# Время отправки теста: "ДД.ММ.ГГГГ ЧЧ:ММ", необязательный интервал "+N" минут между каналами
+# и необязательное правило повтора "повтор 7д" или "повтор 0 10 * * 1" (см. Recurrence)
+SCHEDULE_TIME_RE = re.compile(
+	r'^\s*(\d{1,2}\.\d{1,2}\.\d{4}\s+\d{1,2}:\d{2})(?:\s*\+\s*(\d+)\s*(?:мин|m|min)?)?'
+	r'(?:\s+(?:повтор|repeat)\s+(.+?))?\s*$',
+	re.IGNORECASE
+)
+
+
 @router.message(ScheduleCreation.waiting_for_time)
-async def process_time(message: types.Message, state: FSMContext):
+async def process_time(message: types.Message, state: FSMContext, db: Database = db):
 	if message.text == f"{E.CANCEL} Отмена":
 		await state.clear()
 		await message.answer(f"{E.CANCEL} Планирование отменено", reply_markup=get_admin_main_menu())
 		return
 	try:
+		match = SCHEDULE_TIME_RE.match(message.text or '')
+		if not match:
+			raise ValueError(message.text)
+		interval = timedelta(minutes=int(match.group(2) or 0))
+		recurrence = Recurrence.parse(match.group(3)) if match.group(3) else None
+
 		# Получаем часовой пояс из настроек
 		timezone_str = db.get_timezone()
 		tz = pytz.timezone(timezone_str)
 
 		# Парсим введенное время (считаем, что оно в установленном часовом поясе)
-		local_time = datetime.strptime(message.text, "%d.%m.%Y %H:%M")
+		local_time = datetime.strptime(' '.join(match.group(1).split()), "%d.%m.%Y %H:%M")
 
 		# Локализуем время в указанном часовом поясе
 		localized_time = tz.localize(local_time)
@@ -295,43 +349,98 @@ async def process_time(message: types.Message, state: FSMContext):
 		utc_time = localized_time.astimezone(pytz.utc)
 
 		data = await state.get_data()
-		db.add_schedule(data['test_id'], data['channel_id'], utc_time)
+		# Черновики, начатые до массового планирования, хранят один channel_id
+		channel_ids = data.get('channel_ids') or [data['channel_id']]
+
+		# Cron задаёт время сам: сдвиг между каналами сохранился бы только у первой отправки
+		if recurrence and recurrence.interval is None and interval and len(channel_ids) > 1:
+			await message.answer(
+				f"{E.ERROR} Интервал между каналами нельзя совместить с правилом cron. "
+				"Уберите +N или используйте повтор через интервал, например: повтор 7д"
+			)
+			return
+
+		# Все расписания добавляются одной транзакцией
+		schedules = [
+			(data['test_id'], channel_id, utc_time + interval * i)
+			for i, channel_id in enumerate(channel_ids)
+		]
+		if recurrence:
+			# Хранится правило и только ближайшая отправка, следующие добавляет планировщик
+			added = db.add_schedule_rules(
+				[(test_id, channel_id, recurrence, start_time) for test_id, channel_id, start_time in schedules],
+				timezone_str
+			)
+			# Первая отправка по cron - ближайшее совпадение не раньше указанного времени
+			local_time = recurrence.next_after(
+				utc_time - timedelta(seconds=1), tz, utc_time
+			).astimezone(tz).replace(tzinfo=None)
+		else:
+			added = db.add_schedules(schedules)
+		if not added:
+			await message.answer(f"{E.ERROR} Не удалось сохранить расписание, попробуйте ещё раз")
+			return
 
 		test = db.get_test(data['test_id'])
 		test_title = test[1] if test else "Неизвестный тест"
 
+		if len(channel_ids) == 1:
+			when = f"{E.CALENDAR} Дата: {local_time.strftime('%d.%m.%Y %H:%M')} ({timezone_str})\n"
+		else:
+			last_time = local_time + interval * (len(channel_ids) - 1)
+			when = (
+				f"{E.CALENDAR} Дата: {local_time.strftime('%d.%m.%Y %H:%M')}"
+				+ (f" - {last_time.strftime('%d.%m.%Y %H:%M')}" if interval else "")
+				+ f" ({timezone_str})\n"
+			)
+		if recurrence:
+			when += f"{E.REPEAT} Повтор: {recurrence.describe()}\n"
+
 		await message.answer(
 			f"{E.CONFIRM} Тест '{test_title}' запланирован!\n"
-			f"{E.CALENDAR} Дата: {local_time.strftime('%d.%m.%Y %H:%M')} ({timezone_str})\n"
-			f"{E.CHANNEL} Канал: {data['channel_id']}",
+			f"{when}"
+			f"{E.CHANNEL} Канал: {data.get('channel_name', channel_ids[0])}",
 			reply_markup=get_admin_main_menu()
 		)
 		await state.clear()
 
-	except ValueError:
+	except ValueError as e:
 		await message.answer(
 			f"{E.ERROR} Неверный формат времени. Используйте: ДД.ММ.ГГГГ ЧЧ:ММ\n"
-			f"Пример: 25.12.2024 15:30"
+			f"Пример: 25.12.2024 15:30 или 25.12.2024 15:30 +10 (интервал между каналами в минутах)"
+			+ (f"\n\n{e}" if match and match.group(3) else "")
 		)
 
 
 ### Управление расписаниями отправки
 
-@router.message(F.text == f"{E.SCHEDULES} Активные расписания")
-async def show_active_schedules(message: types.Message):
-	if not db.is_admin(message.from_user.id):
-		return
+# Расписаний на странице: текст списка должен уложиться в 4096 символов сообщения
+SCHEDULES_PAGE_SIZE = 10
 
-	schedules = db.get_active_schedules()
-	if not schedules:
-		await message.answer(f"{E.POST_BOX} Нет активных расписаний")
-		return
+
+def render_schedules_page(db: Database, page: int):
+	"""Текст и клавиатура страницы page списка активных расписаний; None - расписаний нет"""
+	total = db.count_active_schedules()
+	if not total:
+		return None
+	pages = (total + SCHEDULES_PAGE_SIZE - 1) // SCHEDULES_PAGE_SIZE
+	page = min(max(page, 0), pages - 1)
+	schedules = db.get_active_schedules(limit=SCHEDULES_PAGE_SIZE, offset=page * SCHEDULES_PAGE_SIZE)
 
 	# Получаем часовой пояс для отображения
 	timezone_str = db.get_timezone()
 	tz = pytz.timezone(timezone_str)
 
-	text = f"{E.SCHEDULES} Активные расписания ({timezone_str}):\n\n"
+	# Отправка прервалась остановкой бота - неизвестно, опубликован ли тест
+	interrupted = {row[0] for row in db.get_interrupted_schedules()}
+	# Процесс рассылки исчерпал попытки - тест точно не опубликован
+	failed = db.get_failed_schedules()
+	rules = db.get_schedule_rules()
+
+	text = f"{E.SCHEDULES} Активные расписания ({timezone_str}): {total}"
+	if pages > 1:
+		text += f", страница {page + 1} из {pages}"
+	text += "\n\n"
 	for schedule_id, test_title, channel_id, scheduled_time in schedules:
 		try:
 			# Преобразуем UTC время из базы в локальный часовой пояс
@@ -341,24 +450,55 @@ async def show_active_schedules(message: types.Message):
 		except:
 			formatted_time = scheduled_time
 
-		text += f"{E.STAPLE} {test_title}\n  {E.CALENDAR} {formatted_time}\n  {E.CHANNEL} {channel_id}\n\n"
-	await message.answer(
-		text + "Нажмите на расписание чтобы удалить его:",
-		reply_markup=get_schedules_list_keyboard(schedules)
-	)
+		channel_name = channel_registry.display_name_for(channel_id)
+		if channel_breaker.is_open((db.bot_id, channel_registry.chat_id_for(channel_id))):
+			channel_name += f" {E.STOPPED} отправка приостановлена"
+		if schedule_id in interrupted:
+			channel_name += f" {E.WARNING} отправка прервана, проверьте канал"
+		if schedule_id in failed:
+			channel_name += f" {E.ERROR} не отправлено, попытки исчерпаны"
+		text += f"{E.STAPLE} {test_title}\n  {E.CALENDAR} {formatted_time}\n  {E.CHANNEL} {channel_name}\n"
+		if schedule_id in rules:
+			text += f"  {E.REPEAT} {parse_recurrence(rules[schedule_id]).describe()}\n"
+		text += "\n"
+	return text + "Нажмите на расписание чтобы удалить его:", get_schedules_list_keyboard(schedules, page, pages)
+
+
+@router.message(F.text == f"{E.SCHEDULES} Активные расписания")
+async def show_active_schedules(message: types.Message, db: Database = db):
+	if not db.is_admin(message.from_user.id):
+		return
+
+	rendered = render_schedules_page(db, 0)
+	if rendered is None:
+		await message.answer(f"{E.POST_BOX} Нет активных расписаний")
+		return
+
+	text, keyboard = rendered
+	await message.answer(text, reply_markup=keyboard)
+
+
+@router.callback_query(F.data.startswith("schedules_page_"))
+async def show_schedules_page(callback: types.CallbackQuery, db: Database = db):
+	if not db.is_admin(callback.from_user.id):
+		await callback.answer()
+		return
+
+	rendered = render_schedules_page(db, int(callback.data.replace("schedules_page_", "")))
+	if rendered is None:
+		await callback.message.edit_text(f"{E.POST_BOX} Нет активных расписаний")
+	else:
+		text, keyboard = rendered
+		await callback.message.edit_text(text, reply_markup=keyboard)
+	await callback.answer()
 
 
 @router.callback_query(F.data.startswith("delete_schedule_"))
-async def process_schedule_selection_for_deletion(callback: types.CallbackQuery, state: FSMContext):
+async def process_schedule_selection_for_deletion(callback: types.CallbackQuery, state: FSMContext, db: Database = db):
 	schedule_id = int(callback.data.replace("delete_schedule_", ""))
 
 	# Получаем информацию о расписании
-	schedules = db.get_active_schedules()
-	schedule_info = None
-	for s in schedules:
-		if s[0] == schedule_id:
-			schedule_info = s
-			break
+	schedule_info = db.get_active_schedule(schedule_id)
 
 	if schedule_info:
 		schedule_id, test_title, channel_id, scheduled_time = schedule_info
@@ -379,8 +519,12 @@ async def process_schedule_selection_for_deletion(callback: types.CallbackQuery,
 		await callback.message.answer(
 			f"{E.WARNING}️ Вы уверены, что хотите удалить расписание?\n\n"
 			f"Тест: <b>{test_title}</b>\n"
-			f"Канал: {channel_id}\n"
-			f"Время: {formatted_time}",
+			f"Канал: {channel_registry.display_name_for(channel_id)}\n"
+			f"Время: {formatted_time}"
+			+ (
+				f"\n\n{E.REPEAT} Расписание повторяется: следующих отправок тоже не будет"
+				if schedule_id in db.get_schedule_rules() else ""
+			),
 			parse_mode="HTML",
 			reply_markup=get_confirmation_keyboard(action="delete_schedule")
 		)
@@ -389,7 +533,7 @@ async def process_schedule_selection_for_deletion(callback: types.CallbackQuery,
 
 
 @router.callback_query(ScheduleDeletion.waiting_for_confirmation, F.data == "confirm_delete_schedule")
-async def confirm_schedule_deletion(callback: types.CallbackQuery, state: FSMContext):
+async def confirm_schedule_deletion(callback: types.CallbackQuery, state: FSMContext, db: Database = db):
 	data = await state.get_data()
 	schedule_id = data.get('schedule_id')
 	test_title = data.get('test_title')
@@ -421,7 +565,7 @@ async def cancel_schedule_deletion(callback: types.CallbackQuery, state: FSMCont
 
 # Обработчик  для проверки активных расписаний
 @router.callback_query(TestDeletion.waiting_for_test_selection, F.data.startswith("delete_test_"))
-async def process_test_selection_for_deletion(callback: types.CallbackQuery, state: FSMContext):
+async def process_test_selection_for_deletion(callback: types.CallbackQuery, state: FSMContext, db: Database = db):
 	test_id = int(callback.data.replace("delete_test_", ""))
 
 	# Проверяем, есть ли активные расписания
@@ -453,7 +597,7 @@ async def process_test_selection_for_deletion(callback: types.CallbackQuery, sta
 
 
 @router.message(F.text == f"{E.DELETE} Удалить тест")
-async def start_test_deletion(message: types.Message, state: FSMContext):
+async def start_test_deletion(message: types.Message, state: FSMContext, db: Database = db):
 	if not db.is_admin(message.from_user.id):
 		return
 
@@ -470,7 +614,7 @@ async def start_test_deletion(message: types.Message, state: FSMContext):
 
 
 @router.callback_query(TestDeletion.waiting_for_confirmation, F.data == "confirm_delete")
-async def confirm_test_deletion(callback: types.CallbackQuery, state: FSMContext):
+async def confirm_test_deletion(callback: types.CallbackQuery, state: FSMContext, db: Database = db):
 	data = await state.get_data()
 	test_id = data.get('test_id')
 
@@ -526,7 +670,7 @@ async def test_channel_parser(message: types.Message):
 
 # Команда для проверки тестов с пустыми результатами
 @router.message(Command("check_empty_results"))
-async def check_empty_results(message: types.Message):
+async def check_empty_results(message: types.Message, db: Database = db):
 	"""Проверка тестов с пустыми результатами"""
 	if not db.is_admin(message.from_user.id):
 		return
@@ -556,7 +700,7 @@ async def check_empty_results(message: types.Message):
 
 # Команда для исправления конкретного теста
 @router.message(Command("fix_test"))
-async def fix_test_command(message: types.Message):
+async def fix_test_command(message: types.Message, db: Database = db):
 	"""Исправление теста с пустыми результатами"""
 	if not db.is_admin(message.from_user.id):
 		return
@@ -585,4 +729,358 @@ async def fix_test_command(message: types.Message):
 		await message.answer(text)
 
 	except (IndexError, ValueError):
-		await message.answer(f"{E.ERROR} Используйте: /fix_test [ID_теста]\nПример: /fix_test 2")
\ No newline at end of file
+		await message.answer(f"{E.ERROR} Используйте: /fix_test [ID_теста]\nПример: /fix_test 2")
+
+
+# Метрики производительности
+@router.message(Command("perf"))
+async def show_performance(message: types.Message):
+	"""Задержки обработчиков и запросов к Telegram API"""
+	if not db.is_admin(message.from_user.id):
+		return
+
+	text = metrics.render_text() + channel_breaker.render_text(
+		lambda key: f"{channel_registry.display_name_for(key[1])} (бот {key[0]})"
+	)
+	await message.answer(text, parse_mode="HTML")
+
+
+
+async def _run_profiler(message: types.Message, run, seconds: float, kind: str, what: str):
+	if profiling.is_busy():
+		await message.answer(f"{E.ERROR} Уже идёт другой замер, дождитесь его окончания")
+		return
+
+	await message.answer(f"{E.CLOCK} {what} {seconds:g} с, результат придёт файлом")
+	try:
+		report = await run(seconds)
+	except profiling.ProfilerBusy:
+		await message.answer(f"{E.ERROR} Уже идёт другой замер, дождитесь его окончания")
+		return
+
+	filename = f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+	await message.answer_document(BufferedInputFile(report.encode('utf-8'), filename=filename))
+
+
+def _parse_seconds(message: types.Message, default: float, maximum: float) -> float:
+	args = message.text.split()[1:]
+	try:
+		seconds = float(args[0]) if args else default
+	except ValueError:
+		seconds = default
+	return min(max(seconds, 1), maximum)
+
+
+# Профилирование CPU по запросу: /profile [секунды]
+@router.message(Command("profile"))
+async def profile_cpu(message: types.Message):
+	if not db.is_admin(message.from_user.id):
+		return
+	seconds = _parse_seconds(message, 10, profiling.MAX_PROFILE_SECONDS)
+	await _run_profiler(message, profiling.profile_cpu, seconds, 'profile', "Профилирую CPU")
+
+
+# Рост памяти за окно: /memsnap [секунды]
+@router.message(Command("memsnap"))
+async def memory_snapshot(message: types.Message):
+	if not db.is_admin(message.from_user.id):
+		return
+	seconds = _parse_seconds(message, 30, profiling.MAX_MEMSNAP_SECONDS)
+	await _run_profiler(message, profiling.memory_snapshot_diff, seconds, 'memsnap', "Снимаю память")
+
+
+### Импорт и экспорт тестов
+
+# Telegram отдаёт боту файлы до 20 МБ и принимает документы до 50 МБ
+MAX_IMPORT_FILE_SIZE = 20 * 1024 * 1024
+MAX_EXPORT_SEND_SIZE = 50 * 1024 * 1024
+# Как часто обновлять сообщение о ходе импорта, с
+IMPORT_PROGRESS_INTERVAL = 3
+
+
+@router.message(Command("import"))
+async def start_import(message: types.Message, state: FSMContext):
+	if not db.is_admin(message.from_user.id):
+		return
+
+	await state.set_state(DataImport.waiting_for_document)
+	await message.answer(
+		f"{E.POST_BOX} Отправьте файл .jsonl или .csv с тестами или расписаниями.\n\n"
+		"Тесты: title, content_type (text/photo/both), text_content, photo_file_id, question, options\n"
+		"Расписания: test_id, channel_id, scheduled_time (ISO, UTC)\n\n"
+		"Формат совпадает с файлами из /export",
+		reply_markup=get_cancel_keyboard()
+	)
+
+
+@router.message(DataImport.waiting_for_document, F.document)
+async def process_import_document(message: types.Message, state: FSMContext, db: Database = db):
+	document = message.document
+	file_format = detect_format(document.file_name)
+	if not file_format:
+		await message.answer(f"{E.ERROR} Поддерживаются только файлы .jsonl и .csv. Отправьте другой файл:")
+		return
+	if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+		await message.answer(f"{E.ERROR} Файл больше 20 МБ - Telegram не отдаёт такие файлы ботам. Разбейте его на части:")
+		return
+
+	await state.clear()
+	progress = await message.answer(f"{E.CLOCK} Загружаю {document.file_name}...", reply_markup=get_admin_main_menu())
+
+	fd, path = tempfile.mkstemp(suffix=f".{file_format}")
+	os.close(fd)
+	last_update = [time.monotonic()]
+
+	async def report_progress(result):
+		if time.monotonic() - last_update[0] < IMPORT_PROGRESS_INTERVAL:
+			return
+		last_update[0] = time.monotonic()
+		try:
+			await progress.edit_text(
+				f"{E.CLOCK} Импорт {document.file_name}: обработано {result.processed}, "
+				f"добавлено {result.imported}, ошибок {result.error_count}"
+			)
+		except Exception as e:
+			logger.debug(f"Не удалось обновить прогресс импорта: {e}")
+
+	try:
+		await message.bot.download(document, destination=path, timeout=120)
+		result = await import_file(db, path, file_format, on_progress=report_progress)
+	except Exception as e:
+		logger.error(f"{E.ERROR} Ошибка импорта {document.file_name}: {e}")
+		await message.answer(f"{E.ERROR} Ошибка импорта: {e}")
+		return
+	finally:
+		os.remove(path)
+
+	kind = "тестов" if result.kind == 'tests' else "расписаний"
+	text = (
+		f"{E.SUCCESS} Импорт {kind} завершён\n"
+		f"Обработано строк: {result.processed}\n"
+		f"Добавлено: {result.imported}\n"
+	)
+	if result.skipped:
+		text += f"Пропущено (тест не найден): {result.skipped}\n"
+	if result.error_count:
+		text += f"\n{E.ERROR} Ошибок: {result.error_count}\n"
+		if result.failed:
+			text += f"Из них не записано в базу: {result.failed}\n"
+		text += "\n".join(f"Строка {line_no}: {error}" for line_no, error in result.errors)
+		if result.error_count > len(result.errors):
+			text += f"\n...и ещё {result.error_count - len(result.errors)}"
+	await message.answer(text[:4000])
+
+
+@router.message(DataImport.waiting_for_document)
+async def process_import_other(message: types.Message, state: FSMContext):
+	if message.text == f"{E.CANCEL} Отмена":
+		await state.clear()
+		await message.answer(f"{E.CANCEL} Импорт отменён", reply_markup=get_admin_main_menu())
+		return
+	await message.answer(f"{E.ERROR} Отправьте файл .jsonl или .csv документом")
+
+
+@router.message(Command("export"))
+async def export_data(message: types.Message, db: Database = db):
+	"""/export [tests|schedules] [jsonl|csv] - выгрузка в каталог exports"""
+	if not db.is_admin(message.from_user.id):
+		return
+
+	args = message.text.split()[1:]
+	kind = next((arg for arg in args if arg in ('tests', 'schedules')), 'tests')
+	file_format = next((arg for arg in args if arg in FORMATS), 'jsonl')
+	exporter = export_tests if kind == 'tests' else export_schedules
+
+	path = export_path(kind, file_format)
+	try:
+		# Запись идёт в отдельном потоке, чтобы большие таблицы не блокировали бота
+		count = await asyncio.to_thread(exporter, db, path, file_format)
+	except Exception as e:
+		logger.error(f"{E.ERROR} Ошибка экспорта {kind}: {e}")
+		await message.answer(f"{E.ERROR} Ошибка экспорта: {e}")
+		return
+
+	caption = f"{E.SUCCESS} Выгружено строк: {count}\nФайл: {path}"
+	if os.path.getsize(path) <= MAX_EXPORT_SEND_SIZE:
+		await message.answer_document(FSInputFile(path), caption=caption)
+	else:
+		await message.answer(caption + "\nФайл больше 50 МБ, заберите его из каталога exports на сервере")
+
+
+# Резервная копия базы по запросу
+@router.message(Command("backup"))
+async def make_backup(message: types.Message):
+	if not db.is_admin(message.from_user.id):
+		return
+
+	if backup_manager.running:
+		await message.answer(f"{E.CLOCK} Резервная копия уже снимается, дождитесь её завершения")
+	else:
+		await message.answer(f"{E.CLOCK} Снимаю резервную копию, бот продолжает работать...")
+
+	try:
+		path = await backup_manager.backup()
+	except Exception as e:
+		logger.error(f"{E.ERROR} Ошибка резервного копирования: {e}")
+		await message.answer(f"{E.ERROR} Ошибка резервного копирования: {e}")
+		return
+
+	caption = f"{E.SUCCESS} Резервная копия: {path} ({os.path.getsize(path) // 1024} КБ)"
+	if os.path.getsize(path) <= MAX_EXPORT_SEND_SIZE:
+		await message.answer_document(FSInputFile(path), caption=caption)
+	else:
+		await message.answer(caption)
+
+
+# Опубликованные посты теста: правка и удаление сразу во всех каналах
+POSTS_PROGRESS_INTERVAL = 3
+# Параллельность и частота - те же настройки, что у процесса рассылки
+POST_ACTION_CONCURRENCY = int(os.getenv('DISPATCH_CONCURRENCY', 8))
+POST_ACTION_RATE = float(os.getenv('DISPATCH_RATE', 25))
+# Тесты, с постами которых сейчас идёт массовое действие
+_post_actions_running = set()
+
+
+@router.message(Command("posts"))
+async def show_posts(message: types.Message, db: Database = db):
+	if not db.is_admin(message.from_user.id):
+		return
+
+	try:
+		# /posts 2 - посты теста 2, /posts 2 5 - заменить их содержимым теста 5
+		args = message.text.split()[1:]
+		test_id = int(args[0])
+		source_id = int(args[1]) if len(args) > 1 else test_id
+	except (IndexError, ValueError):
+		await message.answer(
+			f"{E.ERROR} Используйте: /posts [ID_теста] [ID_нового_теста]\n"
+			"Пример: /posts 2 - обновить или удалить посты теста 2, /posts 2 5 - заменить их содержимым теста 5"
+		)
+		return
+
+	test = db.get_test(test_id)
+	if not test or (source_id != test_id and not db.get_test(source_id)):
+		await message.answer(f"{E.ERROR} Тест с ID {test_id if not test else source_id} не найден")
+		return
+
+	posts = db.get_published_posts(test_id)
+	if not posts:
+		await message.answer(f"{E.INFO} У теста '{test[1]}' нет опубликованных постов")
+		return
+
+	channels = len({post[1] for post in posts})
+	await message.answer(
+		f"{E.CHANNEL} Тест '{test[1]}' (ID: {test_id}): постов {len(posts)}, каналов {channels}",
+		reply_markup=get_posts_keyboard(test_id, source_id)
+	)
+
+
+async def _run_post_action(callback: types.CallbackQuery, db: Database, test_id: int, title: str, run,
+						   bulk_bots: dict = None):
+	"""
+	Запускает массовое действие с постами теста и показывает прогресс в сообщении.
+	Запросы идут через бота с пулом соединений рассылки (bulk_bots, HTTP_SPLIT_SESSIONS),
+	чтобы не занимать соединения, через которые бот отвечает на нажатия
+	"""
+	if test_id in _post_actions_running:
+		await callback.answer(f"{E.CLOCK} С постами этого теста уже идёт действие", show_alert=True)
+		return
+
+	# Отметка ставится до первого await и снимается в finally при любом исходе
+	_post_actions_running.add(test_id)
+	try:
+		await callback.answer()
+
+		posts = db.get_published_posts(test_id)
+		if not posts:
+			await callback.message.edit_text(f"{E.INFO} Опубликованных постов больше нет")
+			return
+
+		started = time.monotonic()
+		last_update = [started]
+
+		async def report_progress(result):
+			if time.monotonic() - last_update[0] < POSTS_PROGRESS_INTERVAL:
+				return
+			last_update[0] = time.monotonic()
+			try:
+				await callback.message.edit_text(f"{E.CLOCK} {title}: обработано {result.processed} из {result.total}")
+			except Exception as e:
+				logger.debug(f"Не удалось обновить прогресс: {e}")
+
+		await callback.message.edit_text(f"{E.CLOCK} {title}: постов {len(posts)}...")
+		bot = (bulk_bots or {}).get(callback.bot.id, callback.bot)
+		actions = PostActions(
+			bot, db, rate_limiter_for(callback.bot, POST_ACTION_RATE), concurrency=POST_ACTION_CONCURRENCY
+		)
+		result = await run(actions, posts, report_progress)
+	except Exception as e:
+		logger.error(f"{E.ERROR} Ошибка массового действия с постами теста {test_id}: {e}")
+		await callback.message.answer(f"{E.ERROR} {title} прервано: {e}")
+		return
+	finally:
+		_post_actions_running.discard(test_id)
+
+	text = (
+		f"{E.SUCCESS} {title}: завершено за {time.monotonic() - started:.0f} с\n"
+		f"Готово: {result.done} из {result.total}\n"
+	)
+	if result.skipped:
+		text += f"Пропущено (содержимое не изменилось или другой тип поста): {result.skipped}\n"
+	if result.missing:
+		text += f"Уже удалены в канале: {result.missing}\n"
+	if result.failed:
+		text += f"\n{E.ERROR} Ошибок: {result.failed}\n" + "\n".join(result.errors)
+	await callback.message.edit_text(text[:4000])
+
+
+@router.callback_query(F.data.startswith("posts_edit_"))
+async def edit_posts(callback: types.CallbackQuery, db: Database = db, bulk_bots: dict = None):
+	if not db.is_admin(callback.from_user.id):
+		await callback.answer()
+		return
+
+	_, _, test_id, source_id = callback.data.split('_')
+	version = test_versions.current(db, int(source_id))
+	if not version:
+		await callback.answer(f"{E.ERROR} Тест {source_id} не найден", show_alert=True)
+		return
+
+	await _run_post_action(
+		callback, db, int(test_id), "Правка постов",
+		lambda actions, posts, progress: actions.edit(posts, int(source_id), version, progress),
+		bulk_bots
+	)
+
+
+@router.callback_query(F.data.startswith("posts_delete_"))
+async def confirm_posts_deletion(callback: types.CallbackQuery, db: Database = db):
+	if not db.is_admin(callback.from_user.id):
+		await callback.answer()
+		return
+
+	test_id = int(callback.data.split('_')[-1])
+	await callback.message.edit_text(
+		f"{E.WARNING} Удалить все посты теста {test_id} во всех каналах? Это действие нельзя отменить",
+		reply_markup=get_posts_delete_confirmation_keyboard(test_id)
+	)
+	await callback.answer()
+
+
+@router.callback_query(F.data.startswith("posts_confirm_delete_"))
+async def delete_posts(callback: types.CallbackQuery, db: Database = db, bulk_bots: dict = None):
+	if not db.is_admin(callback.from_user.id):
+		await callback.answer()
+		return
+
+	await _run_post_action(
+		callback, db, int(callback.data.split('_')[-1]), "Удаление постов",
+		lambda actions, posts, progress: actions.delete(posts, progress),
+		bulk_bots
+	)
+
+
+@router.callback_query(F.data == "posts_cancel")
+async def cancel_posts_action(callback: types.CallbackQuery):
+	await callback.message.edit_text(f"{E.CANCEL} Действие с постами отменено")
+	await callback.answer()
@@ -1,109 +1,186 @@
-import json
 import logging
+from datetime import datetime
+from typing import Optional
 
+import aiohttp
+import pytz
 from aiogram import Router, F, types
+from aiogram.exceptions import TelegramNetworkError
 from aiogram.filters import Command
 
-from utils.database import Database
+from utils.database import Database, PUBLISHED_POST_INSERT_SQL
+from utils.channels import channel_registry
+from utils.circuit_breaker import channel_breaker
+from utils.test_versions import test_versions, TestVersion
 from keyboards.keyboards import get_test_options_keyboard
 from utils.emoji import Emoji as E
+from utils.setup_logging import LogSummary
 
 logger = logging.getLogger(__name__)
 
 router = Router()
+# Тесты и расписания обработчики берут из базы своего бота (аргумент db, DatabaseMiddleware),
+# эта база - для общих данных и для запуска без нескольких ботов
 db = Database()
 
+# Вместо INFO на каждый клик раз в минуту пишем сводку
+answers_summary = LogSummary(logger, f"{E.TEST} Ответов на тесты")
 
-# Отправка теста в канал
-async def send_test_to_channel(test_id, channel_id, bot):
-	test = db.get_test(test_id)
-	if not test:
+
+def render_post(version: TestVersion):
+	"""Текст (или подпись к фото) и клавиатура поста с версией теста"""
+	if version.content_type == 'photo':
+		text = f"{E.PUZZLE} {version.title}\n\n{version.question_text}"
+	else:
+		text = f"{E.PUZZLE} {version.title}\n\n{version.text_content}\n\n{version.question_text}"
+	keyboard = get_test_options_keyboard([option_text for option_text, _ in version.options], version.id)
+	return text, keyboard
+
+
+# Отправка теста в канал; db - база бота, которому принадлежит тест.
+# Опубликованный пост записывается в published_posts (через batcher, если он передан)
+# Ошибки соединения: ответа Telegram нет, опубликован ли пост - неизвестно
+UNKNOWN_OUTCOME_ERRORS = (TelegramNetworkError, aiohttp.ClientError)
+
+
+async def send_test_to_channel(test_id, channel_id, bot, db: Database = db, batcher=None):
+	# Отправляем по числовому id из кэша каналов, без разрешения username в Telegram
+	channel_id = channel_registry.chat_id_for(channel_id)
+
+	# Пост публикуется с текущей версией теста, кнопки ссылаются на неё
+	version = test_versions.current(db, test_id)
+	if not version:
 		logger.error(f"{E.ERROR} Тест {test_id} не найден для отправки в канал {channel_id}")
 		return False
 
-	test_data = {
-		'id': test[0],
-		'title': test[1],
-		'content_type': test[2],
-		'text_content': test[3],
-		'photo_file_id': test[4],
-		'question_text': test[5],
-		'options': json.loads(test[6])
-	}
+	text, keyboard = render_post(version)
+	# Предохранитель у каждого бота свой: бота могли удалить из канала, а другой в нём остался
+	breaker_key = (db.bot_id, channel_id)
 
-	# Передаем test_id в клавиатуру для нового формата callback_data
-	keyboard = get_test_options_keyboard(test_data['options'], test_data['id'])
+	# Канал отключён предохранителем - не тратим на него лимиты запросов.
+	# Проверка - последней перед запросом: пропущенная проба всегда получает результат ниже
+	if not channel_breaker.allow(breaker_key):
+		logger.debug(f"{E.STOPPED} Канал {channel_id} отключён, тест {test_id} не отправлен")
+		return False
 
 	try:
-		if test_data['content_type'] == 'text':
-			await bot.send_message(
-				chat_id=channel_id,
-				text=f"{E.PUZZLE} {test_data['title']}\n\n{test_data['text_content']}\n\n{test_data['question_text']}",
-				reply_markup=keyboard
-			)
-		elif test_data['content_type'] == 'photo':
-			await bot.send_photo(
-				chat_id=channel_id,
-				photo=test_data['photo_file_id'],
-				caption=f"{E.PUZZLE} {test_data['title']}\n\n{test_data['question_text']}",
-				reply_markup=keyboard
-			)
-		elif test_data['content_type'] == 'both':
-			await bot.send_photo(
+		if version.content_type == 'text':
+			message = await bot.send_message(chat_id=channel_id, text=text, reply_markup=keyboard)
+		else:
+			message = await bot.send_photo(
 				chat_id=channel_id,
-				photo=test_data['photo_file_id'],
-				caption=f"{E.PUZZLE} {test_data['title']}\n\n{test_data['text_content']}\n\n{test_data['question_text']}",
+				photo=version.photo_file_id,
+				caption=text,
 				reply_markup=keyboard
 			)
-		return True
+		channel_breaker.record_success(breaker_key)
 	except Exception as e:
 		logger.error(f"{E.ERROR} Ошибка отправки теста {test_id} в {channel_id}: {e}")
+		if isinstance(e, UNKNOWN_OUTCOME_ERRORS):
+			# Запрос мог дойти до Telegram: повтор может опубликовать пост второй раз,
+			# поэтому решение остаётся вызывающему
+			channel_breaker.record_failure(breaker_key, e)
+			raise
+		if channel_breaker.record_failure(breaker_key, e):
+			await notify_admins(
+				bot,
+				f"{E.STOPPED} Отправка в канал {channel_registry.display_name_for(channel_id)} приостановлена: {e}\n"
+				f"Проверьте, что бот остаётся администратором канала. "
+				f"Пробная отправка будет через {int(channel_breaker.cooldown // 60)} мин."
+			)
 		return False
 
+	# Пост уже опубликован: ошибка записи не должна приводить к повторной отправке
+	try:
+		published_at = datetime.now(pytz.utc)
+		if batcher is not None:
+			batcher.add(PUBLISHED_POST_INSERT_SQL, (
+				db.bot_id, int(test_id), version.id, message.chat.id, message.message_id,
+				version.content_type, published_at.isoformat(timespec='seconds')
+			))
+		else:
+			db.add_published_post(
+				test_id, version.id, message.chat.id, message.message_id, version.content_type, published_at
+			)
+	except Exception as e:
+		logger.error(f"{E.ERROR} Не удалось записать пост теста {test_id} в {channel_id}: {e}")
+	return True
+
+
+def result_alert(result_text: str) -> str:
+	"""Текст всплывающего окна с результатом варианта"""
+	if result_text and result_text.strip():
+		return result_text[:200]
+	return f"{E.INFO} Для этого варианта результат пока не настроен"
+
 
-# Обработчик нажатий на варианты ответов (ТОЛЬКО НОВЫЙ ФОРМАТ)
-@router.callback_query(F.data.startswith("test_"))
-async def handle_test_answer(callback: types.CallbackQuery):
+def cached_answer(callback: types.CallbackQuery) -> Optional[str]:
+	"""
+	Ответ на нажатие по уже загруженной версии теста, без обращения к базе
+	(для отсечённых CallbackThrottleMiddleware повторных нажатий)
+	"""
+	parts = (callback.data or '').split('_')
+	if len(parts) != 3 or parts[0] != "tv" or not parts[2].isdigit():
+		return None
+	version = test_versions.peek(parts[1])
+	option = version.option(int(parts[2])) if version else None
+	return result_alert(option[1]) if option else None
+
+
+async def notify_admins(bot, text: str):
+	for admin_id in db.get_admin_ids():
+		try:
+			await bot.send_message(chat_id=admin_id, text=text)
+		except Exception as e:
+			logger.info(f"{E.ERROR} Не удалось отправить уведомление администратору {admin_id}: {e}")
+
+
+# Обработчик нажатий на варианты ответов
+@router.callback_query(F.data.startswith("tv_") | F.data.startswith("test_"))
+async def handle_test_answer(callback: types.CallbackQuery, db: Database = db):
 	try:
-		# Формат: test_ТЕСТ_ID_option_ВАРИАНТ_ТЕКСТ
-		parts = callback.data.split('_', 3)  # test, ID, option, ТЕКСТ
-		logger.info(f"📨 Получен callback_data: {callback.data}")
-		logger.info(f"🔍 Разделенные части: {parts}")
+		debug = logger.isEnabledFor(logging.DEBUG)
+		if callback.data.startswith("tv_"):
+			# Формат: tv_ВЕРСИЯ_НОМЕР-ВАРИАНТА
+			parts = callback.data.split('_')
+			valid = len(parts) == 3 and parts[2].isdigit()
+		else:
+			# Посты, опубликованные до версий: test_ТЕСТ_ID_option_ВАРИАНТ_ТЕКСТ
+			parts = callback.data.split('_', 3)  # test, ID, option, ТЕКСТ
+			valid = len(parts) == 4 and parts[0] == "test" and parts[2] == "option"
+		if debug:
+			logger.debug(f"📨 Получен callback_data: {callback.data}, части: {parts}")
 
-		if len(parts) != 4 or parts[0] != "test" or parts[2] != "option":
+		if not valid:
 			logger.error(f"{E.ERROR} Неверный формат: {callback.data}")
+			answers_summary.add('bad_format')
 			await callback.answer(f"{E.ERROR} Ошибка данных", show_alert=True)
 			return
 
-		test_id = int(parts[1])
-		option_text = parts[3]
-
-		logger.info(f"🔍 Поиск: test_id={test_id}, option_text='{option_text}'")
+		# Версия из кнопки неизменяема и берётся из общего кэша без обращения к базе;
+		# для старых кнопок - текущая версия теста
+		if parts[0] == "tv":
+			version = test_versions.get(parts[1])
+			option = version.option(int(parts[2])) if version else None
+		else:
+			version = test_versions.current(db, int(parts[1]))
+			option = next((pair for pair in version.options if pair[0] == parts[3]), None) if version else None
 
-		# Ищем ТОЛЬКО в указанном тесте
-		test = db.get_test(test_id)
-		if not test:
-			logger.error(f"{E.ERROR} Тест {test_id} не найден")
+		if not version:
+			logger.error(f"{E.ERROR} Тест {parts[1]} не найден")
+			answers_summary.add('no_test')
 			await callback.answer(f"{E.ERROR} Тест не найден", show_alert=True)
 			return
 
-		options = json.loads(test[6])
-		logger.info(f"🔍 Варианты в тесте {test_id}: {list(options.keys())}")
-
-		if option_text in options:
-			result_text = options[option_text]
-			logger.info(f"✅ Найден результат: '{result_text}'")
-
-			if result_text and result_text.strip():
-				alert_text = result_text[:200]
-				await callback.answer(alert_text, show_alert=True)
-			else:
-				await callback.answer(
-					f"{E.INFO} Для этого варианта результат пока не настроен",
-					show_alert=True
-				)
+		if option:
+			option_text, result_text = option
+			if debug:
+				logger.debug(f"✅ Версия {version.id}, вариант '{option_text}': '{result_text}'")
+			answers_summary.add('ok')
+			await callback.answer(result_alert(result_text), show_alert=True)
 		else:
-			logger.warning(f"{E.WARNING} Вариант '{option_text}' не найден в тесте {test_id}")
+			logger.warning(f"{E.WARNING} Вариант {parts[-1]!r} не найден в версии {version.id}")
+			answers_summary.add('no_option')
 			await callback.answer(f"{E.ERROR} Вариант ответа не найден", show_alert=True)
 
 	except Exception as e:
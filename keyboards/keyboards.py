@@ -65,7 +65,8 @@ def get_tests_list_keyboard(tests, action="select"):
 	return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_schedules_list_keyboard(schedules):
+def get_schedules_list_keyboard(schedules, page=0, pages=1):
+	"""Расписания страницы page для удаления; при нескольких страницах - кнопки перехода"""
 	buttons = []
 	for schedule_id, test_title, channel_id, scheduled_time in schedules:
 		from datetime import datetime
@@ -82,16 +83,25 @@ def get_schedules_list_keyboard(schedules):
 		buttons.append(
 			[InlineKeyboardButton(text=f"{E.DELETE} {button_text}", callback_data=f"delete_schedule_{schedule_id}")])
 
+	if pages > 1:
+		navigation = []
+		if page > 0:
+			navigation.append(InlineKeyboardButton(text=f"{E.PREV} {page}", callback_data=f"schedules_page_{page - 1}"))
+		if page < pages - 1:
+			navigation.append(InlineKeyboardButton(text=f"{page + 2} {E.NEXT}", callback_data=f"schedules_page_{page + 1}"))
+		buttons.append(navigation)
+
 	return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_test_options_keyboard(options, test_id):
-	"""Создает клавиатуру с вариантами ответов для теста"""
+def get_test_options_keyboard(options, version_id):
+	"""Создает клавиатуру с вариантами ответов для версии теста (options - тексты вариантов по порядку)"""
 	buttons = []
-	for option_text in options.keys():
+	for index, option_text in enumerate(options):
 		button_text = option_text[:30] + "..." if len(option_text) > 30 else option_text
-		# Новый формат: test_ТЕСТ_ID_option_ВАРИАНТ
-		callback_data = f"test_{test_id}_option_{option_text}"
+		# Формат: tv_ВЕРСИЯ_НОМЕР-ВАРИАНТА - не длиннее 64 байт при любом тексте варианта.
+		# Старый формат test_ТЕСТ_ID_option_ВАРИАНТ остаётся у уже опубликованных постов
+		callback_data = f"tv_{version_id}_{index}"
 
 		buttons.append([InlineKeyboardButton(
 			text=button_text,
@@ -123,4 +133,25 @@ def get_confirmation_keyboard(action="delete"):
 				[InlineKeyboardButton(text=f"{E.CONFIRM} Да, удалить", callback_data="confirm_delete")],
 				[InlineKeyboardButton(text=f"{E.CANCEL} Нет, отмена", callback_data="cancel_delete")]
 			]
-		)
\ No newline at end of file
+		)
+
+
+def get_posts_keyboard(test_id, source_id):
+	"""Действия с опубликованными постами теста test_id (правка - по текущей версии теста source_id)"""
+	edit_text = f"{E.EDIT} Обновить посты" if source_id == test_id else f"{E.EDIT} Заменить на тест {source_id}"
+	return InlineKeyboardMarkup(
+		inline_keyboard=[
+			[InlineKeyboardButton(text=edit_text, callback_data=f"posts_edit_{test_id}_{source_id}")],
+			[InlineKeyboardButton(text=f"{E.DELETE} Удалить посты", callback_data=f"posts_delete_{test_id}")]
+		]
+	)
+
+
+def get_posts_delete_confirmation_keyboard(test_id):
+	return InlineKeyboardMarkup(
+		inline_keyboard=[
+			[InlineKeyboardButton(text=f"{E.CONFIRM} Да, удалить во всех каналах",
+								  callback_data=f"posts_confirm_delete_{test_id}")],
+			[InlineKeyboardButton(text=f"{E.CANCEL} Нет, отмена", callback_data="posts_cancel")]
+		]
+	)
@@ -0,0 +1,30 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from utils.database import Database
+
+
+class DatabaseMiddleware(BaseMiddleware):
+	"""
+	Передаёт обработчикам базу бота, получившего апдейт (аргумент db)
+	Роутеры общие для всех ботов процесса, а тесты и расписания у каждого свои
+	"""
+
+	def __init__(self, db: Database):
+		self.db = db
+		self._partitions: Dict[int, Database] = {}
+
+	async def __call__(
+		self,
+		handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+		event: TelegramObject,
+		data: Dict[str, Any]
+	) -> Any:
+		bot_id = data['bot'].id
+		partition = self._partitions.get(bot_id)
+		if partition is None:
+			partition = self._partitions[bot_id] = self.db.for_bot(bot_id)
+		data['db'] = partition
+		return await handler(event, data)
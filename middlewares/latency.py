@@ -0,0 +1,54 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+from utils.metrics import metrics
+
+
+class HandlerLatencyMiddleware(BaseMiddleware):
+	"""
+	Замеряет время работы каждого обработчика (handle_test_answer, process_time и т.д.)
+	Регистрируется как inner middleware, поэтому к этому моменту обработчик уже выбран
+	"""
+
+	def __init__(self, registry=metrics):
+		self.registry = registry
+
+	async def __call__(
+		self,
+		handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+		event: TelegramObject,
+		data: Dict[str, Any]
+	) -> Any:
+		handler_object = data.get('handler')
+		name = handler_object.callback.__name__ if handler_object else type(event).__name__
+
+		started = time.perf_counter()
+		try:
+			result = await handler(event, data)
+		except Exception:
+			self.registry.observe('handler', name, time.perf_counter() - started, error=True)
+			raise
+		self.registry.observe('handler', name, time.perf_counter() - started)
+		return result
+
+
+class RequestLatencyMiddleware(BaseRequestMiddleware):
+	"""Замеряет время и ошибки каждого запроса к Telegram API (sendMessage, sendPhoto и т.д.)"""
+
+	def __init__(self, registry=metrics):
+		self.registry = registry
+
+	async def __call__(self, make_request, bot, method):
+		name = method.__api_method__
+		started = time.perf_counter()
+		try:
+			response = await make_request(bot, method)
+		except Exception:
+			self.registry.observe('api', name, time.perf_counter() - started, error=True)
+			raise
+		self.registry.observe('api', name, time.perf_counter() - started)
+		return response
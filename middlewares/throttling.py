@@ -0,0 +1,119 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+from utils.metrics import metrics, MetricsRegistry
+
+
+class _Window:
+	"""Счётчики пользователя: нажатия в текущем и предыдущем окне"""
+
+	__slots__ = ('started', 'previous', 'current', 'answered', 'last_seen')
+
+	def __init__(self, now: float):
+		self.started = now
+		self.previous = 0
+		self.current = 0
+		# Окно, в котором пользователю уже отвечали из кэша
+		self.answered = None
+		self.last_seen = now
+
+
+class CallbackThrottleMiddleware(BaseMiddleware):
+	"""
+	Отсекает лишние нажатия на кнопки одного пользователя
+
+	Скользящее окно оценивается по двум соседним фиксированным: на пользователя
+	хранятся два счётчика, проверка - O(1). Пользователей не больше max_users
+	(давно не нажимавшие вытесняются первыми), раз в окно удаляются те, кто
+	не нажимал дольше двух окон
+
+	Нажатие сверх limit за window секунд не доходит до обработчика: если
+	cached_answer знает ответ без обращения к базе, он отправляется (не чаще
+	раза за окно), иначе нажатие отбрасывается. Счётчики callbacks_shed
+	(answered / dropped) и гейдж throttle_users - в метриках
+	"""
+
+	def __init__(self, limit: int = 5, window: float = 2.0, max_users: int = 10000,
+				 cached_answer: Optional[Callable[[CallbackQuery], Optional[str]]] = None,
+				 clock: Callable[[], float] = time.monotonic, registry: MetricsRegistry = metrics):
+		self.limit = limit
+		self.window = window
+		self.max_users = max_users
+		self.cached_answer = cached_answer
+		self.clock = clock
+		self.registry = registry
+		self._windows: 'OrderedDict[int, _Window]' = OrderedDict()
+		self._next_eviction = clock() + window
+
+	def __len__(self):
+		return len(self._windows)
+
+	def allow(self, user_id: int) -> bool:
+		now = self.clock()
+		if now >= self._next_eviction:
+			self._evict_idle(now)
+
+		state = self._windows.get(user_id)
+		if state is None:
+			state = self._windows[user_id] = _Window(now)
+			if len(self._windows) > self.max_users:
+				self._windows.popitem(last=False)
+		else:
+			self._windows.move_to_end(user_id)
+			state.last_seen = now
+
+		elapsed = now - state.started
+		if elapsed >= self.window:
+			# Начинается новое окно; если пауза была дольше окна, предыдущее пустое
+			windows = int(elapsed // self.window)
+			state.previous = state.current if windows == 1 else 0
+			state.current = 0
+			state.started += windows * self.window
+			elapsed -= windows * self.window
+
+		# Доля предыдущего окна, ещё попадающая в скользящее
+		estimate = state.previous * (1 - elapsed / self.window) + state.current
+		if estimate >= self.limit:
+			return False
+		state.current += 1
+		return True
+
+	def _evict_idle(self, now: float):
+		# Порядок словаря - порядок последних нажатий, поэтому бездействующие в начале
+		idle_before = now - 2 * self.window
+		while self._windows:
+			user_id, state = next(iter(self._windows.items()))
+			if state.last_seen >= idle_before:
+				break
+			del self._windows[user_id]
+		self._next_eviction = now + self.window
+
+	def _take_answer(self, user_id: int) -> bool:
+		"""Можно ли ответить пользователю из кэша в текущем окне"""
+		state = self._windows.get(user_id)
+		if state is None or state.answered == state.started:
+			return False
+		state.answered = state.started
+		return True
+
+	async def __call__(
+		self,
+		handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+		event: CallbackQuery,
+		data: Dict[str, Any]
+	) -> Any:
+		user_id = event.from_user.id
+		if self.allow(user_id):
+			return await handler(event, data)
+
+		text = self.cached_answer(event) if self.cached_answer else None
+		if text is not None and self._take_answer(user_id):
+			self.registry.inc('callbacks_shed', 'answered')
+			await event.answer(text, show_alert=True)
+		else:
+			self.registry.inc('callbacks_shed', 'dropped')
+		return None
@@ -19,4 +19,7 @@ class TestDeletion(StatesGroup):
 
 class ScheduleDeletion(StatesGroup):
     waiting_for_schedule_selection = State()
-    waiting_for_confirmation = State()
\ No newline at end of file
+    waiting_for_confirmation = State()
+
+class DataImport(StatesGroup):
+    waiting_for_document = State()
\ No newline at end of file
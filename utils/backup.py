@@ -0,0 +1,124 @@
+import os
+import gzip
+import time
+import shutil
+import sqlite3
+import asyncio
+import logging
+from datetime import datetime
+from typing import List
+
+from utils.emoji import Emoji as E
+from utils.test_io import EXPORTS_DIR
+
+logger = logging.getLogger(__name__)
+
+BACKUP_PREFIX = 'backup_'
+BACKUP_SUFFIX = '.db.gz'
+
+
+class BackupManager:
+	"""
+	Резервные копии базы без остановки бота
+
+	Копия снимается через sqlite3.Connection.backup. В режиме WAL (бот включает
+	его при запуске) база копируется за один шаг: читатель видит снимок на момент
+	начала и не мешает писателям, а их запись не прерывает копирование. В режиме
+	журнала отката копирование идёт по pages страниц за шаг с паузой между шагами,
+	чтобы не блокировать запись надолго. Снимок сжимается gzip и кладётся в exports/
+	с меткой времени; хранятся последние keep снимков. Копирование идёт в отдельном
+	потоке, цикл событий при этом не останавливается даже на многогигабайтной базе
+	"""
+
+	def __init__(self, db_path: str = 'tests.db', directory: str = EXPORTS_DIR, keep: int = 7,
+				 pages: int = 256, step_pause: float = 0.01):
+		self.db_path = db_path
+		self.directory = directory
+		self.keep = keep
+		self.pages = pages
+		self.step_pause = step_pause
+		self._lock = asyncio.Lock()
+
+	@classmethod
+	def from_env(cls):
+		return cls(
+			keep=int(os.getenv('BACKUP_KEEP', 7)),
+			pages=int(os.getenv('BACKUP_PAGES', 256)),
+		)
+
+	@property
+	def running(self) -> bool:
+		return self._lock.locked()
+
+	def _copy(self, target: str):
+		source = sqlite3.connect(self.db_path)
+		destination = sqlite3.connect(target)
+
+		def progress(status, remaining, total):
+			# Между шагами отдаём базу писателям
+			time.sleep(self.step_pause)
+
+		try:
+			if source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+				source.backup(destination)
+			else:
+				source.backup(destination, pages=self.pages, progress=progress)
+		finally:
+			destination.close()
+			source.close()
+
+	def _backup(self) -> str:
+		os.makedirs(self.directory, exist_ok=True)
+		timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+		path = os.path.join(self.directory, f"{BACKUP_PREFIX}{timestamp}{BACKUP_SUFFIX}")
+		raw_path = path + '.part.db'
+		partial_path = path + '.part'
+		try:
+			self._copy(raw_path)
+			with open(raw_path, 'rb') as src, gzip.open(partial_path, 'wb', compresslevel=6) as dst:
+				shutil.copyfileobj(src, dst, 1024 * 1024)
+			os.replace(partial_path, path)
+		finally:
+			for leftover in (raw_path, partial_path):
+				if os.path.exists(leftover):
+					os.remove(leftover)
+		self._rotate()
+		return path
+
+	def list_backups(self) -> List[str]:
+		if not os.path.isdir(self.directory):
+			return []
+		names = sorted(
+			name for name in os.listdir(self.directory)
+			if name.startswith(BACKUP_PREFIX) and name.endswith(BACKUP_SUFFIX)
+		)
+		return [os.path.join(self.directory, name) for name in names]
+
+	def _rotate(self):
+		backups = self.list_backups()
+		for path in backups[:max(0, len(backups) - self.keep)]:
+			os.remove(path)
+			logger.info(f"{E.DELETE} Удалена старая резервная копия {path}")
+
+	async def backup(self) -> str:
+		"""Снимает резервную копию; параллельные вызовы ждут завершения текущей"""
+		async with self._lock:
+			started = time.monotonic()
+			path = await asyncio.to_thread(self._backup)
+			logger.info(
+				f"{E.SUCCESS} Резервная копия {path} ({os.path.getsize(path) // 1024} КБ) "
+				f"за {time.monotonic() - started:.1f} с"
+			)
+			return path
+
+	async def start(self, interval: float):
+		while True:
+			await asyncio.sleep(interval)
+			try:
+				await self.backup()
+			except Exception as e:
+				logger.error(f"{E.ERROR} Ошибка резервного копирования: {e}")
+
+
+# Общий менеджер резервных копий процесса
+backup_manager = BackupManager.from_env()
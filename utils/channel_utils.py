@@ -4,6 +4,17 @@ from utils.emoji import Emoji as E
 
 logger = logging.getLogger(__name__)
 
+# Паттерны для распознавания ссылок (компилируются один раз при импорте)
+CHANNEL_LINK_PATTERNS = [
+	re.compile(r'https?://(?:www\.)?t\.me/([a-zA-Z0-9_]+)(?:/.*)?$'),  # https://t.me/channel_name
+	re.compile(r'https?://(?:www\.)?telegram\.me/([a-zA-Z0-9_]+)(?:/.*)?$'),  # https://telegram.me/channel_name
+	re.compile(r't\.me/([a-zA-Z0-9_]+)(?:/.*)?$'),  # t.me/channel_name
+	re.compile(r'telegram\.me/([a-zA-Z0-9_]+)(?:/.*)?$'),  # telegram.me/channel_name
+]
+USERNAME_RE = re.compile(r'^[a-zA-Z0-9_]+$')
+# Разделители в списке каналов: перевод строки, запятая, точка с запятой, пробелы
+CHANNEL_LIST_SEPARATOR_RE = re.compile(r'[\s,;]+')
+
 def parse_channel_input(channel_input: str) -> str:
 	"""
 	Преобразует различные форматы ссылок на каналы в @username или ID
@@ -35,16 +46,8 @@ def parse_channel_input(channel_input: str) -> str:
 	if channel_input.startswith('-100') and channel_input[4:].isdigit():
 		return channel_input
 
-	# Паттерны для распознавания ссылок
-	patterns = [
-		r'https?://(?:www\.)?t\.me/([a-zA-Z0-9_]+)(?:/.*)?$',  # https://t.me/channel_name
-		r'https?://(?:www\.)?telegram\.me/([a-zA-Z0-9_]+)(?:/.*)?$',  # https://telegram.me/channel_name
-		r't\.me/([a-zA-Z0-9_]+)(?:/.*)?$',  # t.me/channel_name
-		r'telegram\.me/([a-zA-Z0-9_]+)(?:/.*)?$',  # telegram.me/channel_name
-	]
-
-	for pattern in patterns:
-		match = re.search(pattern, channel_input)
+	for pattern in CHANNEL_LINK_PATTERNS:
+		match = pattern.search(channel_input)
 		if match:
 			username = match.group(1)
 			if is_valid_username(username):
@@ -66,8 +69,38 @@ def is_valid_username(username: str) -> bool:
 
 	# Telegram usernames can contain a-z, 0-9, and underscores
 	# Must start with a letter (but in reality can start with numbers too)
-	pattern = r'^[a-zA-Z0-9_]+$'
-	return bool(re.match(pattern, username))
+	return bool(USERNAME_RE.match(username))
+
+
+def is_recognized_channel(parsed: str) -> bool:
+	"""Результат parse_channel_input похож на канал (@username или числовой ID)"""
+	if parsed.startswith('@'):
+		return is_valid_username(parsed[1:])
+	return parsed.startswith('-100') and parsed[4:].isdigit()
+
+
+def parse_channel_list(text: str) -> tuple:
+	"""
+	Разбирает список каналов (по одному в строке, через запятую или пробел)
+	за один проход
+
+	Возвращает: (список распознанных каналов без повторов, список нераспознанных строк)
+	"""
+	channels = []
+	invalid = []
+	seen = set()
+	for item in CHANNEL_LIST_SEPARATOR_RE.split(text or ''):
+		if not item:
+			continue
+		parsed = parse_channel_input(item)
+		if not is_recognized_channel(parsed):
+			invalid.append(item)
+			continue
+		key = parsed.lower()
+		if key not in seen:
+			seen.add(key)
+			channels.append(parsed)
+	return channels, invalid
 
 
 def extract_channel_info(channel_input: str) -> dict:
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Union
+
+import pytz
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.types import ChatMemberAdministrator, ChatMemberOwner
+
+from utils.channel_utils import parse_channel_input
+from utils.database import Database
+from utils.emoji import Emoji as E
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChannelInfo:
+	chat_id: int
+	username: Optional[str]
+	title: Optional[str]
+	can_post: bool
+	last_checked: datetime
+	# Бот, от имени которого проверялись права
+	bot_id: int = 0
+
+	@property
+	def display_name(self) -> str:
+		name = self.title or str(self.chat_id)
+		return f"{name} (@{self.username})" if self.username else name
+
+
+class ChannelNotFound(Exception):
+	pass
+
+
+class ChannelRateLimited(ChannelNotFound):
+	"""Telegram ограничил частоту запросов (429): канал не проверен, можно повторить позже"""
+
+	def __init__(self, retry_after: int):
+		super().__init__(f"Слишком много запросов, повторите через {retry_after} с")
+		self.retry_after = retry_after
+
+
+class ChannelRegistry:
+	"""
+	Кэш каналов: числовой chat_id, username, название и права бота
+
+	Канал разрешается через get_chat один раз при планировании, дальше
+	отправка идёт по числовому id без разрешения username на стороне Telegram.
+	Переименованный канал продолжает работать, а устаревшие записи
+	периодически перепроверяются фоновой задачей тем же ботом, который
+	проверял канал в прошлый раз. Кэш общий для всех ботов процесса.
+	"""
+
+	def __init__(self, db: Database):
+		self.db = db
+		self._by_id: Dict[int, ChannelInfo] = {}
+		self._by_username: Dict[str, int] = {}
+		self._loaded = False
+
+	def _ensure_loaded(self):
+		if self._loaded:
+			return
+		for chat_id, username, title, can_post, last_checked, bot_id in self.db.get_all_channels():
+			self._remember(ChannelInfo(
+				chat_id, username, title, bool(can_post),
+				datetime.fromisoformat(last_checked), bot_id
+			))
+		self._loaded = True
+
+	def _remember(self, info: ChannelInfo):
+		previous = self._by_id.get(info.chat_id)
+		if previous and previous.username:
+			self._by_username.pop(previous.username.lower(), None)
+		self._by_id[info.chat_id] = info
+		if info.username:
+			self._by_username[info.username.lower()] = info.chat_id
+
+	def get(self, chat_id: int) -> Optional[ChannelInfo]:
+		self._ensure_loaded()
+		return self._by_id.get(int(chat_id))
+
+	def chat_id_for(self, channel_id: Union[str, int]) -> Union[str, int]:
+		"""
+		Возвращает числовой id для отправки. Для старых расписаний с @username
+		берётся id из кэша; если канал ещё не разрешался, username остаётся как есть
+		"""
+		if isinstance(channel_id, int):
+			return channel_id
+		if channel_id.startswith('@'):
+			self._ensure_loaded()
+			return self._by_username.get(channel_id[1:].lower(), channel_id)
+		if channel_id.lstrip('-').isdigit():
+			return int(channel_id)
+		return channel_id
+
+	def display_name_for(self, channel_id: Union[str, int]) -> str:
+		"""Название канала для админки; для неизвестного канала - сам channel_id"""
+		chat_id = self.chat_id_for(channel_id)
+		info = self.get(chat_id) if isinstance(chat_id, int) else None
+		return info.display_name if info else str(channel_id)
+
+	@staticmethod
+	async def _fetch(bot, chat_ref: Union[str, int]) -> ChannelInfo:
+		try:
+			chat = await bot.get_chat(chat_ref)
+		except TelegramRetryAfter:
+			raise
+		except TelegramAPIError as e:
+			raise ChannelNotFound(str(e)) from e
+
+		try:
+			member = await bot.get_chat_member(chat.id, bot.id)
+			can_post = isinstance(member, ChatMemberOwner) or (
+				isinstance(member, ChatMemberAdministrator) and member.can_post_messages is not False
+			)
+		except TelegramRetryAfter:
+			raise
+		except TelegramAPIError:
+			can_post = False
+
+		return ChannelInfo(chat.id, chat.username, chat.title, can_post, datetime.now(pytz.utc), bot.id)
+
+	async def resolve(self, bot, channel_input: str) -> ChannelInfo:
+		"""Разрешает ввод администратора (ссылка, @username, id) в канал и сохраняет его"""
+		info = await self._fetch(bot, self.chat_id_for(parse_channel_input(channel_input)))
+		self.save(info)
+		return info
+
+	async def resolve_many(self, bot, channel_refs: List[str], max_age: timedelta = timedelta(hours=1),
+						   concurrency: int = 5, retries: int = 2,
+						   max_retry_wait: float = 30) -> List[Tuple[str, Union[ChannelInfo, ChannelNotFound]]]:
+		"""
+		Разрешает список каналов для массового планирования. Недавно проверенные
+		каналы берутся из кэша без запроса к Telegram, остальные разрешаются
+		параллельно (не больше concurrency запросов одновременно). На 429 запрос
+		повторяется после паузы Telegram (до retries раз, если пауза не дольше
+		max_retry_wait секунд), иначе канал возвращается как ChannelRateLimited
+
+		Возвращает пары (ввод, ChannelInfo или ошибка ChannelNotFound) в исходном порядке
+		"""
+		semaphore = asyncio.Semaphore(concurrency)
+		fresh_after = datetime.now(pytz.utc) - max_age
+
+		async def resolve_one(channel_ref: str):
+			chat_id = self.chat_id_for(channel_ref)
+			cached = self.get(chat_id) if isinstance(chat_id, int) else None
+			if cached and cached.last_checked >= fresh_after:
+				return channel_ref, cached
+			async with semaphore:
+				for attempt in range(retries + 1):
+					try:
+						return channel_ref, await self.resolve(bot, channel_ref)
+					except ChannelNotFound as e:
+						return channel_ref, e
+					except TelegramRetryAfter as e:
+						if attempt == retries or e.retry_after > max_retry_wait:
+							return channel_ref, ChannelRateLimited(e.retry_after)
+						logger.warning(f"{E.CLOCK} Канал {channel_ref}: повтор через {e.retry_after} с")
+						await asyncio.sleep(e.retry_after)
+
+		return list(await asyncio.gather(*(resolve_one(ref) for ref in channel_refs)))
+
+	def save(self, info: ChannelInfo):
+		self._ensure_loaded()
+		self.db.save_channel(info.chat_id, info.username, info.title, info.can_post, info.last_checked, info.bot_id)
+		self._remember(info)
+
+	async def refresh_stale(self, bots: List, max_age: timedelta, batch_size: int = 20, pause: float = 1.0) -> int:
+		"""
+		Перепроверяет каналы, не проверявшиеся дольше max_age, пачками по batch_size.
+		Канал проверяет бот, который проверял его в прошлый раз; если этого бота
+		в процессе нет - первый из bots
+		"""
+		self._ensure_loaded()
+		bots_by_id = {bot.id: bot for bot in bots}
+		refreshed = 0
+		checked_before = datetime.now(pytz.utc) - max_age
+		seen = set()
+
+		while True:
+			# Канал, который уже проверяли в этом проходе, второй раз не трогаем
+			stale = [row for row in self.db.get_stale_channels(checked_before, batch_size) if row[0] not in seen]
+			if not stale:
+				break
+
+			for chat_id, username, title, _, _, bot_id in stale:
+				seen.add(chat_id)
+				bot = bots_by_id.get(bot_id, bots[0])
+				try:
+					info = await self._fetch(bot, chat_id)
+				except TelegramRetryAfter as e:
+					# Канал остаётся устаревшим и будет проверен в следующий проход
+					logger.warning(f"{E.CLOCK} Проверка каналов приостановлена на {e.retry_after} с")
+					await asyncio.sleep(e.retry_after)
+					continue
+				except ChannelNotFound as e:
+					logger.warning(f"{E.WARNING} Канал {title or username or chat_id} недоступен: {e}")
+					info = ChannelInfo(chat_id, username, title, False, datetime.now(pytz.utc), bot.id)
+
+				if not info.can_post:
+					logger.warning(f"{E.WARNING} Бот не может публиковать в канале {info.display_name}")
+				self.save(info)
+				refreshed += 1
+
+			await asyncio.sleep(pause)
+
+		if refreshed:
+			logger.info(f"{E.CHANNEL} Обновлено каналов: {refreshed}")
+		return refreshed
+
+	async def start_refresher(self, bots: List, max_age: timedelta, interval: float = 3600):
+		while True:
+			try:
+				await self.refresh_stale(bots, max_age)
+			except Exception as e:
+				logger.error(f"{E.ERROR} Ошибка обновления каналов: {e}")
+			await asyncio.sleep(interval)
+
+
+# Общий реестр каналов процесса
+channel_registry = ChannelRegistry(Database())
@@ -1,5 +1,11 @@
+import sys
+import json
 import sqlite3
 import logging
+import argparse
+from datetime import datetime
+
+from utils.db_profiler import profiler
 
 logger = logging.getLogger(__name__)
 
@@ -28,5 +34,55 @@ def check_database():
 	conn.close()
 
 
+def show_profile(report_path: str, limit: int = 20):
+	"""Выводит отчёт профилировщика SQLite (собирается ботом при DB_PROFILE=1)"""
+	try:
+		with open(report_path, encoding='utf-8') as f:
+			report = json.load(f)
+	except FileNotFoundError:
+		logger.info(f"❌ Отчёт {report_path} не найден. Запустите бота с DB_PROFILE=1")
+		return
+
+	saved_at = datetime.fromtimestamp(report['saved_at']).strftime('%d.%m.%Y %H:%M:%S')
+	logger.info(f"Отчёт профилировщика от {saved_at}, выборка {report['sample_rate']:g}")
+	logger.info(f"{'вызовов':>9} {'всего мс':>10} {'ср. мс':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'макс':>8}  запрос")
+	for row in report['statements'][:limit]:
+		logger.info(
+			f"{row['calls']:>9} {row['total_ms']:>10.1f} {row['avg_ms']:>8.3f} {row['p50_ms']:>8.3f} "
+			f"{row['p95_ms']:>8.3f} {row['p99_ms']:>8.3f} {row['max_ms']:>8.3f}  {row['sql']}"
+		)
+
+
+def vacuum_database(db_path: str = 'tests.db'):
+	"""
+	Переводит базу в режим auto_vacuum = INCREMENTAL и сжимает её полным VACUUM.
+	Блокирует базу на всё время работы, запускать при остановленном боте
+	"""
+	conn = sqlite3.connect(db_path)
+	size_before = conn.execute('PRAGMA page_count').fetchone()[0] * conn.execute('PRAGMA page_size').fetchone()[0]
+	conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+	conn.execute('VACUUM')
+	size_after = conn.execute('PRAGMA page_count').fetchone()[0] * conn.execute('PRAGMA page_size').fetchone()[0]
+	mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+	conn.close()
+	logger.info(f"✅ VACUUM выполнен: {size_before // 1024} КБ -> {size_after // 1024} КБ, auto_vacuum = {mode}")
+
+
 if __name__ == "__main__":
-	check_database()
\ No newline at end of file
+	logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+
+	parser = argparse.ArgumentParser(description="Проверка базы данных бота")
+	subparsers = parser.add_subparsers(dest='command')
+	subparsers.add_parser('check', help="Проверить таблицы и настройки (по умолчанию)")
+	profile_parser = subparsers.add_parser('profile', help="Показать отчёт профилировщика запросов")
+	profile_parser.add_argument('--report', default=profiler.report_path, help="Путь к отчёту")
+	profile_parser.add_argument('--limit', type=int, default=20, help="Сколько запросов показать")
+	subparsers.add_parser('vacuum', help="Включить incremental auto_vacuum и сжать базу (бот должен быть остановлен)")
+	args = parser.parse_args()
+
+	if args.command == 'profile':
+		show_profile(args.report, args.limit)
+	elif args.command == 'vacuum':
+		vacuum_database()
+	else:
+		check_database()
@@ -0,0 +1,168 @@
+import os
+import html
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+
+from utils.emoji import Emoji as E
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Ошибки, которые не пройдут сами: бота выгнали, канал удалён, нет прав на публикацию
+PERMANENT_ERROR_MARKERS = (
+	'chat not found',
+	'not enough rights',
+	'need administrator rights',
+	'chat_write_forbidden',
+	'bot was kicked',
+	'channel_private',
+	'peer_id_invalid',
+)
+
+
+def is_permanent_error(error: Exception) -> bool:
+	if isinstance(error, (TelegramForbiddenError, TelegramNotFound)):
+		return True
+	if isinstance(error, TelegramBadRequest):
+		message = str(error).lower()
+		return any(marker in message for marker in PERMANENT_ERROR_MARKERS)
+	return False
+
+
+@dataclass
+class Circuit:
+	state: str = CLOSED
+	failures: int = 0
+	opened_at: float = 0.0
+	probe_started: float = 0.0
+	last_error: str = ''
+	notified: bool = False
+
+
+class CircuitBreaker:
+	"""
+	Предохранитель по каналам
+
+	Ключ канала - пара (id бота, id чата): если одного бота удалили из канала,
+	отправки других ботов в этот канал продолжаются
+
+	После threshold подряд постоянных ошибок (бот удалён, канал не найден)
+	канал размыкается и отправки в него не делаются. Через cooldown секунд
+	пропускается одна пробная отправка (half-open): успех замыкает канал,
+	ошибка размыкает его снова. Временные ошибки (сеть, 429) не учитываются.
+	Проба без результата дольше cooldown (отправка не дошла до Telegram)
+	считается неудачной: канал снова размыкается и ждёт следующей пробы
+	"""
+
+	def __init__(self, threshold: int = 3, cooldown: float = 600):
+		self.threshold = threshold
+		self.cooldown = cooldown
+		self._circuits: Dict[Hashable, Circuit] = {}
+
+	@classmethod
+	def from_env(cls):
+		return cls(
+			threshold=int(os.getenv('BREAKER_THRESHOLD', 3)),
+			cooldown=float(os.getenv('BREAKER_COOLDOWN', 600)),
+		)
+
+	def _expire_probe(self, key: Hashable, circuit: Circuit, now: float):
+		if circuit.state == HALF_OPEN and now - circuit.probe_started >= self.cooldown:
+			logger.info(f"{E.WARNING} Пробная отправка в канал {key} не завершилась, канал снова отключён")
+			circuit.state = OPEN
+			circuit.opened_at = now
+
+	def is_open(self, key: Hashable) -> bool:
+		"""Канал разомкнут и время пробы ещё не пришло (отправку не начинаем)"""
+		circuit = self._circuits.get(key)
+		if circuit is None or circuit.state == CLOSED:
+			return False
+		now = time.monotonic()
+		self._expire_probe(key, circuit, now)
+		if circuit.state == HALF_OPEN:
+			return True
+		return now - circuit.opened_at < self.cooldown
+
+	def allow(self, key: Hashable) -> bool:
+		"""
+		Можно ли отправлять в канал; после cooldown пропускает одну пробную отправку.
+		Вызывается непосредственно перед запросом к Telegram: за пропуском пробы
+		должен последовать record_success или record_failure
+		"""
+		circuit = self._circuits.get(key)
+		if circuit is None or circuit.state == CLOSED:
+			return True
+		now = time.monotonic()
+		self._expire_probe(key, circuit, now)
+		if circuit.state == OPEN and now - circuit.opened_at >= self.cooldown:
+			circuit.state = HALF_OPEN
+			circuit.probe_started = now
+			logger.info(f"{E.INFO} Пробная отправка в канал {key} после паузы")
+			return True
+		return False
+
+	def record_success(self, key: Hashable):
+		circuit = self._circuits.pop(key, None)
+		if circuit is not None and circuit.state != CLOSED:
+			logger.info(f"{E.SUCCESS} Канал {key} снова доступен")
+
+	def record_failure(self, key: Hashable, error: Exception) -> bool:
+		"""
+		Учитывает ошибку отправки. Возвращает True, если об открытии канала
+		нужно сообщить администраторам (только один раз до восстановления)
+		"""
+		if not is_permanent_error(error):
+			circuit = self._circuits.get(key)
+			# Проба не удалась по временной причине - повторим её после паузы
+			if circuit is not None and circuit.state == HALF_OPEN:
+				circuit.state = OPEN
+				circuit.opened_at = time.monotonic()
+			return False
+
+		circuit = self._circuits.setdefault(key, Circuit())
+		circuit.failures += 1
+		circuit.last_error = str(error)
+
+		if circuit.state == HALF_OPEN or circuit.failures >= self.threshold:
+			if circuit.state != OPEN:
+				logger.warning(f"{E.WARNING} Канал {key} отключён после {circuit.failures} ошибок: {error}")
+			circuit.state = OPEN
+			circuit.opened_at = time.monotonic()
+			if not circuit.notified:
+				circuit.notified = True
+				return True
+		return False
+
+	def open_circuits(self) -> List[Tuple[Hashable, Circuit]]:
+		return [(key, circuit) for key, circuit in self._circuits.items() if circuit.state != CLOSED]
+
+	def render_text(self, name_for=str) -> str:
+		"""Список отключённых каналов для /perf (HTML)"""
+		circuits = self.open_circuits()
+		if not circuits:
+			return ""
+
+		text = f"\n{E.STOPPED} Отключённые каналы:\n"
+		for key, circuit in circuits:
+			if circuit.state == HALF_OPEN:
+				status = "пробная отправка"
+			else:
+				left = max(0, int(self.cooldown - (time.monotonic() - circuit.opened_at)))
+				status = f"проба через {left // 60} мин {left % 60} с"
+			# /perf отправляется с parse_mode=HTML: имя канала и текст ошибки приходят извне
+			text += (
+				f"{html.escape(name_for(key))}: {circuit.failures} ошибок, {status}\n"
+				f"  {html.escape(circuit.last_error[:100])}\n"
+			)
+		return text
+
+
+# Общий предохранитель каналов процесса
+channel_breaker = CircuitBreaker.from_env()
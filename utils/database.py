@@ -1,22 +1,83 @@
-import sqlite3
+import copy
+import hashlib
 import json
 import logging
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import groupby
 from typing import List, Tuple, Optional
 
+import pytz
+
+from utils.db_profiler import connect
+from utils.recurrence import Recurrence, parse_recurrence
+
 
 logger = logging.getLogger(__name__)
 
+# Длина id версии теста (hex sha256): 48 бит, короткий id помещается в callback_data
+VERSION_ID_LENGTH = 12
+VERSION_INSERT_SQL = '''
+    INSERT OR IGNORE INTO test_versions (id, title, content_type, text_content, photo_file_id, question_text, options)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+# Опубликованные посты пишутся и групповым коммитом (WriteBatcher), поэтому запрос вынесен
+PUBLISHED_POST_INSERT_SQL = '''
+    INSERT INTO published_posts (bot_id, test_id, version_id, chat_id, message_id, content_type, published_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+# Повторяющиеся расписания: колонки правила (JOIN schedule_rules r) и вставка следующей отправки
+RULE_COLUMNS = 'r.id, r.rule, r.timezone, r.start_time'
+NEXT_OCCURRENCE_SQL = '''
+    INSERT OR IGNORE INTO schedule (test_id, channel_id, scheduled_time, bot_id, rule_id)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+
+def content_version(title: str, content_type: str, text_content: Optional[str], photo_file_id: Optional[str],
+					question_text: str, options: str) -> str:
+	"""id версии теста - хэш содержимого: одинаковое содержимое даёт одинаковый id"""
+	payload = json.dumps(
+		[title, content_type, text_content, photo_file_id, question_text, options],
+		ensure_ascii=False, separators=(',', ':')
+	)
+	return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:VERSION_ID_LENGTH]
+
+
 class Database:
-	def __init__(self, db_path="tests.db"):
+	"""
+	Доступ к tests.db
+
+	Тесты, расписания и очередь отправки разделены по ботам (колонка bot_id):
+	экземпляр видит только данные своего бота. Администраторы, настройки
+	и кэш каналов общие для всех ботов процесса. bot_id = 0 - данные,
+	созданные до появления нескольких ботов (см. assign_unowned)
+	"""
+
+	def __init__(self, db_path="tests.db", bot_id: int = 0):
 		self.db_path = db_path
+		self.bot_id = bot_id
 		self.init_db()
 
+	def for_bot(self, bot_id: int) -> 'Database':
+		"""Та же база, но с данными другого бота; схема повторно не проверяется"""
+		if bot_id == self.bot_id:
+			return self
+		partition = copy.copy(self)
+		partition.bot_id = bot_id
+		return partition
+
+	def _connect(self):
+		return connect(self.db_path)
+
 	def init_db(self):
-		conn = sqlite3.connect(self.db_path)
+		conn = self._connect()
 		cursor = conn.cursor()
 
+		# Освобождённые страницы можно возвращать понемногу (PRAGMA incremental_vacuum).
+		# Действует только для новой базы, существующую переводит python -m utils.check_db vacuum
+		cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
 		# Таблица настроек
 		cursor.execute('''
 	        CREATE TABLE IF NOT EXISTS settings (
@@ -60,6 +121,136 @@ class Database:
 	        )
 	    ''')
 
+		# Намерение отправки: время, когда планировщик начал отправлять строку
+		self._add_column(cursor, 'schedule', 'intent_at', 'TEXT')
+
+		# Владелец тестов и расписаний (Telegram id бота)
+		self._add_column(cursor, 'tests', 'bot_id', 'INTEGER NOT NULL DEFAULT 0')
+		self._add_column(cursor, 'schedule', 'bot_id', 'INTEGER NOT NULL DEFAULT 0')
+
+		# Индекс для выборки наступивших расписаний планировщиком
+		cursor.execute(
+			'CREATE INDEX IF NOT EXISTS idx_schedule_pending ON schedule (is_sent, scheduled_time)'
+		)
+		# То же для планировщика конкретного бота
+		cursor.execute(
+			'CREATE INDEX IF NOT EXISTS idx_schedule_bot_pending ON schedule (bot_id, is_sent, scheduled_time)'
+		)
+		cursor.execute('CREATE INDEX IF NOT EXISTS idx_tests_bot ON tests (bot_id, is_active)')
+
+		# Правила повтора (cron или интервал в часовом поясе timezone). В schedule
+		# у правила одна будущая строка (rule_id): следующая добавляется, когда
+		# наступает текущая, поэтому размер таблицы не зависит от числа повторов
+		cursor.execute('''
+	        CREATE TABLE IF NOT EXISTS schedule_rules (
+	            id INTEGER PRIMARY KEY AUTOINCREMENT,
+	            bot_id INTEGER NOT NULL DEFAULT 0,
+	            test_id INTEGER NOT NULL,
+	            channel_id TEXT NOT NULL,
+	            rule TEXT NOT NULL,
+	            timezone TEXT NOT NULL,
+	            start_time TEXT NOT NULL,
+	            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+	        )
+	    ''')
+		self._add_column(cursor, 'schedule', 'rule_id', 'INTEGER')
+		# Одна и та же отправка правила не добавляется дважды
+		cursor.execute(
+			'CREATE UNIQUE INDEX IF NOT EXISTS idx_schedule_rule_time ON schedule (rule_id, scheduled_time) '
+			'WHERE rule_id IS NOT NULL'
+		)
+
+		# Неизменяемые версии тестов, id - хэш содержимого (content_version). Кнопки
+		# опубликованного поста ссылаются на версию, поэтому ответы под ним не меняются,
+		# даже если тест изменят или удалят. tests.version_id - текущая версия теста
+		cursor.execute('''
+	        CREATE TABLE IF NOT EXISTS test_versions (
+	            id TEXT PRIMARY KEY,
+	            title TEXT NOT NULL,
+	            content_type TEXT NOT NULL,
+	            text_content TEXT,
+	            photo_file_id TEXT,
+	            question_text TEXT NOT NULL,
+	            options TEXT NOT NULL,
+	            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+	        )
+	    ''')
+		self._add_column(cursor, 'tests', 'version_id', 'TEXT')
+		cursor.execute('CREATE INDEX IF NOT EXISTS idx_tests_unversioned ON tests (id) WHERE version_id IS NULL')
+		self._backfill_versions(cursor)
+
+		# Архив отправленных расписаний: задача хранения переносит сюда старые строки,
+		# название теста сохраняется, чтобы история пережила удаление теста
+		cursor.execute('''
+	        CREATE TABLE IF NOT EXISTS schedule_archive (
+	            id INTEGER PRIMARY KEY,
+	            test_id INTEGER,
+	            test_title TEXT,
+	            channel_id TEXT NOT NULL,
+	            scheduled_time TEXT NOT NULL,
+	            archived_at TEXT NOT NULL
+	        )
+	    ''')
+		self._add_column(cursor, 'schedule_archive', 'bot_id', 'INTEGER NOT NULL DEFAULT 0')
+
+		# Очередь отправки (outbox): наступившие расписания для отдельного процесса
+		# рассылки (python -m utils.dispatcher). status: pending - ждёт отправки,
+		# sending - взята воркером, sent - отправлена, failed - попытки исчерпаны,
+		# interrupted - воркер остановился во время отправки
+		cursor.execute('''
+	        CREATE TABLE IF NOT EXISTS outbox (
+	            id INTEGER PRIMARY KEY AUTOINCREMENT,
+	            schedule_id INTEGER UNIQUE,
+	            test_id INTEGER NOT NULL,
+	            channel_id TEXT NOT NULL,
+	            status TEXT NOT NULL DEFAULT 'pending',
+	            available_at TEXT NOT NULL,
+	            attempts INTEGER DEFAULT 0,
+	            claimed_by TEXT,
+	            claimed_at TEXT,
+	            sent_at TEXT,
+	            last_error TEXT
+	        )
+	    ''')
+		self._add_column(cursor, 'outbox', 'bot_id', 'INTEGER NOT NULL DEFAULT 0')
+		cursor.execute(
+			'CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (status, available_at)'
+		)
+
+		# Опубликованные посты: по ним тесты правятся и удаляются сразу во всех каналах.
+		# deleted_at - пост удалён (ботом или в канале)
+		cursor.execute('''
+	        CREATE TABLE IF NOT EXISTS published_posts (
+	            id INTEGER PRIMARY KEY AUTOINCREMENT,
+	            bot_id INTEGER NOT NULL DEFAULT 0,
+	            test_id INTEGER NOT NULL,
+	            version_id TEXT NOT NULL,
+	            chat_id INTEGER NOT NULL,
+	            message_id INTEGER NOT NULL,
+	            content_type TEXT NOT NULL,
+	            published_at TEXT NOT NULL,
+	            deleted_at TEXT
+	        )
+	    ''')
+		cursor.execute('CREATE INDEX IF NOT EXISTS idx_published_posts_test ON published_posts (test_id)')
+		cursor.execute('CREATE INDEX IF NOT EXISTS idx_published_posts_chat ON published_posts (chat_id)')
+
+		# Таблица каналов: числовой id и результат последней проверки через get_chat
+		cursor.execute('''
+	        CREATE TABLE IF NOT EXISTS channels (
+	            chat_id INTEGER PRIMARY KEY,
+	            username TEXT,
+	            title TEXT,
+	            can_post BOOLEAN DEFAULT 0,
+	            last_checked TEXT NOT NULL
+	        )
+	    ''')
+		# Бот, который проверял канал последним: он же его и перепроверяет
+		self._add_column(cursor, 'channels', 'bot_id', 'INTEGER NOT NULL DEFAULT 0')
+		cursor.execute(
+			'CREATE INDEX IF NOT EXISTS idx_channels_last_checked ON channels (last_checked)'
+		)
+
 		# Часовой пояс по умолчанию (UTC) если его еще нет
 		cursor.execute(
 			'INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)',
@@ -69,9 +260,82 @@ class Database:
 		conn.commit()
 		conn.close()
 
+	def enable_wal(self):
+		"""
+		Журнал WAL: читатели не ждут писателя, а писатели - читателя. Нужен, когда
+		с базой одновременно работают бот, процесс рассылки и резервное копирование;
+		режим сохраняется в файле базы
+		"""
+		conn = self._connect()
+		mode = conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+		conn.close()
+		return mode
+
+	def assign_unowned(self, bot_id: int) -> int:
+		"""
+		Передаёт боту bot_id данные без владельца (созданные, когда бот был один).
+		Вызывается при запуске для первого токена; повторный вызов ничего не меняет
+		"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		try:
+			assigned = 0
+			for table in ('tests', 'schedule', 'schedule_rules', 'schedule_archive', 'outbox', 'published_posts', 'channels'):
+				cursor.execute(f'UPDATE {table} SET bot_id = ? WHERE bot_id = 0', (int(bot_id),))
+				assigned += cursor.rowcount
+			conn.commit()
+			return assigned
+		except Exception as e:
+			logger.info(f"Ошибка при назначении владельца данных: {e}")
+			conn.rollback()
+			return 0
+		finally:
+			conn.close()
+
+	def execute_batch(self, statements: List[Tuple[str, tuple]]):
+		"""
+		Выполняет пачку запросов одной транзакцией. Подряд идущие одинаковые
+		запросы объединяются в executemany
+		"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		try:
+			for sql, group in groupby(statements, key=lambda statement: statement[0]):
+				cursor.executemany(sql, [params for _, params in group])
+			conn.commit()
+		except Exception:
+			conn.rollback()
+			raise
+		finally:
+			conn.close()
+
+	@staticmethod
+	def _backfill_versions(cursor):
+		"""Создаёт версии для тестов, добавленных до появления версий"""
+		cursor.execute('''
+	        SELECT id, title, content_type, text_content, photo_file_id, question_text, options
+	        FROM tests WHERE version_id IS NULL
+	    ''')
+		rows = cursor.fetchall()
+		if not rows:
+			return
+		versions = [(content_version(*row[1:]), *row[1:]) for row in rows]
+		cursor.executemany(VERSION_INSERT_SQL, versions)
+		cursor.executemany(
+			'UPDATE tests SET version_id = ? WHERE id = ?',
+			[(version[0], row[0]) for version, row in zip(versions, rows)]
+		)
+
+	@staticmethod
+	def _add_column(cursor, table: str, column: str, definition: str):
+		"""Добавляет колонку в существующую таблицу, если её ещё нет"""
+		cursor.execute(f'PRAGMA table_info({table})')
+		if column not in (row[1] for row in cursor.fetchall()):
+			cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
 	# Настройки
 	def get_all_settings(self):
-		conn = sqlite3.connect(self.db_path)
+		conn = self._connect()
 		cursor = conn.cursor()
 		cursor.execute('SELECT key, value FROM settings')
 		settings = cursor.fetchall()
@@ -79,7 +343,7 @@ class Database:
 		return dict(settings)
 
 	def get_setting(self, key: str, default: str = None) -> str:
-		conn = sqlite3.connect(self.db_path)
+		conn = self._connect()
 		cursor = conn.cursor()
 		cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
 		result = cursor.fetchone()
@@ -88,7 +352,7 @@ class Database:
 
 	def set_setting(self, key: str, value: str) -> bool:
 		try:
-			conn = sqlite3.connect(self.db_path)
+			conn = self._connect()
 			cursor = conn.cursor()
 			cursor.execute(
 				'INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)',
@@ -108,15 +372,23 @@ class Database:
 		return self.set_setting('timezone', timezone)
 
 	def is_admin(self, user_id):
-		conn = sqlite3.connect(self.db_path)
+		conn = self._connect()
 		cursor = conn.cursor()
 		cursor.execute('SELECT 1 FROM admins WHERE user_id = ?', (int(user_id),))
 		result = cursor.fetchone() is not None
 		conn.close()
 		return result
 
+	def get_admin_ids(self) -> List[int]:
+		conn = self._connect()
+		cursor = conn.cursor()
+		cursor.execute('SELECT user_id FROM admins')
+		admin_ids = [row[0] for row in cursor.fetchall()]
+		conn.close()
+		return admin_ids
+
 	def add_admin(self, user_id):
-		conn = sqlite3.connect(self.db_path)
+		conn = self._connect()
 		cursor = conn.cursor()
 		try:
 			cursor.execute('INSERT OR IGNORE INTO admins (user_id) VALUES (?)', (int(user_id),))
@@ -129,31 +401,74 @@ class Database:
 
 	def add_test(self, title: str, content_type: str, text_content: Optional[str],
 				 photo_file_id: Optional[str], question_text: str, options: dict) -> int:
-		conn = sqlite3.connect(self.db_path)
-		cursor = conn.cursor()
-		cursor.execute('''
-            INSERT INTO tests (title, content_type, text_content, photo_file_id, question_text, options)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
+		content = (
 			str(title),
 			str(content_type),
 			str(text_content) if text_content else None,
 			str(photo_file_id) if photo_file_id else None,
 			str(question_text),
 			json.dumps(options, ensure_ascii=False)
-		))
+		)
+		version_id = content_version(*content)
+		conn = self._connect()
+		cursor = conn.cursor()
+		cursor.execute(VERSION_INSERT_SQL, (version_id, *content))
+		cursor.execute('''
+            INSERT INTO tests (title, content_type, text_content, photo_file_id, question_text, options, bot_id, version_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (*content, self.bot_id, version_id))
 		test_id = cursor.lastrowid
 		conn.commit()
 		conn.close()
 		return test_id
 
-	# Помечает просто как неактивный
-	# TODO: сделать удаление насовсем
+	def add_tests(self, tests: List[tuple]) -> int:
+		"""
+		Добавляет пачку проверенных тестов одной транзакцией; при ошибке пачка не добавляется
+		Строки: (title, content_type, text_content, photo_file_id, question_text, options JSON)
+		"""
+		versions = [(content_version(*test), *test) for test in tests]
+		conn = self._connect()
+		cursor = conn.cursor()
+		try:
+			cursor.executemany(VERSION_INSERT_SQL, versions)
+			cursor.executemany('''
+	            INSERT INTO tests (title, content_type, text_content, photo_file_id, question_text, options, bot_id, version_id)
+	            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+	        ''', [(*version[1:], self.bot_id, version[0]) for version in versions])
+			conn.commit()
+			return cursor.rowcount
+		except Exception as e:
+			logger.info(f"Ошибка при добавлении тестов: {e}")
+			conn.rollback()
+			raise
+		finally:
+			conn.close()
+
+	def iter_tests(self, batch_size: int = 1000):
+		"""Построчно отдаёт активные тесты для экспорта, не загружая таблицу в память"""
+		conn = self._connect()
+		try:
+			cursor = conn.cursor()
+			cursor.execute('''
+	            SELECT title, content_type, text_content, photo_file_id, question_text, options
+	            FROM tests WHERE bot_id = ? AND is_active = 1 ORDER BY id
+	        ''', (self.bot_id,))
+			while True:
+				rows = cursor.fetchmany(batch_size)
+				if not rows:
+					break
+				yield from rows
+		finally:
+			conn.close()
+
+	# Помечает как неактивный; насовсем тест удаляет задача хранения
+	# (purge_inactive_tests), когда на него не останется ссылок в расписании
 	def delete_test(self, test_id):
-		conn = sqlite3.connect(self.db_path)
+		conn = self._connect()
 		cursor = conn.cursor()
 		try:
-			cursor.execute('UPDATE tests SET is_active = 0 WHERE id = ?', (int(test_id),))
+			cursor.execute('UPDATE tests SET is_active = 0 WHERE id = ? AND bot_id = ?', (int(test_id), self.bot_id))
 			conn.commit()
 			return True
 		except Exception as e:
@@ -164,34 +479,193 @@ class Database:
 			conn.close()
 
 	def get_test(self, test_id):
-		conn = sqlite3.connect(self.db_path)
+		conn = self._connect()
 		cursor = conn.cursor()
-		cursor.execute('SELECT * FROM tests WHERE id = ?', (int(test_id),))
+		cursor.execute('SELECT * FROM tests WHERE id = ? AND bot_id = ?', (int(test_id), self.bot_id))
 		test = cursor.fetchone()
 		conn.close()
 		return test
 
+	def get_current_version(self, test_id):
+		"""
+		Текущая версия теста: (version_id, title, content_type, text_content,
+		photo_file_id, question_text, options) или None
+		"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		cursor.execute('''
+            SELECT v.id, v.title, v.content_type, v.text_content, v.photo_file_id, v.question_text, v.options
+            FROM tests t JOIN test_versions v ON v.id = t.version_id
+            WHERE t.id = ? AND t.bot_id = ?
+        ''', (int(test_id), self.bot_id))
+		version = cursor.fetchone()
+		conn.close()
+		return version
+
+	def get_test_version(self, version_id: str):
+		"""Версия по id (в том же виде, что get_current_version); версии общие для всех ботов"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		cursor.execute('''
+            SELECT id, title, content_type, text_content, photo_file_id, question_text, options
+            FROM test_versions WHERE id = ?
+        ''', (str(version_id),))
+		version = cursor.fetchone()
+		conn.close()
+		return version
+
 	def get_all_tests(self):
-		conn = sqlite3.connect(self.db_path)
+		conn = self._connect()
 		cursor = conn.cursor()
-		cursor.execute('SELECT id, title FROM tests WHERE is_active = 1')
+		cursor.execute('SELECT id, title FROM tests WHERE bot_id = ? AND is_active = 1', (self.bot_id,))
 		tests = cursor.fetchall()
 		conn.close()
 		return tests
 
 	def add_schedule(self, test_id: int, channel_id: str, scheduled_time: datetime) -> bool:
-		conn = sqlite3.connect(self.db_path)
+		conn = self._connect()
 		cursor = conn.cursor()
 		cursor.execute('''
-            INSERT INTO schedule (test_id, channel_id, scheduled_time)
-            VALUES (?, ?, ?)
-        ''', (int(test_id), str(channel_id), scheduled_time.isoformat()))
+            INSERT INTO schedule (test_id, channel_id, scheduled_time, bot_id)
+            VALUES (?, ?, ?, ?)
+        ''', (int(test_id), str(channel_id), scheduled_time.isoformat(), self.bot_id))
 		conn.commit()
 		conn.close()
 
+	def add_schedules(self, schedules: List[Tuple[int, str, datetime]]) -> int:
+		"""Добавляет пачку расписаний (test_id, channel_id, время UTC) одной транзакцией"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		try:
+			cursor.executemany('''
+	            INSERT INTO schedule (test_id, channel_id, scheduled_time, bot_id)
+	            VALUES (?, ?, ?, ?)
+	        ''', [
+				(int(test_id), str(channel_id), scheduled_time.isoformat(), self.bot_id)
+				for test_id, channel_id, scheduled_time in schedules
+			])
+			conn.commit()
+			return cursor.rowcount
+		except Exception as e:
+			logger.info(f"Ошибка при добавлении расписаний: {e}")
+			conn.rollback()
+			return 0
+		finally:
+			conn.close()
+
+	def add_schedule_rules(self, rules: List[Tuple[int, str, Recurrence, datetime]], timezone: str) -> int:
+		"""
+		Добавляет повторяющиеся расписания (test_id, channel_id, правило, первая отправка в UTC)
+		одной транзакцией; в schedule сразу попадает только первая отправка
+		"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		try:
+			tz = pytz.timezone(timezone)
+			for test_id, channel_id, recurrence, start_time in rules:
+				cursor.execute('''
+	                INSERT INTO schedule_rules (bot_id, test_id, channel_id, rule, timezone, start_time)
+	                VALUES (?, ?, ?, ?, ?, ?)
+	            ''', (
+					self.bot_id, int(test_id), str(channel_id), recurrence.expression, timezone,
+					start_time.isoformat(timespec='seconds')
+				))
+				first_time = recurrence.next_after(start_time - timedelta(seconds=1), tz, start_time)
+				cursor.execute(NEXT_OCCURRENCE_SQL, (
+					int(test_id), str(channel_id), first_time.isoformat(timespec='seconds'), self.bot_id, cursor.lastrowid
+				))
+			conn.commit()
+			return len(rules)
+		except Exception as e:
+			logger.info(f"Ошибка при добавлении повторяющихся расписаний: {e}")
+			conn.rollback()
+			return 0
+		finally:
+			conn.close()
+
+	def next_occurrences(self, due, now: datetime) -> List[tuple]:
+		"""
+		Параметры NEXT_OCCURRENCE_SQL для наступивших строк повторяющихся расписаний.
+		due - строки (test_id, channel_id, scheduled_time, *RULE_COLUMNS). Следующая
+		отправка - ближайшая после наступившей и после now: повторы, пропущенные
+		пока бот был остановлен, не догоняются
+		"""
+		occurrences = []
+		for test_id, channel_id, scheduled_time, rule_id, rule, timezone, start_time in due:
+			# Разовое расписание или правило удалено
+			if rule_id is None:
+				continue
+			try:
+				fired_at = datetime.fromisoformat(scheduled_time)
+				if fired_at.tzinfo is None:
+					fired_at = fired_at.replace(tzinfo=pytz.utc)
+				next_time = parse_recurrence(rule).next_after(
+					max(fired_at, now), pytz.timezone(timezone), datetime.fromisoformat(start_time)
+				)
+			except Exception as e:
+				logger.info(f"Ошибка правила повтора {rule_id}: {e}")
+				continue
+			occurrences.append((test_id, channel_id, next_time.isoformat(timespec='seconds'), self.bot_id, rule_id))
+		return occurrences
+
+	def get_schedule_rules(self) -> dict:
+		"""Правила повтора неотправленных расписаний бота: {id расписания: правило}"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		cursor.execute('''
+            SELECT s.id, r.rule
+            FROM schedule s
+            JOIN schedule_rules r ON r.id = s.rule_id
+            WHERE s.bot_id = ? AND s.is_sent = 0
+        ''', (self.bot_id,))
+		rules = dict(cursor.fetchall())
+		conn.close()
+		return rules
+
+	def import_schedules(self, schedules: List[Tuple[int, str, str]]) -> int:
+		"""
+		Добавляет пачку расписаний (test_id, channel_id, время UTC в ISO) одной транзакцией
+		Строки с несуществующими или удалёнными тестами пропускаются; при ошибке пачка не добавляется
+		"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		try:
+			cursor.executemany('''
+	            INSERT INTO schedule (test_id, channel_id, scheduled_time, bot_id)
+	            SELECT id, ?, ?, bot_id FROM tests WHERE id = ? AND bot_id = ? AND is_active = 1
+	        ''', [
+				(channel_id, scheduled_time, int(test_id), self.bot_id)
+				for test_id, channel_id, scheduled_time in schedules
+			])
+			conn.commit()
+			return cursor.rowcount
+		except Exception as e:
+			logger.info(f"Ошибка при импорте расписаний: {e}")
+			conn.rollback()
+			raise
+		finally:
+			conn.close()
+
+	def iter_pending_schedules(self, batch_size: int = 1000):
+		"""Построчно отдаёт неотправленные расписания для экспорта"""
+		conn = self._connect()
+		try:
+			cursor = conn.cursor()
+			cursor.execute('''
+	            SELECT test_id, channel_id, scheduled_time
+	            FROM schedule WHERE bot_id = ? AND is_sent = 0 ORDER BY scheduled_time
+	        ''', (self.bot_id,))
+			while True:
+				rows = cursor.fetchmany(batch_size)
+				if not rows:
+					break
+				yield from rows
+		finally:
+			conn.close()
+
 	# Проверяет, есть ли активные расписания перед удалением
 	def has_active_schedules(self, test_id):
-		conn = sqlite3.connect(self.db_path)
+		conn = self._connect()
 		cursor = conn.cursor()
 		cursor.execute(
 			'SELECT COUNT(*) FROM schedule WHERE test_id = ? AND is_sent = 0',
@@ -201,25 +675,90 @@ class Database:
 		conn.close()
 		return count > 0
 
-	def get_active_schedules(self):
-		conn = sqlite3.connect(self.db_path)
+	def get_active_schedules(self, limit: Optional[int] = None, offset: int = 0):
+		"""Неотправленные расписания по времени; limit и offset - для постраничного списка"""
+		conn = self._connect()
 		cursor = conn.cursor()
 		cursor.execute('''
             SELECT s.id, t.title, s.channel_id, s.scheduled_time 
             FROM schedule s 
             JOIN tests t ON s.test_id = t.id 
-            WHERE s.is_sent = 0
+            WHERE s.bot_id = ? AND s.is_sent = 0
+            ORDER BY s.scheduled_time, s.id
+            LIMIT ? OFFSET ?
+        ''', (self.bot_id, -1 if limit is None else limit, offset))
+		schedules = cursor.fetchall()
+		conn.close()
+		return schedules
+
+	def count_active_schedules(self) -> int:
+		conn = self._connect()
+		count = conn.execute(
+			'SELECT COUNT(*) FROM schedule WHERE bot_id = ? AND is_sent = 0', (self.bot_id,)
+		).fetchone()[0]
+		conn.close()
+		return count
+
+	def get_active_schedule(self, schedule_id: int):
+		conn = self._connect()
+		cursor = conn.cursor()
+		cursor.execute('''
+            SELECT s.id, t.title, s.channel_id, s.scheduled_time
+            FROM schedule s
+            JOIN tests t ON s.test_id = t.id
+            WHERE s.id = ? AND s.bot_id = ? AND s.is_sent = 0
+        ''', (schedule_id, self.bot_id))
+		schedule = cursor.fetchone()
+		conn.close()
+		return schedule
+
+	def get_interrupted_schedules(self):
+		"""
+		Расписания, отправка которых началась, но не подтвердилась (процесс
+		остановился). Строки, ждущие в очереди отправки, и строки, попытки
+		которых исчерпаны (точно не отправлены, см. get_failed_schedules), сюда не входят
+		"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		cursor.execute('''
+            SELECT s.id, t.title, s.channel_id, s.intent_at
+            FROM schedule s
+            JOIN tests t ON s.test_id = t.id
+            WHERE s.bot_id = ? AND s.is_sent = 0 AND s.intent_at IS NOT NULL
+              AND NOT EXISTS (
+                  SELECT 1 FROM outbox o
+                  WHERE o.schedule_id = s.id AND o.status IN ('pending', 'sending', 'failed')
+              )
             ORDER BY s.scheduled_time
-        ''')
+        ''', (self.bot_id,))
 		schedules = cursor.fetchall()
 		conn.close()
 		return schedules
 
+	def get_failed_schedules(self) -> set:
+		"""id расписаний, которые процесс рассылки не отправил, исчерпав попытки"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		cursor.execute('''
+            SELECT s.id
+            FROM schedule s
+            JOIN outbox o ON o.schedule_id = s.id
+            WHERE s.bot_id = ? AND s.is_sent = 0 AND o.status = 'failed'
+        ''', (self.bot_id,))
+		failed = {row[0] for row in cursor.fetchall()}
+		conn.close()
+		return failed
+
 	def delete_schedule(self, schedule_id):
-		conn = sqlite3.connect(self.db_path)
+		conn = self._connect()
 		cursor = conn.cursor()
 		try:
-			cursor.execute('DELETE FROM schedule WHERE id = ?', (int(schedule_id),))
+			# Удаление повторяющегося расписания удаляет и правило: следующих отправок не будет
+			cursor.execute(
+				'DELETE FROM schedule_rules WHERE id = (SELECT rule_id FROM schedule WHERE id = ? AND bot_id = ?)',
+				(int(schedule_id), self.bot_id)
+			)
+			cursor.execute('DELETE FROM schedule WHERE id = ? AND bot_id = ?', (int(schedule_id), self.bot_id))
 			conn.commit()
 			return True
 		except Exception as e:
@@ -229,3 +768,263 @@ class Database:
 		finally:
 			conn.close()
 
+	# Очередь отправки
+	def enqueue_due_schedules(self, now: datetime, limit: int = 1000) -> int:
+		"""Переносит наступившие расписания в очередь отправки одной транзакцией"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		try:
+			now_iso = now.isoformat(timespec='seconds')
+			cursor.execute(f'''
+	            SELECT s.id, s.test_id, s.channel_id, s.scheduled_time, {RULE_COLUMNS}
+	            FROM schedule s
+	            JOIN tests t ON s.test_id = t.id
+	            LEFT JOIN schedule_rules r ON r.id = s.rule_id
+	            WHERE s.bot_id = ? AND s.is_sent = 0 AND s.intent_at IS NULL AND s.scheduled_time <= ?
+	            ORDER BY s.scheduled_time
+	            LIMIT ?
+	        ''', (self.bot_id, now_iso, int(limit)))
+			due = cursor.fetchall()
+			if not due:
+				return 0
+
+			cursor.executemany(
+				'INSERT OR IGNORE INTO outbox (schedule_id, test_id, channel_id, available_at, bot_id) VALUES (?, ?, ?, ?, ?)',
+				[(row[0], row[1], row[2], now_iso, self.bot_id) for row in due]
+			)
+			# Намерение отправки: строка больше не выбирается планировщиком
+			cursor.executemany(
+				'UPDATE schedule SET intent_at = ? WHERE id = ?',
+				[(now_iso, row[0]) for row in due]
+			)
+			# У повторяющихся расписаний появляется следующая отправка
+			cursor.executemany(NEXT_OCCURRENCE_SQL, self.next_occurrences([row[1:] for row in due], now))
+			conn.commit()
+			return len(due)
+		except Exception as e:
+			logger.info(f"Ошибка при постановке расписаний в очередь: {e}")
+			conn.rollback()
+			return 0
+		finally:
+			conn.close()
+
+	def claim_outbox(self, worker_id: str, now: datetime, limit: int):
+		"""
+		Атомарно забирает до limit готовых строк очереди (всех ботов) за воркером.
+		Возвращает (id, schedule_id, test_id, channel_id, attempts, bot_id)
+		"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		try:
+			now_iso = now.isoformat(timespec='seconds')
+			cursor.execute('''
+	            UPDATE outbox SET status = 'sending', claimed_by = ?, claimed_at = ?
+	            WHERE id IN (
+	                SELECT id FROM outbox
+	                WHERE status = 'pending' AND available_at <= ?
+	                ORDER BY available_at, id
+	                LIMIT ?
+	            )
+	            RETURNING id, schedule_id, test_id, channel_id, attempts, bot_id
+	        ''', (worker_id, now_iso, now_iso, int(limit)))
+			claimed = cursor.fetchall()
+			conn.commit()
+			return sorted(claimed)
+		finally:
+			conn.close()
+
+	def mark_stale_outbox(self, claimed_before: datetime):
+		"""
+		Строки, взятые воркером давно и не подтверждённые, помечаются interrupted:
+		неизвестно, ушло ли сообщение, поэтому повторно они не отправляются.
+		Возвращает (id, название теста, channel_id) помеченных строк
+		"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		try:
+			cursor.execute('''
+	            UPDATE outbox SET status = 'interrupted'
+	            WHERE status = 'sending' AND claimed_at < ?
+	            RETURNING id, test_id, channel_id, bot_id
+	        ''', (claimed_before.isoformat(timespec='seconds'),))
+			stale = cursor.fetchall()
+			conn.commit()
+		finally:
+			conn.close()
+		titles = {}
+		for _, test_id, _, bot_id in stale:
+			if test_id not in titles:
+				test = self.for_bot(bot_id).get_test(test_id)
+				titles[test_id] = test[1] if test else str(test_id)
+		return [(outbox_id, titles[test_id], channel_id) for outbox_id, test_id, channel_id, _ in stale]
+
+	def get_outbox_counts(self) -> dict:
+		conn = self._connect()
+		cursor = conn.cursor()
+		cursor.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status')
+		counts = dict(cursor.fetchall())
+		conn.close()
+		return counts
+
+	# Хранение: архивирование и очистка
+	def archive_sent_schedules(self, sent_before: datetime, limit: int) -> int:
+		"""Переносит до limit отправленных расписаний старше sent_before в архив одной транзакцией"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		try:
+			cursor.execute('''
+	            SELECT id FROM schedule
+	            WHERE is_sent = 1 AND scheduled_time < ?
+	            ORDER BY scheduled_time
+	            LIMIT ?
+	        ''', (sent_before.isoformat(), int(limit)))
+			ids = [(row[0],) for row in cursor.fetchall()]
+			if not ids:
+				return 0
+
+			archived_at = datetime.utcnow().isoformat(timespec='seconds')
+			cursor.executemany('''
+	            INSERT OR REPLACE INTO schedule_archive (id, test_id, test_title, channel_id, scheduled_time, archived_at, bot_id)
+	            SELECT s.id, s.test_id, t.title, s.channel_id, s.scheduled_time, ?, s.bot_id
+	            FROM schedule s LEFT JOIN tests t ON t.id = s.test_id
+	            WHERE s.id = ?
+	        ''', [(archived_at, schedule_id) for schedule_id, in ids])
+			cursor.executemany('DELETE FROM schedule WHERE id = ?', ids)
+			conn.commit()
+			return len(ids)
+		except Exception as e:
+			logger.info(f"Ошибка при архивировании расписаний: {e}")
+			conn.rollback()
+			return 0
+		finally:
+			conn.close()
+
+	def purge_sent_outbox(self, sent_before: datetime, limit: int) -> int:
+		"""Удаляет до limit отправленных строк очереди старше sent_before"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		try:
+			cursor.execute('''
+	            DELETE FROM outbox WHERE id IN (
+	                SELECT id FROM outbox WHERE status = 'sent' AND sent_at < ? LIMIT ?
+	            )
+	        ''', (sent_before.isoformat(timespec='seconds'), int(limit)))
+			conn.commit()
+			return cursor.rowcount
+		except Exception as e:
+			logger.info(f"Ошибка при очистке очереди отправки: {e}")
+			conn.rollback()
+			return 0
+		finally:
+			conn.close()
+
+	def purge_inactive_tests(self, limit: int) -> int:
+		"""
+		Удаляет насовсем до limit неактивных тестов, на которые нет ссылок в расписании.
+		Тесты с неудалёнными постами в каналах остаются: по ним работает /posts
+		"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		try:
+			cursor.execute('''
+	            DELETE FROM tests WHERE id IN (
+	                SELECT t.id FROM tests t
+	                WHERE t.is_active = 0
+	                  AND NOT EXISTS (SELECT 1 FROM schedule s WHERE s.test_id = t.id)
+	                  AND NOT EXISTS (
+	                      SELECT 1 FROM published_posts p WHERE p.test_id = t.id AND p.deleted_at IS NULL
+	                  )
+	                LIMIT ?
+	            )
+	        ''', (int(limit),))
+			conn.commit()
+			return cursor.rowcount
+		except Exception as e:
+			logger.info(f"Ошибка при удалении неактивных тестов: {e}")
+			conn.rollback()
+			return 0
+		finally:
+			conn.close()
+
+	def incremental_vacuum(self, pages: int) -> Optional[int]:
+		"""
+		Возвращает файлу до pages свободных страниц. None - база не в режиме
+		auto_vacuum = INCREMENTAL и место вернёт только полный VACUUM
+		"""
+		conn = self._connect()
+		try:
+			if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+				return None
+			free_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+			conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+			return free_before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+		finally:
+			conn.close()
+
+	# Опубликованные посты
+	def add_published_post(self, test_id: int, version_id: str, chat_id: int, message_id: int,
+						   content_type: str, published_at: datetime):
+		conn = self._connect()
+		try:
+			conn.execute(PUBLISHED_POST_INSERT_SQL, (
+				self.bot_id, int(test_id), version_id, int(chat_id), int(message_id),
+				content_type, published_at.isoformat(timespec='seconds')
+			))
+			conn.commit()
+		finally:
+			conn.close()
+
+	def get_published_posts(self, test_id: int):
+		"""Неудалённые посты теста: (id, chat_id, message_id, content_type, version_id)"""
+		conn = self._connect()
+		cursor = conn.cursor()
+		cursor.execute('''
+            SELECT id, chat_id, message_id, content_type, version_id
+            FROM published_posts
+            WHERE test_id = ? AND bot_id = ? AND deleted_at IS NULL
+            ORDER BY id
+        ''', (int(test_id), self.bot_id))
+		posts = cursor.fetchall()
+		conn.close()
+		return posts
+
+	# Каналы
+	def save_channel(self, chat_id: int, username: Optional[str], title: Optional[str],
+					 can_post: bool, last_checked: datetime, bot_id: int = 0) -> bool:
+		conn = self._connect()
+		cursor = conn.cursor()
+		try:
+			cursor.execute('''
+	            INSERT OR REPLACE INTO channels (chat_id, username, title, can_post, last_checked, bot_id)
+	            VALUES (?, ?, ?, ?, ?, ?)
+	        ''', (int(chat_id), username, title, int(can_post), last_checked.isoformat(), int(bot_id)))
+			conn.commit()
+			return True
+		except Exception as e:
+			logger.info(f"Ошибка при сохранении канала: {e}")
+			conn.rollback()
+			return False
+		finally:
+			conn.close()
+
+	def get_all_channels(self):
+		conn = self._connect()
+		cursor = conn.cursor()
+		cursor.execute('SELECT chat_id, username, title, can_post, last_checked, bot_id FROM channels')
+		channels = cursor.fetchall()
+		conn.close()
+		return channels
+
+	def get_stale_channels(self, checked_before: datetime, limit: int):
+		conn = self._connect()
+		cursor = conn.cursor()
+		cursor.execute('''
+            SELECT chat_id, username, title, can_post, last_checked, bot_id
+            FROM channels
+            WHERE last_checked < ?
+            ORDER BY last_checked
+            LIMIT ?
+        ''', (checked_before.isoformat(), int(limit)))
+		channels = cursor.fetchall()
+		conn.close()
+		return channels
@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import time
+import atexit
+import random
+import sqlite3
+import logging
+import threading
+from collections import deque
+from typing import Dict
+
+from utils.emoji import Emoji as E
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def normalize_sql(sql: str) -> str:
+	"""Приводит запрос к общему виду: схлопывает пробелы и заменяет литералы на ?"""
+	return _LITERAL_RE.sub('?', _WHITESPACE_RE.sub(' ', sql).strip())
+
+
+def _percentile(ordered, q: float) -> float:
+	if not ordered:
+		return 0.0
+	return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class StatementStats:
+	__slots__ = ('calls', 'sampled', 'total', 'max', 'samples')
+
+	def __init__(self, max_samples: int):
+		self.calls = 0
+		self.sampled = 0
+		self.total = 0.0
+		self.max = 0.0
+		# Последние замеры для перцентилей, память ограничена max_samples
+		self.samples = deque(maxlen=max_samples)
+
+
+class QueryProfiler:
+	"""
+	Профилировщик запросов к SQLite
+
+	Время замеряется у каждого запроса (это один perf_counter), а в статистику
+	попадает только доля sample_rate. Запросы дольше slow_ms попадают в лог
+	вместе с EXPLAIN QUERY PLAN. Отчёт периодически сохраняется в report_path,
+	откуда его читает `python -m utils.check_db profile`.
+
+	Соединения работают и в потоках (asyncio.to_thread), поэтому статистика
+	меняется и читается под блокировкой
+	"""
+
+	def __init__(self, enabled: bool = False, sample_rate: float = 1.0, slow_ms: float = 100,
+				 report_path: str = 'logs/db_profile.json', flush_interval: float = 60, max_samples: int = 1000):
+		self.enabled = enabled
+		self.sample_rate = sample_rate
+		self.slow_ms = slow_ms
+		self.report_path = report_path
+		self.flush_interval = flush_interval
+		self.max_samples = max_samples
+		self.stats: Dict[str, StatementStats] = {}
+		self._normalized: Dict[str, str] = {}
+		self._last_flush = time.monotonic()
+		self._lock = threading.Lock()
+		self.started_at = time.time()
+
+	@classmethod
+	def from_env(cls):
+		return cls(
+			enabled=os.getenv('DB_PROFILE', '0') == '1',
+			sample_rate=float(os.getenv('DB_PROFILE_SAMPLE', 1.0)),
+			slow_ms=float(os.getenv('DB_SLOW_QUERY_MS', 100)),
+			report_path=os.getenv('DB_PROFILE_REPORT', 'logs/db_profile.json'),
+		)
+
+	def _normalize(self, sql: str) -> str:
+		# Запросы в коде - константы, поэтому нормализация кэшируется по исходному тексту.
+		# Вызывается под self._lock
+		normalized = self._normalized.get(sql)
+		if normalized is None:
+			if len(self._normalized) > 10000:
+				self._normalized.clear()
+			normalized = self._normalized[sql] = normalize_sql(sql)
+		return normalized
+
+	def record(self, conn, sql: str, parameters, elapsed: float, calls: int = 1):
+		if elapsed * 1000 >= self.slow_ms:
+			self._log_slow(conn, sql, parameters, elapsed)
+
+		if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+			return
+
+		with self._lock:
+			key = self._normalize(sql)
+			stats = self.stats.get(key)
+			if stats is None:
+				stats = self.stats[key] = StatementStats(self.max_samples)
+			# Счётчики ведутся только по выборке, в отчёте они масштабируются обратно
+			stats.calls += calls
+			stats.sampled += 1
+			stats.total += elapsed
+			stats.max = max(stats.max, elapsed)
+			stats.samples.append(elapsed)
+			# Сохраняет отчёт только один из потоков
+			flush = time.monotonic() - self._last_flush >= self.flush_interval
+			if flush:
+				self._last_flush = time.monotonic()
+
+		if flush:
+			self.save()
+
+	def _log_slow(self, conn, sql: str, parameters, elapsed: float):
+		plan = ''
+		try:
+			cursor = sqlite3.Cursor(conn)
+			cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters)
+			plan = '; '.join(row[-1] for row in cursor.fetchall())
+		except Exception:
+			# EXPLAIN возможен не для всех запросов (DDL, PRAGMA)
+			pass
+		with self._lock:
+			normalized = self._normalize(sql)
+		logger.warning(
+			f"{E.CLOCK} Медленный запрос ({elapsed * 1000:.1f} мс): {normalized}"
+			+ (f" | план: {plan}" if plan else "")
+		)
+
+	def report(self) -> dict:
+		scale = 1 / self.sample_rate if self.sample_rate else 1
+		# Снимок под блокировкой, сортировка замеров для перцентилей - уже без неё
+		with self._lock:
+			snapshot = [
+				(sql, stats.calls, stats.sampled, stats.total, stats.max, sorted(stats.samples))
+				for sql, stats in self.stats.items()
+			]
+
+		statements = []
+		for sql, calls, sampled, total, max_elapsed, ordered in snapshot:
+			statements.append({
+				'sql': sql,
+				'calls': round(calls * scale),
+				'total_ms': round(total * scale * 1000, 3),
+				'avg_ms': round(total / sampled * 1000, 3) if sampled else 0,
+				'p50_ms': round(_percentile(ordered, 0.5) * 1000, 3),
+				'p95_ms': round(_percentile(ordered, 0.95) * 1000, 3),
+				'p99_ms': round(_percentile(ordered, 0.99) * 1000, 3),
+				'max_ms': round(max_elapsed * 1000, 3),
+			})
+		statements.sort(key=lambda row: row['total_ms'], reverse=True)
+		return {
+			'started_at': self.started_at,
+			'saved_at': time.time(),
+			'sample_rate': self.sample_rate,
+			'statements': statements,
+		}
+
+	def save(self):
+		self._last_flush = time.monotonic()
+		if not self.stats:
+			return
+		try:
+			os.makedirs(os.path.dirname(self.report_path) or '.', exist_ok=True)
+			tmp_path = f"{self.report_path}.tmp"
+			with open(tmp_path, 'w', encoding='utf-8') as f:
+				json.dump(self.report(), f, ensure_ascii=False, indent=1)
+			os.replace(tmp_path, self.report_path)
+		except OSError as e:
+			logger.info(f"{E.ERROR} Не удалось сохранить отчёт профилировщика: {e}")
+
+
+profiler = QueryProfiler.from_env()
+
+
+class ProfilingCursor(sqlite3.Cursor):
+	def execute(self, sql, parameters=()):
+		started = time.perf_counter()
+		try:
+			return super().execute(sql, parameters)
+		finally:
+			profiler.record(self.connection, sql, parameters, time.perf_counter() - started)
+
+	def executemany(self, sql, seq_of_parameters):
+		seq_of_parameters = list(seq_of_parameters)
+		started = time.perf_counter()
+		try:
+			return super().executemany(sql, seq_of_parameters)
+		finally:
+			first = seq_of_parameters[0] if seq_of_parameters else ()
+			profiler.record(self.connection, sql, first, time.perf_counter() - started, calls=len(seq_of_parameters))
+
+
+class ProfilingConnection(sqlite3.Connection):
+	# Connection.execute в C не вызывает переопределённый Cursor.execute,
+	# поэтому ярлыки соединения тоже идут через курсор профилировщика
+	def cursor(self, factory=ProfilingCursor):
+		return super().cursor(factory)
+
+	def execute(self, sql, parameters=()):
+		return self.cursor().execute(sql, parameters)
+
+	def executemany(self, sql, seq_of_parameters):
+		return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(db_path: str, **kwargs) -> sqlite3.Connection:
+	"""sqlite3.connect, который при включенном DB_PROFILE возвращает профилируемое соединение"""
+	if profiler.enabled:
+		kwargs.setdefault('factory', ProfilingConnection)
+	return sqlite3.connect(db_path, **kwargs)
+
+
+if profiler.enabled:
+	atexit.register(profiler.save)
@@ -0,0 +1,253 @@
+"""
+Процесс рассылки: разбирает очередь отправки (таблица outbox)
+
+Бот с DISPATCH_MODE=outbox только ставит наступившие расписания в очередь,
+а отправляет их этот процесс со своей сессией Bot API и своим ограничением
+частоты. Процессы общаются только через базу SQLite, поэтому массовая
+рассылка не задерживает ответы на нажатия кнопок.
+
+Запуск из корня репозитория (рядом с tests.db):
+    python -m utils.dispatcher
+"""
+import os
+import socket
+import signal
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Dict
+
+from dotenv import load_dotenv
+from aiogram import Bot
+
+from handlers.user_handlers import send_test_to_channel, notify_admins, UNKNOWN_OUTCOME_ERRORS
+from utils.channels import channel_registry
+from utils.circuit_breaker import channel_breaker
+from utils.database import Database
+from utils.http_session import TunedSession
+from utils.rate_limiter import RateLimiter
+from utils.scheduler import utc_now
+from utils.setup_logging import setup_logging, stop_logging
+from utils.write_batcher import WriteBatcher
+from utils.emoji import Emoji as E
+
+logger = logging.getLogger(__name__)
+
+# Статусы отправки пишутся групповым коммитом (WriteBatcher)
+COMPLETE_OUTBOX_SQL = "UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?"
+RELEASE_OUTBOX_SQL = '''
+    UPDATE outbox
+    SET status = ?, available_at = ?, attempts = attempts + ?, last_error = ?,
+        claimed_by = NULL, claimed_at = NULL
+    WHERE id = ?
+'''
+
+
+class OutboxDispatcher:
+	"""
+	Воркер очереди отправки
+
+	Забирает готовые строки (атомарно, через UPDATE ... RETURNING) не больше,
+	чем свободно слотов, отправляет их параллельно (до concurrency) в пределах
+	лимитов RateLimiter. Успешная отправка отмечает строку и расписание, ошибка
+	возвращает строку в очередь с нарастающей паузой, после max_attempts попыток
+	строка помечается failed. Статусы пишутся групповым коммитом (WriteBatcher).
+	Строки, взятые воркером и не подтверждённые за stale_after, помечаются
+	interrupted и повторно не отправляются.
+
+	Очередь общая для всех ботов: строка отправляется ботом, которому
+	принадлежит расписание (bots и rate_limiters - по Telegram id бота).
+	"""
+
+	def __init__(self, bots: Dict[int, Bot], db, rate_limiters: Dict[int, RateLimiter], concurrency: int = 8,
+				 batch_size: int = 50, poll_interval: float = 2, max_attempts: int = 5, retry_delay: float = 30,
+				 stale_after: float = 300):
+		self.bots = bots
+		# Бот по умолчанию: уведомления администраторам и строки без известного владельца
+		self.bot = next(iter(bots.values()))
+		self.db = db
+		self.rate_limiters = rate_limiters
+		self.concurrency = concurrency
+		self.batch_size = batch_size
+		self.poll_interval = poll_interval
+		self.max_attempts = max_attempts
+		self.retry_delay = retry_delay
+		self.stale_after = stale_after
+		self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+		self._in_flight = set()
+		self._stopping = asyncio.Event()
+		self.batcher = WriteBatcher(db)
+
+	async def _send(self, outbox_id: int, schedule_id: int, test_id: int, channel_id: str, attempts: int,
+					bot_id: int):
+		chat_id = channel_registry.chat_id_for(channel_id)
+		try:
+			if bot_id not in self.bots:
+				self._release(outbox_id, self.retry_delay, f"бот {bot_id} не запущен", count_attempt=False)
+				return
+
+			# Отключённый предохранителем канал не тратит попытки, строка ждёт пробы
+			if channel_breaker.is_open((bot_id, chat_id)):
+				self._release(outbox_id, self.retry_delay, "канал отключён", count_attempt=False)
+				return
+
+			await self.rate_limiters[bot_id].acquire(chat_id)
+			success = await send_test_to_channel(
+				test_id, channel_id, self.bots[bot_id], self.db.for_bot(bot_id), self.batcher
+			)
+			if success:
+				self.batcher.add(COMPLETE_OUTBOX_SQL, (utc_now().isoformat(timespec='seconds'), outbox_id))
+				self.batcher.add('UPDATE schedule SET is_sent = 1 WHERE id = ?', (schedule_id,))
+				logger.info(f"{E.CONFIRM} Тест {test_id} отправлен в {channel_id}")
+				return
+
+			await self._retry_or_give_up(outbox_id, test_id, channel_id, attempts, bot_id, "ошибка отправки")
+		except UNKNOWN_OUTCOME_ERRORS as e:
+			# Пост мог быть опубликован: строка остаётся в sending и через stale_after
+			# попадает в прерванные - администратор решает сам, отправлять ли снова
+			logger.warning(f"{E.WARNING} Результат отправки строки очереди {outbox_id} неизвестен: {e}")
+		except Exception as e:
+			logger.error(f"{E.ERROR} Ошибка обработки строки очереди {outbox_id}: {e}")
+			# Строка не должна остаться в sending: иначе через stale_after она считается прерванной
+			try:
+				await self._retry_or_give_up(outbox_id, test_id, channel_id, attempts, bot_id, str(e)[:200])
+			except Exception as release_error:
+				logger.error(f"{E.ERROR} Не удалось вернуть строку очереди {outbox_id}: {release_error}")
+
+	async def _retry_or_give_up(self, outbox_id: int, test_id: int, channel_id: str, attempts: int, bot_id: int,
+								error: str):
+		"""Возвращает строку в очередь с нарастающей паузой, после max_attempts - помечает failed"""
+		give_up = attempts + 1 >= self.max_attempts
+		self._release(outbox_id, self.retry_delay * 2 ** attempts, error, give_up=give_up)
+		if not give_up:
+			return
+
+		logger.error(f"{E.ERROR} Тест {test_id} не отправлен в {channel_id} после {attempts + 1} попыток")
+		# Тест точно не опубликован - сообщаем сразу, а не как о прерванной отправке
+		test = self.db.for_bot(bot_id).get_test(test_id)
+		await notify_admins(
+			self.bots.get(bot_id, self.bot),
+			f"{E.ERROR} Тест '{test[1] if test else test_id}' не отправлен в канал "
+			f"{channel_registry.display_name_for(channel_id)} после {attempts + 1} попыток ({error}).\n"
+			"Запланируйте отправку заново, когда канал будет доступен."
+		)
+
+	def _release(self, outbox_id: int, delay: float, error: str, count_attempt: bool = True, give_up: bool = False):
+		"""Возвращает строку в очередь через delay секунд или помечает её как failed"""
+		available_at = (utc_now() + timedelta(seconds=delay)).isoformat(timespec='seconds')
+		self.batcher.add(RELEASE_OUTBOX_SQL, (
+			'failed' if give_up else 'pending', available_at, 1 if count_attempt else 0, error, outbox_id
+		))
+
+	async def recover_stale(self):
+		stale = self.db.mark_stale_outbox(utc_now() - timedelta(seconds=self.stale_after))
+		if not stale:
+			return
+		logger.warning(f"{E.WARNING} Отправка прервалась для {len(stale)} строк очереди: {[row[0] for row in stale]}")
+		lines = [f"{title} -> {channel_registry.display_name_for(channel_id)}" for _, title, channel_id in stale[:20]]
+		await notify_admins(
+			self.bot,
+			f"{E.WARNING} Процесс рассылки остановился во время отправки. Неизвестно, опубликованы ли эти тесты "
+			f"({len(stale)}):\n" + "\n".join(lines) +
+			"\n\nПроверьте каналы и при необходимости запланируйте отправку заново."
+		)
+
+	async def run(self):
+		logger.info(f"{E.ROCKET} Рассылка {self.worker_id} запущена, параллельно до {self.concurrency} отправок")
+		last_recovery = None
+		while not self._stopping.is_set():
+			now = utc_now()
+			if last_recovery is None or (now - last_recovery).total_seconds() >= self.stale_after / 2:
+				last_recovery = now
+				try:
+					await self.recover_stale()
+				except Exception as e:
+					logger.error(f"{E.ERROR} Не удалось проверить прерванные отправки: {e}")
+
+			claimed, requested = [], 0
+			try:
+				# Берём не больше строк, чем есть свободных слотов
+				requested = min(self.concurrency - len(self._in_flight), self.batch_size)
+				if requested > 0:
+					claimed = self.db.claim_outbox(self.worker_id, now, requested)
+			except Exception as e:
+				logger.error(f"{E.ERROR} Ошибка чтения очереди отправки: {e}")
+
+			for row in claimed:
+				task = asyncio.create_task(self._send(*row))
+				self._in_flight.add(task)
+				task.add_done_callback(self._in_flight.discard)
+
+			if len(self._in_flight) >= self.concurrency:
+				# Все слоты заняты - ждём, пока освободится хотя бы один
+				await asyncio.wait(set(self._in_flight), timeout=self.poll_interval, return_when=asyncio.FIRST_COMPLETED)
+			elif not claimed or len(claimed) < requested:
+				# Очередь пуста - ждём новых строк
+				try:
+					await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+				except asyncio.TimeoutError:
+					pass
+
+	def stop(self):
+		self._stopping.set()
+
+	async def shutdown(self, timeout: float):
+		"""Перестаёт брать строки и даёт начатым отправкам timeout секунд на завершение"""
+		self.stop()
+		if self._in_flight:
+			logger.info(f"{E.CLOCK} Ждём завершения отправок: {len(self._in_flight)}")
+			done, pending = await asyncio.wait(set(self._in_flight), timeout=timeout)
+			for task in pending:
+				task.cancel()
+			if pending:
+				logger.warning(f"{E.WARNING} Не завершились за {timeout:g} с: {len(pending)} отправок")
+		self.batcher.flush()
+
+
+async def main():
+	load_dotenv()
+	setup_logging(log_file='logs/dispatcher.log')
+
+	bot_tokens = [x.strip() for x in (os.getenv('BOT_TOKENS') or os.getenv('BOT_TOKEN') or '').split(',') if x.strip()]
+	if not bot_tokens:
+		logger.error(f"{E.ERROR} BOT_TOKEN не найден в переменных окружения")
+		return
+
+	db = Database()
+	db.enable_wal()
+	# Процесс только рассылает, поэтому берёт настройки пула для массовой отправки;
+	# пул общий, а лимиты частоты у каждого бота свои
+	session = TunedSession.from_env('HTTP_BULK_')
+	bots = {}
+	for token in bot_tokens:
+		bot = Bot(token=token, session=session)
+		bots[bot.id] = bot
+	db.assign_unowned(next(iter(bots)))
+	rate = float(os.getenv('DISPATCH_RATE', 25))
+	dispatcher = OutboxDispatcher(
+		bots, db,
+		{bot_id: RateLimiter(global_rate=rate) for bot_id in bots},
+		concurrency=int(os.getenv('DISPATCH_CONCURRENCY', 8)),
+		max_attempts=int(os.getenv('DISPATCH_MAX_ATTEMPTS', 5)),
+	)
+
+	loop = asyncio.get_running_loop()
+	runner = asyncio.create_task(dispatcher.run())
+	for sig in (signal.SIGTERM, signal.SIGINT):
+		try:
+			loop.add_signal_handler(sig, dispatcher.stop)
+		except NotImplementedError:
+			# Windows: остаётся KeyboardInterrupt
+			pass
+
+	try:
+		await runner
+	finally:
+		await dispatcher.shutdown(float(os.getenv('SHUTDOWN_TIMEOUT', 8)))
+		await session.close()
+		logger.info(f"{E.STOPPED} Рассылка остановлена")
+		stop_logging()
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
@@ -33,6 +33,7 @@ class Emoji:
 	CHANNEL = "📢"
 	CALENDAR = "📅"
 	CLOCK = "⏰"
+	REPEAT = "🔁"
 	EYE = "👁️"
 	EDIT = "✏️"
 	SEND = "📤"
@@ -0,0 +1,219 @@
+import json
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from utils.db_profiler import connect
+from utils.emoji import Emoji as E
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StateRecord:
+	state: Optional[str] = None
+	data: Dict[str, Any] = field(default_factory=dict)
+	updated_at: float = 0.0
+
+
+class SQLiteStorage(BaseStorage):
+	"""
+	FSM хранилище поверх SQLite с кэшем в памяти (write-through)
+
+	При старте все неистёкшие состояния загружаются в память, поэтому чтение
+	состояния на каждом апдейте не обращается к диску. Любая запись сразу
+	попадает и в кэш, и в базу, так что после перезапуска недописанные
+	мастера (создание теста, планирование) продолжаются с того же шага.
+	Состояния, не менявшиеся дольше ttl секунд, считаются брошенными.
+
+	Кэш упорядочен по времени последнего изменения (самые старые в начале),
+	поэтому очистка просроченных и вытеснение сверх max_states не требуют
+	полного обхода.
+	"""
+
+	# Группы состояний админских мастеров, о потере которых стоит предупредить
+	DRAFT_STATE_GROUPS = ('TestCreation', 'ScheduleCreation')
+
+	def __init__(self, db_path="tests.db", ttl: Optional[float] = None, max_states: Optional[int] = None):
+		self.db_path = db_path
+		self.ttl = ttl
+		self.max_states = max_states
+		self._cache: Dict[str, StateRecord] = {}
+		self.expired_total = 0
+		self._conn = connect(self.db_path)
+		self._init_table()
+		self._load()
+
+	def _init_table(self):
+		self._conn.execute('''
+	        CREATE TABLE IF NOT EXISTS fsm_states (
+	            key TEXT PRIMARY KEY,
+	            state TEXT,
+	            data TEXT NOT NULL DEFAULT '{}',
+	            updated_at REAL NOT NULL
+	        )
+	    ''')
+		self._conn.commit()
+
+	def _load(self):
+		if self.ttl:
+			# Брошенные состояния удаляем сразу, в память их не тянем
+			self._conn.execute(
+				'DELETE FROM fsm_states WHERE updated_at < ?',
+				(time.time() - self.ttl,)
+			)
+			self._conn.commit()
+
+		cursor = self._conn.execute('SELECT key, state, data, updated_at FROM fsm_states ORDER BY updated_at')
+		for key, state, data, updated_at in cursor:
+			self._cache[key] = StateRecord(state=state, data=json.loads(data), updated_at=updated_at)
+		logger.info(f"{E.SUCCESS} FSM хранилище загружено: {len(self._cache)} состояний")
+
+	@staticmethod
+	def _build_key(key: StorageKey) -> str:
+		return ':'.join(str(part) for part in (
+			key.bot_id, key.chat_id, key.user_id,
+			key.thread_id or '', key.business_connection_id or '', key.destiny
+		))
+
+	def _is_expired(self, record: StateRecord, now: float) -> bool:
+		return bool(self.ttl) and now - record.updated_at > self.ttl
+
+	def _get_record(self, key: StorageKey) -> Optional[StateRecord]:
+		db_key = self._build_key(key)
+		record = self._cache.get(db_key)
+		if record is not None and self._is_expired(record, time.time()):
+			self._delete(db_key)
+			return None
+		return record
+
+	def _save(self, db_key: str, record: StateRecord):
+		record.updated_at = time.time()
+
+		# Пустую запись не храним, иначе каждый завершённый мастер оставлял бы строку
+		if record.state is None and not record.data:
+			self._delete(db_key)
+			return
+
+		# Перемещаем запись в конец, чтобы порядок кэша оставался по времени изменения
+		self._cache.pop(db_key, None)
+		self._cache[db_key] = record
+		self._conn.execute(
+			'INSERT OR REPLACE INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)',
+			(db_key, record.state, json.dumps(record.data, ensure_ascii=False), record.updated_at)
+		)
+		self._conn.commit()
+
+		if self.max_states and len(self._cache) > self.max_states:
+			self._evict_oldest(len(self._cache) - self.max_states)
+
+	def _delete(self, db_key: str):
+		if self._cache.pop(db_key, None) is not None:
+			self._conn.execute('DELETE FROM fsm_states WHERE key = ?', (db_key,))
+			self._conn.commit()
+
+	def _evict_oldest(self, count: int):
+		evicted = list(self._cache)[:count]
+		for db_key in evicted:
+			del self._cache[db_key]
+		self._conn.executemany('DELETE FROM fsm_states WHERE key = ?', [(k,) for k in evicted])
+		self._conn.commit()
+		self.expired_total += len(evicted)
+		logger.warning(f"{E.WARNING} Превышен лимит FSM состояний ({self.max_states}), вытеснено: {len(evicted)}")
+
+	def _pop_expired(self) -> List[Tuple[str, StateRecord]]:
+		if not self.ttl:
+			return []
+
+		now = time.time()
+		expired = []
+		# Кэш отсортирован по updated_at, поэтому идём до первой живой записи
+		for db_key, record in self._cache.items():
+			if not self._is_expired(record, now):
+				break
+			expired.append((db_key, record))
+
+		if expired:
+			for db_key, _ in expired:
+				del self._cache[db_key]
+			self._conn.executemany('DELETE FROM fsm_states WHERE key = ?', [(k,) for k, _ in expired])
+			self._conn.commit()
+			self.expired_total += len(expired)
+		return expired
+
+	@property
+	def live_count(self) -> int:
+		"""Количество состояний, которые сейчас хранятся в памяти"""
+		return len(self._cache)
+
+	async def sweep_expired(self, bots=None) -> int:
+		"""
+		Удаляет брошенные состояния и, если переданы боты,
+		сообщает администраторам об удалённых черновиках
+		(через бота, в котором был начат черновик)
+		"""
+		expired = self._pop_expired()
+		if not expired:
+			return 0
+
+		logger.info(f"{E.CLOCK} Удалено брошенных FSM состояний: {len(expired)}, осталось: {self.live_count}")
+
+		if bots:
+			bots_by_id = {bot.id: bot for bot in bots}
+			for db_key, record in expired:
+				if record.state and record.state.split(':', 1)[0] in self.DRAFT_STATE_GROUPS:
+					bot = bots_by_id.get(int(db_key.split(':')[0]), bots[0])
+					await self._notify_expired(bot, db_key, record)
+
+		return len(expired)
+
+	@staticmethod
+	async def _notify_expired(bot, db_key: str, record: StateRecord):
+		chat_id = int(db_key.split(':')[1])
+		title = record.data.get('title')
+		if record.state.startswith('TestCreation'):
+			what = f"Черновик теста «{title}»" if title else "Черновик теста"
+		else:
+			what = "Незавершённое планирование отправки"
+
+		try:
+			await bot.send_message(
+				chat_id=chat_id,
+				text=f"{E.CLOCK} {what} удалён из-за долгого бездействия. Начните заново через /admin"
+			)
+		except Exception as e:
+			logger.info(f"{E.ERROR} Не удалось уведомить {chat_id} об удалении черновика: {e}")
+
+	async def start_sweeper(self, bots, interval: float = 60):
+		while True:
+			await asyncio.sleep(interval)
+			try:
+				await self.sweep_expired(bots)
+			except Exception as e:
+				logger.error(f"{E.ERROR} Ошибка очистки FSM состояний: {e}")
+
+	async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+		record = self._get_record(key) or StateRecord()
+		record.state = state.state if isinstance(state, State) else state
+		self._save(self._build_key(key), record)
+
+	async def get_state(self, key: StorageKey) -> Optional[str]:
+		record = self._get_record(key)
+		return record.state if record else None
+
+	async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+		record = self._get_record(key) or StateRecord()
+		record.data = data.copy()
+		self._save(self._build_key(key), record)
+
+	async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+		record = self._get_record(key)
+		return record.data.copy() if record else {}
+
+	async def close(self) -> None:
+		self._conn.close()
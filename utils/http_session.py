@@ -0,0 +1,83 @@
+import os
+import logging
+from typing import Dict, Optional
+
+from aiogram.client.session.aiohttp import AiohttpSession
+
+logger = logging.getLogger(__name__)
+
+# Таймауты по методам Bot API, с. Ответ на нажатие кнопки Telegram ждёт недолго,
+# поэтому зависший запрос лучше оборвать быстро, а загрузка фото может идти дольше
+DEFAULT_METHOD_TIMEOUTS = {
+	'answerCallbackQuery': 5,
+	'sendMessage': 15,
+	'sendPhoto': 30,
+	'editMessageText': 15,
+	'editMessageCaption': 15,
+	'editMessageReplyMarkup': 15,
+	'deleteMessage': 10,
+	'getChat': 10,
+	'getChatMember': 10,
+}
+
+
+def parse_method_timeouts(value: str) -> Dict[str, float]:
+	"""Разбирает строку вида "answerCallbackQuery=3,sendPhoto=60" в словарь"""
+	timeouts = {}
+	for item in value.split(','):
+		if '=' not in item:
+			continue
+		method, seconds = item.split('=', 1)
+		try:
+			timeouts[method.strip()] = float(seconds)
+		except ValueError:
+			logger.warning(f"Некорректный таймаут для {method.strip()}: {seconds}")
+	return timeouts
+
+
+class TunedSession(AiohttpSession):
+	"""
+	Сессия Bot API с настраиваемым пулом соединений
+
+	Размер пула (limit, limit_per_host), время жизни простаивающего соединения
+	(keepalive), кэш DNS и таймауты по методам. Соединения переиспользуются
+	между запросами, поэтому параллельные отправки не открывают новые TLS
+	соединения, а пока пул не исчерпан - не ждут друг друга.
+	"""
+
+	def __init__(self, limit: int = 100, limit_per_host: int = 0, keepalive: float = 30,
+				 dns_cache_ttl: int = 3600, timeout: float = 60,
+				 method_timeouts: Optional[Dict[str, float]] = None, **kwargs):
+		super().__init__(limit=limit, timeout=timeout, **kwargs)
+		self._connector_init.update(
+			limit_per_host=limit_per_host,
+			keepalive_timeout=keepalive,
+			ttl_dns_cache=dns_cache_ttl,
+		)
+		self.method_timeouts = {**DEFAULT_METHOD_TIMEOUTS, **(method_timeouts or {})}
+
+	@classmethod
+	def from_env(cls, prefix: str = 'HTTP_'):
+		"""
+		Настройки из окружения: {prefix}POOL_SIZE, {prefix}POOL_PER_HOST,
+		{prefix}KEEPALIVE, {prefix}DNS_TTL, {prefix}TIMEOUT, {prefix}METHOD_TIMEOUTS.
+		Незаданные значения берутся из общих HTTP_*
+		"""
+
+		def setting(name: str, default):
+			return os.getenv(f"{prefix}{name}") or os.getenv(f"HTTP_{name}") or default
+
+		return cls(
+			limit=int(setting('POOL_SIZE', 100)),
+			limit_per_host=int(setting('POOL_PER_HOST', 0)),
+			keepalive=float(setting('KEEPALIVE', 30)),
+			dns_cache_ttl=int(setting('DNS_TTL', 3600)),
+			timeout=float(setting('TIMEOUT', 60)),
+			method_timeouts=parse_method_timeouts(setting('METHOD_TIMEOUTS', '')),
+		)
+
+	async def make_request(self, bot, method, timeout: Optional[int] = None):
+		# Явный таймаут (например, у getUpdates при long polling) не переопределяется
+		if timeout is None:
+			timeout = self.method_timeouts.get(method.__api_method__)
+		return await super().make_request(bot, method, timeout)
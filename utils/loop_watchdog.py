@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from typing import Optional
+
+from utils.emoji import Emoji as E
+from utils.metrics import metrics, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def is_project_frame(filename: str) -> bool:
+	"""Код бота, а не стандартная библиотека или установленные пакеты"""
+	path = os.path.abspath(filename)
+	return path.startswith(PROJECT_ROOT + os.sep) and 'site-packages' not in path
+
+
+class LoopWatchdog:
+	"""
+	Сторож цикла событий
+
+	Задача в цикле каждые interval секунд засыпает и отмечает, на сколько
+	проснулась позже (задержка цикла - в гистограмму loop_lag). Отдельный поток
+	следит за отметками: если цикл не отвечает дольше threshold, поток снимает
+	стек главного потока через sys._current_frames() прямо во время блокировки
+	и пишет в лог строку кода бота, на которой цикл стоит (например, запрос
+	sqlite3 в обработчике). Каждая блокировка логируется один раз.
+	"""
+
+	def __init__(self, interval: float = 0.1, threshold: float = 0.5, registry: MetricsRegistry = metrics):
+		self.interval = interval
+		self.threshold = threshold
+		self.registry = registry
+		self._heartbeat = time.monotonic()
+		self._loop_thread_id: Optional[int] = None
+		self._reported_heartbeat = None
+		self._stop = threading.Event()
+
+	@classmethod
+	def from_env(cls):
+		return cls(
+			interval=float(os.getenv('LOOP_WATCHDOG_INTERVAL', 0.1)),
+			threshold=float(os.getenv('LOOP_LAG_THRESHOLD', 0.5)),
+		)
+
+	def _capture(self, stalled_for: float):
+		frame = sys._current_frames().get(self._loop_thread_id)
+		if frame is None:
+			return
+		stack = traceback.extract_stack(frame)
+		own = [entry for entry in stack if is_project_frame(entry.filename)]
+		culprit = own[-1] if own else stack[-1]
+		filename = os.path.relpath(culprit.filename, PROJECT_ROOT) if own else culprit.filename
+		location = f"{filename}:{culprit.lineno} в {culprit.name}"
+
+		self.registry.inc('loop_stalls')
+		logger.warning(
+			f"{E.WARNING} Цикл событий заблокирован уже {stalled_for * 1000:.0f} мс: {location}\n"
+			+ ''.join(traceback.format_list(stack[-8:]))
+		)
+
+	def _watch(self):
+		while not self._stop.wait(self.threshold / 2):
+			heartbeat = self._heartbeat
+			stalled_for = time.monotonic() - heartbeat - self.interval
+			if stalled_for > self.threshold and heartbeat != self._reported_heartbeat:
+				self._reported_heartbeat = heartbeat
+				try:
+					self._capture(stalled_for)
+				except Exception as e:
+					logger.info(f"{E.ERROR} Не удалось снять стек цикла событий: {e}")
+
+	async def run(self):
+		self._loop_thread_id = threading.get_ident()
+		self._heartbeat = time.monotonic()
+		watcher = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+		watcher.start()
+		try:
+			while True:
+				await asyncio.sleep(self.interval)
+				now = time.monotonic()
+				self.registry.observe('loop_lag', 'main', max(0.0, now - self._heartbeat - self.interval))
+				self._heartbeat = now
+		finally:
+			self._stop.set()
@@ -0,0 +1,173 @@
+import time
+import logging
+from bisect import bisect_left
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.emoji import Emoji as E
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм в секундах (от 1 мс до 30 с)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+	"""
+	Гистограмма с фиксированными корзинами
+
+	Запись значения - это bisect по короткому кортежу и два сложения,
+	поэтому её можно вызывать на каждом апдейте
+	"""
+
+	__slots__ = ('buckets', 'counts', 'total', 'count', 'errors')
+
+	def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+		self.buckets = buckets
+		# Последняя корзина - всё, что больше верхней границы (+Inf)
+		self.counts = [0] * (len(buckets) + 1)
+		self.total = 0.0
+		self.count = 0
+		self.errors = 0
+
+	def observe(self, value: float, error: bool = False):
+		self.counts[bisect_left(self.buckets, value)] += 1
+		self.total += value
+		self.count += 1
+		if error:
+			self.errors += 1
+
+	def percentile(self, q: float) -> float:
+		"""Оценка перцентиля по верхней границе корзины"""
+		if not self.count:
+			return 0.0
+		rank = q * self.count
+		seen = 0
+		for i, bucket_count in enumerate(self.counts):
+			seen += bucket_count
+			if seen >= rank:
+				return self.buckets[i] if i < len(self.buckets) else float('inf')
+		return float('inf')
+
+	@property
+	def average(self) -> float:
+		return self.total / self.count if self.count else 0.0
+
+
+class MetricsRegistry:
+	"""Хранилище метрик бота: гистограммы задержек, счётчики и гейджи"""
+
+	def __init__(self):
+		self.histograms: Dict[Tuple[str, str], Histogram] = {}
+		self.counters: Dict[Tuple[str, str], int] = {}
+		self.gauges: Dict[str, Callable[[], float]] = {}
+		self.started_at = time.time()
+
+	def observe(self, metric: str, label: str, value: float, error: bool = False):
+		key = (metric, label)
+		histogram = self.histograms.get(key)
+		if histogram is None:
+			histogram = self.histograms[key] = Histogram()
+		histogram.observe(value, error)
+
+	def inc(self, metric: str, label: str = '', value: int = 1):
+		key = (metric, label)
+		self.counters[key] = self.counters.get(key, 0) + value
+
+	def register_gauge(self, name: str, getter: Callable[[], float]):
+		"""Гейдж вычисляется в момент чтения метрик, на горячем пути ничего не стоит"""
+		self.gauges[name] = getter
+
+	def render_prometheus(self) -> str:
+		"""Все метрики в текстовом формате Prometheus"""
+		lines = []
+		described = set()
+
+		for (metric, label), histogram in sorted(self.histograms.items()):
+			name = f"bot_{metric}_seconds"
+			if name not in described:
+				lines.append(f"# TYPE {name} histogram")
+				described.add(name)
+			cumulative = 0
+			for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+				cumulative += bucket_count
+				lines.append(f'{name}_bucket{{name="{label}",le="{bound}"}} {cumulative}')
+			lines.append(f'{name}_bucket{{name="{label}",le="+Inf"}} {histogram.count}')
+			lines.append(f'{name}_sum{{name="{label}"}} {histogram.total:.6f}')
+			lines.append(f'{name}_count{{name="{label}"}} {histogram.count}')
+
+		for (metric, label), histogram in sorted(self.histograms.items()):
+			name = f"bot_{metric}_errors_total"
+			if name not in described:
+				lines.append(f"# TYPE {name} counter")
+				described.add(name)
+			lines.append(f'{name}{{name="{label}"}} {histogram.errors}')
+
+		for (metric, label), value in sorted(self.counters.items()):
+			name = f"bot_{metric}_total"
+			if name not in described:
+				lines.append(f"# TYPE {name} counter")
+				described.add(name)
+			lines.append(f'{name}{{name="{label}"}} {value}' if label else f"{name} {value}")
+
+		for name, getter in sorted(self.gauges.items()):
+			try:
+				value = getter()
+			except Exception as e:
+				logger.info(f"{E.ERROR} Ошибка чтения метрики {name}: {e}")
+				continue
+			lines.append(f"# TYPE bot_{name} gauge")
+			lines.append(f"bot_{name} {value}")
+
+		return '\n'.join(lines) + '\n'
+
+	def render_text(self) -> str:
+		"""Краткая сводка для команды /perf"""
+		uptime = int(time.time() - self.started_at)
+		text = f"{E.TEST} <b>Производительность</b> (аптайм {uptime // 3600} ч {uptime % 3600 // 60} мин)\n"
+
+		titles = {
+			'handler': f"{E.BOT} Обработчики",
+			'api': f"{E.SEND} Telegram API",
+			'loop_lag': f"{E.CLOCK} Задержка цикла событий",
+		}
+		for metric, title in titles.items():
+			rows = [(label, h) for (m, label), h in self.histograms.items() if m == metric]
+			if not rows:
+				continue
+			text += f"\n{title}:\n"
+			for label, h in sorted(rows, key=lambda row: -row[1].total):
+				text += (
+					f"<code>{label}</code>: {h.count} шт, ср. {h.average * 1000:.1f} мс, "
+					f"p50 ≤{h.percentile(0.5) * 1000:g} мс, p99 ≤{h.percentile(0.99) * 1000:g} мс"
+				)
+				text += f", ошибок {h.errors}\n" if h.errors else "\n"
+
+		if self.gauges:
+			text += "\n"
+			for name, getter in sorted(self.gauges.items()):
+				try:
+					text += f"{E.INFO} {name}: {getter()}\n"
+				except Exception:
+					continue
+
+		return text
+
+
+# Общий реестр процесса
+metrics = MetricsRegistry()
+
+
+async def start_metrics_server(host: str = '127.0.0.1', port: Optional[int] = None, registry: MetricsRegistry = metrics):
+	"""Локальный HTTP эндпоинт /metrics в формате Prometheus"""
+	from aiohttp import web
+
+	async def handle_metrics(request):
+		return web.Response(text=registry.render_prometheus(), content_type='text/plain', charset='utf-8')
+
+	app = web.Application()
+	app.router.add_get('/metrics', handle_metrics)
+	runner = web.AppRunner(app)
+	await runner.setup()
+	await web.TCPSite(runner, host, port).start()
+	logger.info(f"{E.SUCCESS} Метрики доступны на http://{host}:{port}/metrics")
+	return runner
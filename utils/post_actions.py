@@ -0,0 +1,156 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import pytz
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InputMediaPhoto
+
+from handlers.user_handlers import render_post
+from utils.rate_limiter import RateLimiter
+from utils.test_versions import TestVersion
+from utils.write_batcher import WriteBatcher
+from utils.emoji import Emoji as E
+
+logger = logging.getLogger(__name__)
+
+EDIT_POST_SQL = 'UPDATE published_posts SET test_id = ?, version_id = ? WHERE id = ?'
+DELETE_POST_SQL = 'UPDATE published_posts SET deleted_at = ? WHERE id = ?'
+
+# Лимиты частоты у каждого бота свои (общий поток сообщений бота)
+_rate_limiters: Dict[int, RateLimiter] = {}
+
+
+def rate_limiter_for(bot, global_rate: float = 25) -> RateLimiter:
+	limiter = _rate_limiters.get(bot.id)
+	if limiter is None:
+		limiter = _rate_limiters[bot.id] = RateLimiter(global_rate=global_rate)
+	return limiter
+
+
+@dataclass
+class BulkResult:
+	total: int
+	done: int = 0
+	skipped: int = 0
+	missing: int = 0
+	failed: int = 0
+	errors: List[str] = field(default_factory=list)
+
+	@property
+	def processed(self) -> int:
+		return self.done + self.skipped + self.missing + self.failed
+
+
+class PostActions:
+	"""
+	Массовая правка и удаление опубликованных постов теста
+
+	Посты обрабатываются параллельно (до concurrency запросов) в пределах
+	лимитов RateLimiter, как и отправка в OutboxDispatcher. Лимит процесса
+	не знает о рассылке в других процессах, поэтому на 429 (TelegramRetryAfter)
+	пост повторяется после указанной паузы, до max_retries раз. Изменения
+	published_posts пишутся групповым коммитом. Пост, удалённый в канале
+	вручную, помечается удалённым и в базе
+	"""
+
+	def __init__(self, bot, db, rate_limiter: RateLimiter, concurrency: int = 8, max_errors: int = 10,
+				 max_retries: int = 5):
+		self.bot = bot
+		self.db = db
+		self.rate_limiter = rate_limiter
+		self.concurrency = concurrency
+		self.max_errors = max_errors
+		self.max_retries = max_retries
+		self.batcher = WriteBatcher(db)
+
+	async def _run(self, posts, action: Callable[[tuple], Awaitable[str]],
+				   on_progress: Optional[Callable[[BulkResult], Awaitable[None]]]) -> BulkResult:
+		result = BulkResult(total=len(posts))
+		semaphore = asyncio.Semaphore(self.concurrency)
+
+		async def run_one(post):
+			async with semaphore:
+				retries = 0
+				while True:
+					await self.rate_limiter.acquire(post[1])
+					try:
+						outcome = await action(post)
+					except TelegramRetryAfter as e:
+						if retries < self.max_retries:
+							# Общий лимит бота превышен (например, вместе с рассылкой) - ждём и повторяем
+							retries += 1
+							logger.warning(f"{E.CLOCK} Пост {post[2]} в {post[1]}: повтор через {e.retry_after} с")
+							await asyncio.sleep(e.retry_after)
+							continue
+						outcome = self._failed(result, post, e)
+					except TelegramBadRequest as e:
+						# Пост удалили в канале вручную
+						if 'not found' in str(e):
+							self.batcher.add(DELETE_POST_SQL, (datetime.now(pytz.utc).isoformat(timespec='seconds'), post[0]))
+							outcome = 'missing'
+						else:
+							outcome = self._failed(result, post, e)
+					except Exception as e:
+						outcome = self._failed(result, post, e)
+					break
+			setattr(result, outcome, getattr(result, outcome) + 1)
+			if on_progress:
+				await on_progress(result)
+
+		try:
+			await asyncio.gather(*(run_one(post) for post in posts))
+		finally:
+			self.batcher.flush()
+		return result
+
+	def _failed(self, result: BulkResult, post, error: Exception) -> str:
+		logger.error(f"{E.ERROR} Пост {post[2]} в {post[1]}: {error}")
+		if len(result.errors) < self.max_errors:
+			result.errors.append(f"{post[1]}: {error}")
+		return 'failed'
+
+	async def edit(self, posts, test_id: int, version: TestVersion, on_progress=None) -> BulkResult:
+		"""
+		Приводит посты к версии version теста test_id: текст или подпись, фото и кнопки.
+		Пост с тем же содержимым пропускается; текстовый пост нельзя сделать постом
+		с фото и наоборот - такие тоже пропускаются
+		"""
+		text, keyboard = render_post(version)
+		is_text = version.content_type == 'text'
+
+		async def edit_one(post) -> str:
+			post_id, chat_id, message_id, content_type, version_id = post
+			if version_id == version.id or (content_type == 'text') != is_text:
+				return 'skipped'
+
+			try:
+				if is_text:
+					await self.bot.edit_message_text(
+						chat_id=chat_id, message_id=message_id, text=text, reply_markup=keyboard
+					)
+				else:
+					# edit_message_media меняет и фото, и подпись
+					await self.bot.edit_message_media(
+						chat_id=chat_id, message_id=message_id,
+						media=InputMediaPhoto(media=version.photo_file_id, caption=text),
+						reply_markup=keyboard
+					)
+			except TelegramBadRequest as e:
+				if 'not modified' not in str(e):
+					raise
+			self.batcher.add(EDIT_POST_SQL, (int(test_id), version.id, post_id))
+			return 'done'
+
+		return await self._run(posts, edit_one, on_progress)
+
+	async def delete(self, posts, on_progress=None) -> BulkResult:
+		async def delete_one(post) -> str:
+			post_id, chat_id, message_id, _, _ = post
+			await self.bot.delete_message(chat_id=chat_id, message_id=message_id)
+			self.batcher.add(DELETE_POST_SQL, (datetime.now(pytz.utc).isoformat(timespec='seconds'), post_id))
+			return 'done'
+
+		return await self._run(posts, delete_one, on_progress)
@@ -0,0 +1,106 @@
+import io
+import time
+import pstats
+import asyncio
+import cProfile
+import logging
+import tracemalloc
+
+from utils.emoji import Emoji as E
+
+logger = logging.getLogger(__name__)
+
+# Окно профилирования ограничено: cProfile и tracemalloc заметно замедляют бота
+MAX_PROFILE_SECONDS = 60
+MAX_MEMSNAP_SECONDS = 120
+TRACEMALLOC_FRAMES = 10
+TOP_LIMIT = 40
+
+# Одновременно идёт не больше одного замера
+_lock = asyncio.Lock()
+
+# Аллокации самих инструментов в отчёт не попадают
+MEMSNAP_FILTERS = (
+	tracemalloc.Filter(False, tracemalloc.__file__),
+	tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+	tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+)
+
+
+class ProfilerBusy(Exception):
+	pass
+
+
+def is_busy() -> bool:
+	return _lock.locked()
+
+
+async def profile_cpu(seconds: float) -> str:
+	"""
+	Профилирует цикл событий cProfile в течение seconds секунд и возвращает
+	отчёт: функции по собственному и накопленному времени
+	"""
+	if _lock.locked():
+		raise ProfilerBusy()
+	async with _lock:
+		seconds = min(max(seconds, 1), MAX_PROFILE_SECONDS)
+		profiler = cProfile.Profile()
+		started = time.monotonic()
+		logger.info(f"{E.CLOCK} Профилирование CPU на {seconds:g} с")
+		profiler.enable()
+		try:
+			await asyncio.sleep(seconds)
+		finally:
+			profiler.disable()
+		elapsed = time.monotonic() - started
+
+		out = io.StringIO()
+		out.write(f"cProfile, окно {elapsed:.1f} с\n\n")
+		stats = pstats.Stats(profiler, stream=out)
+		stats.strip_dirs()
+		out.write("=== По собственному времени (tottime) ===\n")
+		stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP_LIMIT)
+		out.write("\n=== По накопленному времени (cumtime) ===\n")
+		stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_LIMIT)
+		return out.getvalue()
+
+
+async def memory_snapshot_diff(seconds: float) -> str:
+	"""
+	Снимает два снимка tracemalloc с интервалом seconds секунд и возвращает
+	места, где память выросла больше всего. Если tracemalloc не был включён,
+	он включается только на время замера
+	"""
+	if _lock.locked():
+		raise ProfilerBusy()
+	async with _lock:
+		seconds = min(max(seconds, 1), MAX_MEMSNAP_SECONDS)
+		started_here = not tracemalloc.is_tracing()
+		if started_here:
+			tracemalloc.start(TRACEMALLOC_FRAMES)
+		logger.info(f"{E.CLOCK} Замер памяти на {seconds:g} с")
+		try:
+			before = tracemalloc.take_snapshot().filter_traces(MEMSNAP_FILTERS)
+			await asyncio.sleep(seconds)
+			after = tracemalloc.take_snapshot().filter_traces(MEMSNAP_FILTERS)
+			current, peak = tracemalloc.get_traced_memory()
+		finally:
+			if started_here:
+				tracemalloc.stop()
+
+		out = io.StringIO()
+		out.write(
+			f"tracemalloc, окно {seconds:g} с\n"
+			f"Отслеживается сейчас: {current / 1024:.0f} КБ, пик: {peak / 1024:.0f} КБ\n\n"
+		)
+		out.write("=== Рост по строкам ===\n")
+		for stat in after.compare_to(before, 'lineno')[:TOP_LIMIT]:
+			out.write(f"{stat}\n")
+		out.write("\n=== Всего по строкам после замера ===\n")
+		for stat in after.statistics('lineno')[:TOP_LIMIT]:
+			out.write(f"{stat}\n")
+		out.write("\n=== Стеки с наибольшим ростом ===\n")
+		for stat in after.compare_to(before, 'traceback')[:5]:
+			out.write(f"\n{stat.size_diff / 1024:+.1f} КБ, {stat.count_diff:+d} блоков\n")
+			out.write('\n'.join(stat.traceback.format()) + '\n')
+		return out.getvalue()
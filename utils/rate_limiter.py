@@ -0,0 +1,56 @@
+import time
+import asyncio
+from typing import Dict, Hashable
+
+
+class TokenBucket:
+	"""Ведро токенов: rate токенов в секунду, не больше capacity про запас"""
+
+	def __init__(self, rate: float, capacity: float):
+		self.rate = rate
+		self.capacity = capacity
+		self.tokens = capacity
+		self.updated = time.monotonic()
+
+	def _refill(self):
+		now = time.monotonic()
+		self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+
+	def delay(self) -> float:
+		"""Сколько ждать до следующего токена (0 - можно сейчас)"""
+		self._refill()
+		return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+	def take(self):
+		self.tokens -= 1
+
+
+class RateLimiter:
+	"""
+	Ограничение частоты отправок под лимиты Telegram: общий поток сообщений
+	бота (около 30 в секунду) и отдельный лимит на каждый чат (около 20 в минуту
+	для групп и каналов). acquire ждёт, пока освободятся оба ведра
+	"""
+
+	def __init__(self, global_rate: float = 25, per_chat_rate: float = 20 / 60, per_chat_burst: float = 3):
+		self.global_bucket = TokenBucket(global_rate, global_rate)
+		self.per_chat_rate = per_chat_rate
+		self.per_chat_burst = per_chat_burst
+		self._chats: Dict[Hashable, TokenBucket] = {}
+
+	def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+		bucket = self._chats.get(chat_id)
+		if bucket is None:
+			bucket = self._chats[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+		return bucket
+
+	async def acquire(self, chat_id: Hashable):
+		chat_bucket = self._chat_bucket(chat_id)
+		while True:
+			wait = max(self.global_bucket.delay(), chat_bucket.delay())
+			if wait <= 0:
+				self.global_bucket.take()
+				chat_bucket.take()
+				return
+			await asyncio.sleep(wait)
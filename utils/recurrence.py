@@ -0,0 +1,153 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from datetime import datetime, timedelta, time
+from typing import FrozenSet, Optional
+
+import pytz
+
+# Единицы интервала повтора в минутах; в правиле хранится латинская
+INTERVAL_UNITS = {
+	'm': 1, 'min': 1, 'м': 1, 'мин': 1, 'минут': 1, 'минуты': 1,
+	'h': 60, 'ч': 60, 'час': 60, 'часа': 60, 'часов': 60,
+	'd': 1440, 'д': 1440, 'дн': 1440, 'день': 1440, 'дня': 1440, 'дней': 1440,
+	'w': 10080, 'н': 10080, 'нед': 10080, 'неделю': 10080, 'недели': 10080, 'недель': 10080,
+}
+INTERVAL_NAMES = {1: ('m', 'мин'), 60: ('h', 'ч'), 1440: ('d', 'дн'), 10080: ('w', 'нед')}
+INTERVAL_RE = re.compile(r'^(?:@every\s+)?(\d+)\s*([a-zа-я]+)$')
+
+CRON_ALIASES = {
+	'@hourly': '0 * * * *',
+	'@daily': '0 0 * * *',
+	'@weekly': '0 0 * * 1',
+	'@monthly': '0 0 1 * *',
+}
+# Границы полей cron: минута, час, день месяца, месяц, день недели (0 и 7 - воскресенье)
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+# Ближайшее совпадение ищется не дальше (29 февраля в понедельник бывает раз в 28 лет)
+CRON_SEARCH_DAYS = 366 * 28
+
+
+def _parse_cron_field(text: str, low: int, high: int) -> FrozenSet[int]:
+	values = set()
+	for part in text.split(','):
+		value_range, _, step = part.partition('/')
+		if value_range == '*':
+			start, end = low, high
+		elif '-' in value_range:
+			start, end = (int(value) for value in value_range.split('-', 1))
+		else:
+			start = end = int(value_range)
+			if step:
+				end = high
+		step = int(step) if step else 1
+		if not low <= start <= end <= high or step < 1:
+			raise ValueError(f"Поле cron вне диапазона {low}-{high}: {part}")
+		values.update(range(start, end + 1, step))
+	return frozenset(values)
+
+
+@dataclass(frozen=True)
+class Recurrence:
+	"""
+	Правило повтора расписания: интервал (@every 7d) или выражение cron из пяти полей
+
+	Время правила - местное время часового пояса администратора: "каждый день
+	в 10:00" остаётся в 10:00 и после перехода на летнее время. Интервал
+	отсчитывается от первой отправки (anchor)
+	"""
+	expression: str
+	interval: Optional[timedelta] = None
+	minutes: FrozenSet[int] = frozenset()
+	hours: FrozenSet[int] = frozenset()
+	days: FrozenSet[int] = frozenset()
+	months: FrozenSet[int] = frozenset()
+	weekdays: FrozenSet[int] = frozenset()
+	# Ограничены ли день месяца и день недели (cron: если оба - подходит любой из них)
+	days_restricted: bool = False
+	weekdays_restricted: bool = False
+
+	@classmethod
+	def parse(cls, text: str) -> 'Recurrence':
+		"""Разбирает "7д", "2h", "@every 30m", "@weekly" или "0 10 * * 1"; ValueError при ошибке"""
+		text = ' '.join(text.lower().split())
+		text = CRON_ALIASES.get(text, text)
+
+		match = INTERVAL_RE.match(text)
+		if match:
+			count, unit = int(match.group(1)), INTERVAL_UNITS.get(match.group(2))
+			if not unit or not count:
+				raise ValueError(f"Неверный интервал повтора: {text}")
+			return cls(f"@every {count}{INTERVAL_NAMES[unit][0]}", interval=timedelta(minutes=count * unit))
+
+		fields = text.split(' ')
+		if len(fields) != 5:
+			raise ValueError(f"Правило повтора - интервал (7д) или cron из пяти полей: {text}")
+		minutes, hours, days, months, weekdays = (
+			_parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)
+		)
+		return cls(
+			text, minutes=minutes, hours=hours, days=days, months=months,
+			# В Python понедельник - 0, в cron - 1
+			weekdays=frozenset((weekday - 1) % 7 for weekday in weekdays),
+			days_restricted=fields[2] != '*', weekdays_restricted=fields[4] != '*'
+		)
+
+	def describe(self) -> str:
+		if self.interval is None:
+			return f"cron {self.expression}"
+		minutes = int(self.interval.total_seconds() // 60)
+		unit = max(unit for unit in INTERVAL_NAMES if minutes % unit == 0)
+		return f"каждые {minutes // unit} {INTERVAL_NAMES[unit][1]}"
+
+	def next_after(self, after: datetime, tz, anchor: datetime) -> datetime:
+		"""
+		Ближайшее время повтора строго позже after и не раньше anchor (первой отправки).
+		Время в UTC
+		"""
+		local_after = after.astimezone(tz).replace(tzinfo=None)
+		local_anchor = anchor.astimezone(tz).replace(tzinfo=None)
+		candidate = self._next_local(max(local_after, local_anchor - timedelta(minutes=1)), local_anchor)
+		try:
+			localized = tz.localize(candidate, is_dst=None)
+		except pytz.NonExistentTimeError:
+			# Время пропущено переводом часов вперёд - отправляем на час позже, а не на день
+			localized = tz.localize(candidate, is_dst=False)
+		except pytz.AmbiguousTimeError:
+			# Час повторяется при переводе назад - отправляем в первый из них
+			localized = tz.localize(candidate, is_dst=True)
+		return localized.astimezone(pytz.utc)
+
+	def _next_local(self, after: datetime, anchor: datetime) -> datetime:
+		if self.interval is not None:
+			if after < anchor:
+				return anchor
+			return anchor + self.interval * ((after - anchor) // self.interval + 1)
+
+		start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+		day = start.date()
+		for _ in range(CRON_SEARCH_DAYS):
+			if day.month in self.months and self._day_matches(day):
+				from_time = start.time() if day == start.date() else time(0, 0)
+				for hour in sorted(self.hours):
+					if hour < from_time.hour:
+						continue
+					for minute in sorted(self.minutes):
+						if hour == from_time.hour and minute < from_time.minute:
+							continue
+						return datetime.combine(day, time(hour, minute))
+			day += timedelta(days=1)
+		raise ValueError(f"Правило {self.expression} не срабатывает")
+
+	def _day_matches(self, day) -> bool:
+		in_days = day.day in self.days
+		in_weekdays = day.weekday() in self.weekdays
+		if self.days_restricted and self.weekdays_restricted:
+			return in_days or in_weekdays
+		return in_days and in_weekdays
+
+
+@lru_cache(maxsize=1024)
+def parse_recurrence(expression: str) -> Recurrence:
+	"""Recurrence.parse с кэшем: правила хранятся в базе строкой и разбираются на каждой отправке"""
+	return Recurrence.parse(expression)
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+import pytz
+
+from utils.database import Database
+from utils.emoji import Emoji as E
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionManager:
+	"""
+	Задача хранения: не даёт рабочим таблицам расти бесконечно
+
+	Отправленные расписания старше days дней переносятся в schedule_archive,
+	отправленные строки очереди outbox удаляются, неактивные тесты без ссылок
+	в расписании удаляются насовсем, освободившиеся страницы возвращаются
+	incremental_vacuum. Всё делается маленькими пачками в отдельном потоке
+	с паузами, чтобы не держать блокировку базы и не останавливать цикл событий.
+	"""
+
+	def __init__(self, db: Database, days: float, batch_size: int = 500, pause: float = 0.5,
+				 vacuum_pages: int = 200):
+		self.db = db
+		self.days = days
+		self.batch_size = batch_size
+		self.pause = pause
+		self.vacuum_pages = vacuum_pages
+		self._vacuum_warned = False
+
+	async def _drain(self, step, *args) -> int:
+		"""Повторяет step пачками, пока он что-то обрабатывает"""
+		total = 0
+		while True:
+			done = await asyncio.to_thread(step, *args, self.batch_size)
+			total += done
+			if done < self.batch_size:
+				return total
+			await asyncio.sleep(self.pause)
+
+	async def vacuum(self) -> int:
+		freed = 0
+		while True:
+			pages = await asyncio.to_thread(self.db.incremental_vacuum, self.vacuum_pages)
+			if pages is None:
+				if not self._vacuum_warned:
+					self._vacuum_warned = True
+					logger.warning(
+						f"{E.WARNING} База не в режиме auto_vacuum = INCREMENTAL, место после очистки "
+						"не возвращается. Выполните один раз при остановленном боте: python -m utils.check_db vacuum"
+					)
+				return freed
+			freed += pages
+			if pages < self.vacuum_pages:
+				return freed
+			await asyncio.sleep(self.pause)
+
+	async def run_once(self) -> dict:
+		sent_before = datetime.now(pytz.utc) - timedelta(days=self.days)
+		result = {
+			'archived': await self._drain(self.db.archive_sent_schedules, sent_before),
+			'purged_outbox': await self._drain(self.db.purge_sent_outbox, sent_before),
+			'purged_tests': await self._drain(self.db.purge_inactive_tests),
+		}
+		result['freed_pages'] = await self.vacuum()
+
+		if any(result.values()):
+			logger.info(
+				f"{E.INFO} Хранение: в архив {result['archived']} расписаний, из очереди удалено "
+				f"{result['purged_outbox']}, удалено тестов {result['purged_tests']}, "
+				f"освобождено страниц {result['freed_pages']}"
+			)
+		return result
+
+	async def start(self, interval: float):
+		while True:
+			try:
+				await self.run_once()
+			except Exception as e:
+				logger.error(f"{E.ERROR} Ошибка задачи хранения: {e}")
+			await asyncio.sleep(interval)
@@ -1,69 +1,217 @@
 import asyncio
-import sqlite3
 from datetime import datetime
 import pytz
 import logging
 
-from handlers.user_handlers import send_test_to_channel
-from utils.database import Database
+from handlers.user_handlers import send_test_to_channel, notify_admins, UNKNOWN_OUTCOME_ERRORS
+from utils.database import Database, RULE_COLUMNS, NEXT_OCCURRENCE_SQL
+from utils.write_batcher import WriteBatcher
+from utils.channels import channel_registry
+from utils.circuit_breaker import channel_breaker
 from utils.emoji import Emoji as E
 
 logger = logging.getLogger(__name__)
 
+# Сколько расписаний переносить в очередь отправки одной транзакцией
+ENQUEUE_BATCH = 1000
+# Сколько намерений отправки записывать одной транзакцией
+INTENT_BATCH = 20
+CLEAR_INTENT_SQL = 'UPDATE schedule SET intent_at = NULL WHERE id = ?'
+
+
+def utc_now() -> datetime:
+	return datetime.now(pytz.utc)
+
 
 class SchedulerManager:
-	def __init__(self, bot, db_path="tests.db"):
+	"""
+	Периодически отправляет тесты, время публикации которых наступило
+
+	Часы (clock) и ожидание (sleep) можно подменить, чтобы прогнать
+	расписание на виртуальном времени (см. bench/simulate_scheduler.py)
+
+	Перед запросом к Telegram в строке отмечается намерение отправки (intent_at).
+	Если процесс остановится между отправкой и отметкой is_sent, строка не будет
+	отправлена повторно после перезапуска: такие расписания остаются в списке
+	активных с пометкой, а администраторы получают уведомление (не больше одной
+	публикации вместо возможного дубля)
+
+	В режиме outbox планировщик сам не отправляет: наступившие расписания
+	переносятся в очередь, которую разбирает отдельный процесс рассылки
+	(python -m utils.dispatcher)
+
+	Планировщик работает с расписаниями одного бота (bot_id, см. Database)
+	"""
+
+	def __init__(self, bot, db_path="tests.db", clock=utc_now, sleep=asyncio.sleep, interval: float = 30,
+				 mode: str = 'inline', bot_id: int = 0):
 		self.bot = bot
 		self.db_path = db_path
-		self.db = Database(db_path)
+		self.db = Database(db_path, bot_id=bot_id)
+		self.batcher = WriteBatcher(self.db)
+		self.clock = clock
+		self.sleep = sleep
+		self.interval = interval
+		self.mode = mode
+		self._stopping = False
+		self._checking = False
+		self._task = None
 
 	async def check_pending_schedules(self):
-		conn = sqlite3.connect(self.db_path)
+		if self.mode == 'outbox':
+			enqueued = 0
+			while True:
+				batch = self.db.enqueue_due_schedules(self.clock(), ENQUEUE_BATCH)
+				enqueued += batch
+				if batch < ENQUEUE_BATCH:
+					break
+			if enqueued:
+				logger.info(f"{E.SEND} В очередь отправки поставлено расписаний: {enqueued}")
+			return
+
+		self._checking = True
+		try:
+			await self._send_due()
+		finally:
+			# Результаты тика записываются до следующей выборки
+			self.batcher.flush()
+			self._checking = False
+
+	async def _send_due(self):
+		conn = self.db._connect()
 		cursor = conn.cursor()
 
 		# Получаем текущее время в UTC для сравнения
-		now_utc = datetime.now(pytz.utc)
+		now_utc = self.clock()
 
+		# Время хранится в UTC в ISO формате, поэтому строки сравниваются в хронологическом
+		# порядке и наступившие расписания выбираются по индексу, а не полным перебором
 		cursor.execute(
-			'''SELECT s.id, s.test_id, s.channel_id, t.title 
+			f'''SELECT s.id, s.test_id, s.channel_id, t.title, s.scheduled_time, {RULE_COLUMNS}
 			   FROM schedule s 
 			   JOIN tests t ON s.test_id = t.id 
-			   WHERE s.is_sent = 0'''
+			   LEFT JOIN schedule_rules r ON r.id = s.rule_id
+			   WHERE s.bot_id = ? AND s.is_sent = 0 AND s.intent_at IS NULL AND s.scheduled_time <= ?
+			   ORDER BY s.scheduled_time''',
+			(self.db.bot_id, now_utc.isoformat(timespec='seconds'))
 		)
-		all_schedules = cursor.fetchall()
+		due_schedules = [
+			row for row in cursor.fetchall()
+			# Отключённый предохранителем канал ждёт пробной отправки, строку не трогаем
+			if not channel_breaker.is_open((self.db.bot_id, channel_registry.chat_id_for(row[2])))
+		]
+		conn.close()
 
-		for schedule_id, test_id, channel_id, test_title in all_schedules:
-			# Получаем запланированное время из базы (оно хранится в UTC)
-			cursor.execute(
-				'SELECT scheduled_time FROM schedule WHERE id = ?',
-				(schedule_id,)
-			)
-			scheduled_time_str = cursor.fetchone()[0]
+		intent_at = now_utc.isoformat(timespec='seconds')
+		for offset in range(0, len(due_schedules), INTENT_BATCH):
+			# При остановке новые отправки не начинаются, текущая успевает завершиться
+			if self._stopping:
+				break
 
-			# Преобразуем строку в datetime объект (предполагаем, что хранится в UTC)
-			scheduled_time_utc = datetime.fromisoformat(scheduled_time_str).replace(tzinfo=pytz.utc)
+			# Намерения пачки фиксируются одной транзакцией до отправки:
+			# прерванная отправка не повторится после перезапуска.
+			# В той же транзакции у повторяющихся расписаний появляется следующая отправка
+			chunk = due_schedules[offset:offset + INTENT_BATCH]
+			self.db.execute_batch([
+				('UPDATE schedule SET intent_at = ? WHERE id = ?', (intent_at, row[0]))
+				for row in chunk
+			] + [
+				(NEXT_OCCURRENCE_SQL, params)
+				for params in self.db.next_occurrences([(row[1], row[2], *row[4:]) for row in chunk], now_utc)
+			])
 
-			# Сравниваем с текущим временем в UTC
-			if now_utc >= scheduled_time_utc:
-				try:
-					success = await send_test_to_channel(test_id, channel_id, self.bot)
-
-					if success:
-						cursor.execute(
-							'UPDATE schedule SET is_sent = 1 WHERE id = ?',
-							(schedule_id,)
-						)
-						conn.commit()
-						logger.info(f"{E.CONFIRM} Тест '{test_title}' отправлен в {channel_id}")
-					else:
-						logger.info(f"{E.ERROR} Ошибка отправки теста '{test_title}' в {channel_id}")
+			for index, (schedule_id, test_id, channel_id, test_title, *_) in enumerate(chunk):
+				if self._stopping:
+					# Отправка не начиналась - снимаем намерение, строка уйдёт после перезапуска
+					self._clear_intents(chunk[index:])
+					break
 
+				try:
+					success = await send_test_to_channel(test_id, channel_id, self.bot, self.db, self.batcher)
+				except asyncio.CancelledError:
+					# Прервана текущая отправка: её намерение остаётся, остальные снимаем
+					self._clear_intents(chunk[index + 1:])
+					raise
+				except UNKNOWN_OUTCOME_ERRORS as e:
+					# Ответа нет: намерение остаётся, после перезапуска строка попадёт в прерванные
+					logger.warning(f"{E.WARNING} Результат отправки теста '{test_title}' в {channel_id} неизвестен: {e}")
+					continue
 				except Exception as e:
 					logger.info(f"{E.ERROR} Ошибка отправки теста: {e}")
+					success = False
 
-		conn.close()
+				if success:
+					self.batcher.add('UPDATE schedule SET is_sent = 1 WHERE id = ?', (schedule_id,))
+					logger.info(f"{E.CONFIRM} Тест '{test_title}' отправлен в {channel_id}")
+				else:
+					# Telegram ответил ошибкой - публикации не было, повторим на следующей проверке
+					self.batcher.add(CLEAR_INTENT_SQL, (schedule_id,))
+					logger.info(f"{E.ERROR} Ошибка отправки теста '{test_title}' в {channel_id}")
+
+	def _clear_intents(self, rows):
+		for row in rows:
+			self.batcher.add(CLEAR_INTENT_SQL, (row[0],))
+
+	async def recover_interrupted(self):
+		"""Сообщает о расписаниях, отправка которых прервалась остановкой процесса"""
+		interrupted = self.db.get_interrupted_schedules()
+		if not interrupted:
+			return
+
+		lines = [
+			f"{test_title} -> {channel_registry.display_name_for(channel_id)}"
+			for _, test_title, channel_id, _ in interrupted[:20]
+		]
+		logger.warning(
+			f"{E.WARNING} Отправка {len(interrupted)} расписаний прервалась при остановке бота, "
+			f"повторно они не отправляются: {[row[0] for row in interrupted]}"
+		)
+		await notify_admins(
+			self.bot,
+			f"{E.WARNING} Бот был остановлен во время отправки. Неизвестно, опубликованы ли эти тесты "
+			f"({len(interrupted)}):\n" + "\n".join(lines) +
+			"\n\nПроверьте каналы и при необходимости запланируйте отправку заново."
+		)
 
 	async def start_scheduler(self):
-		while True:
-			await self.check_pending_schedules()
-			await asyncio.sleep(30)
\ No newline at end of file
+		try:
+			await self.recover_interrupted()
+		except Exception as e:
+			logger.error(f"{E.ERROR} Не удалось проверить прерванные отправки: {e}")
+
+		while not self._stopping:
+			try:
+				await self.check_pending_schedules()
+			except Exception as e:
+				# Ошибка одной проверки (база занята, сбой записи) не должна останавливать планировщик
+				logger.error(f"{E.ERROR} Ошибка проверки расписаний: {e}")
+			if self._stopping:
+				break
+			await self.sleep(self.interval)
+
+	def start(self) -> asyncio.Task:
+		self._task = asyncio.create_task(self.start_scheduler())
+		return self._task
+
+	async def shutdown(self, timeout: float):
+		"""
+		Останавливает планировщик: новые отправки не начинаются, текущей даётся
+		timeout секунд на завершение, после чего задача отменяется
+		"""
+		self._stopping = True
+		task = self._task
+		if task is None or task.done():
+			return
+
+		if self._checking:
+			done, _ = await asyncio.wait({task}, timeout=timeout)
+			if done:
+				logger.info(f"{E.SUCCESS} Отправки завершены, планировщик остановлен")
+				return
+			logger.warning(f"{E.WARNING} Отправка не завершилась за {timeout:g} с, планировщик прерван")
+
+		task.cancel()
+		try:
+			await task
+		except asyncio.CancelledError:
+			pass
@@ -1,52 +1,158 @@
-import logging
 import os
-from logging.handlers import RotatingFileHandler
+import json
+import time
+import queue
+import atexit
+import logging
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+	"""Форматирует запись лога в одну JSON-строку (для сборщиков логов)"""
+
+	def format(self, record):
+		payload = {
+			'time': self.formatTime(record, self.datefmt),
+			'level': record.levelname,
+			'logger': record.name,
+			'message': record.getMessage(),
+		}
+		if record.exc_info:
+			payload['exc_info'] = self.formatException(record.exc_info)
+		return json.dumps(payload, ensure_ascii=False)
+
 
+def parse_log_levels(value: str) -> dict:
+	"""
+	Разбирает строку вида "handlers.user_handlers=DEBUG,aiogram=WARNING"
+	в словарь {имя логгера: уровень}
+	"""
+	levels = {}
+	for item in value.split(','):
+		if '=' not in item:
+			continue
+		name, level = item.split('=', 1)
+		levels[name.strip()] = level.strip().upper()
+	return levels
 
-def setup_logging():
+
+def setup_logging(log_file: str = 'logs/bot.log'):
 	"""
 	Настройка логирования для бота
-	Логи пишутся в файл и выводятся в консоль
+	Логи пишутся в файл и выводятся в консоль. У каждого процесса (бот,
+	рассылка) свой файл: ротация одного файла из двух процессов ломается
+
+	Сами обработчики работают в отдельном потоке (QueueListener), а логгеры
+	только кладут записи в очередь, поэтому запись на диск не блокирует
+	обработку апдейтов.
+
+	Переменные окружения:
+	- LOG_LEVEL: уровень корневого логгера (по умолчанию INFO)
+	- LOG_LEVELS: уровни отдельных логгеров, например "handlers.user_handlers=DEBUG"
+	- LOG_FORMAT: "json" для вывода в формате JSON
 	"""
+	global _listener
+
 	# Создаем папку для логов если её нет
-	os.makedirs('logs', exist_ok=True)
+	os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
 
 	# Формат логов
-	formatter = logging.Formatter(
-		'%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-		datefmt='%Y-%m-%d %H:%M:%S'
-	)
+	if os.getenv('LOG_FORMAT', '').lower() == 'json':
+		formatter = JsonFormatter(datefmt='%Y-%m-%d %H:%M:%S')
+	else:
+		formatter = logging.Formatter(
+			'%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+			datefmt='%Y-%m-%d %H:%M:%S'
+		)
 
 	# Хендлер для файла с ротацией
 	file_handler = RotatingFileHandler(
-		'logs/bot.log',
+		log_file,
 		maxBytes=10 * 1024 * 1024,  # 10 MB
 		backupCount=5,
 		encoding='utf-8'
 	)
 	file_handler.setFormatter(formatter)
-	file_handler.setLevel(logging.INFO)
 
 	# Хендлер для консоли
 	console_handler = logging.StreamHandler()
 	console_handler.setFormatter(formatter)
-	console_handler.setLevel(logging.INFO)
+
+	# Повторный вызов не должен плодить потоки и хендлеры
+	if _listener is not None:
+		_listener.stop()
+
+	log_queue = queue.SimpleQueue()
+	_listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+	_listener.start()
+	atexit.register(stop_logging)
+
+	# В очередь уходит только текст сообщения, оформление делают хендлеры слушателя
+	queue_handler = QueueHandler(log_queue)
+	queue_handler.setFormatter(logging.Formatter('%(message)s'))
 
 	# Настраиваем корневой логгер
 	logging.basicConfig(
-		level=logging.INFO,
-		handlers=[file_handler, console_handler]
+		level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+		handlers=[queue_handler],
+		force=True
 	)
 
 	# Устанавливаем уровень логирования для библиотек
 	logging.getLogger('aiogram').setLevel(logging.WARNING)
 	logging.getLogger('apscheduler').setLevel(logging.WARNING)
 
+	# Уровни отдельных логгеров из окружения. Уровень выставляется на сам
+	# логгер, поэтому отключенный вызов отсекается в isEnabledFor (с кэшем)
+	# ещё до форматирования сообщения
+	for name, level in parse_log_levels(os.getenv('LOG_LEVELS', '')).items():
+		logging.getLogger(name).setLevel(level)
+
 	logger = logging.getLogger(__name__)
 	logger.info("✅ Логирование настроено")
 
 	return logger
 
 
+def stop_logging():
+	"""Дописывает оставшиеся в очереди записи и останавливает поток логирования"""
+	global _listener
+	if _listener is not None:
+		_listener.stop()
+		_listener = None
+
+
+class LogSummary:
+	"""
+	Сэмплированная INFO-сводка для горячих обработчиков: вместо строки лога
+	на каждое событие раз в interval секунд пишется одна строка со счётчиками
+	"""
+
+	def __init__(self, logger, title: str, interval: float = 60):
+		self.logger = logger
+		self.title = title
+		self.interval = interval
+		self.counts = {}
+		self._started = time.monotonic()
+
+	def add(self, outcome: str = 'ok'):
+		self.counts[outcome] = self.counts.get(outcome, 0) + 1
+
+		if time.monotonic() - self._started >= self.interval:
+			self.flush()
+
+	def flush(self):
+		"""Пишет накопленные счётчики сразу (например, при остановке бота)"""
+		now = time.monotonic()
+		if self.counts:
+			total = sum(self.counts.values())
+			details = ', '.join(f"{name}: {count}" for name, count in sorted(self.counts.items()))
+			self.logger.info(f"{self.title}: {total} за {now - self._started:.0f} с ({details})")
+		self.counts = {}
+		self._started = now
+
+
 # Создаем логгер для этого модуля (на всякий случай)
-logger = logging.getLogger(__name__)
\ No newline at end of file
+logger = logging.getLogger(__name__)
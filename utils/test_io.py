@@ -0,0 +1,284 @@
+"""
+Импорт и экспорт тестов и расписаний в CSV/JSONL
+
+Файлы читаются и пишутся построчно, в памяти держится только текущая пачка
+строк, поэтому десятки тысяч тестов не требуют загрузки файла целиком.
+Строки проверяются по тем же правилам, что и при создании теста в чате.
+
+Формат тестов (JSONL - по объекту в строке, CSV - с заголовком):
+    title, content_type (text/photo/both), text_content, photo_file_id, question, options
+options - объект {"Вариант": "Результат"} (в CSV - JSON-строка или строки "Вариант :: Результат")
+
+Формат расписаний: test_id, channel_id, scheduled_time (ISO, без пояса - UTC)
+"""
+import os
+import csv
+import json
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Iterator, List, Optional, Tuple
+
+import pytz
+
+from utils.channel_utils import parse_channel_input, is_recognized_channel
+
+logger = logging.getLogger(__name__)
+
+EXPORTS_DIR = os.getenv('EXPORTS_DIR', 'exports')
+
+MAX_RESULT_LENGTH = 200
+CONTENT_TYPES = ('text', 'photo', 'both')
+TEST_FIELDS = ('title', 'content_type', 'text_content', 'photo_file_id', 'question', 'options')
+SCHEDULE_FIELDS = ('test_id', 'channel_id', 'scheduled_time')
+FORMATS = ('jsonl', 'csv')
+
+# Сколько ошибок показывать администратору, остальные только считаются
+MAX_REPORTED_ERRORS = 20
+
+
+class RowError(ValueError):
+	pass
+
+
+def parse_options_text(text: str) -> dict:
+	"""Разбирает варианты вида "Вариант :: Результат" по одному в строке"""
+	options = {}
+	for line in (text or '').split('\n'):
+		if '::' in line:
+			option, result = line.split('::', 1)
+			options[option.strip()] = result.strip()
+	return options
+
+
+def validate_options(options: dict) -> dict:
+	"""Правила вариантов ответа из мастера создания теста; при нарушении - RowError"""
+	for option_text, result_text in options.items():
+		if len(result_text) > MAX_RESULT_LENGTH:
+			raise RowError(
+				f"Результат для '{option_text}' слишком длинный ({len(result_text)} символов). "
+				f"Максимум {MAX_RESULT_LENGTH} символов"
+			)
+
+	empty_results = [option_text for option_text, result_text in options.items() if not result_text.strip()]
+	if empty_results:
+		raise RowError(f"Для следующих вариантов не заполнен результат: {', '.join(empty_results)}")
+
+	if len(options) < 2:
+		raise RowError("Нужно как минимум 2 варианта ответа")
+	return options
+
+
+def validate_test_row(row: dict) -> tuple:
+	"""Проверяет строку теста и возвращает значения для вставки в tests"""
+	title = str(row.get('title') or '').strip()
+	content_type = str(row.get('content_type') or 'text').strip()
+	text_content = str(row.get('text_content') or '').strip()
+	photo_file_id = str(row.get('photo_file_id') or '').strip()
+	question = str(row.get('question') or row.get('question_text') or '').strip()
+
+	if not title:
+		raise RowError("Не заполнено название")
+	if content_type not in CONTENT_TYPES:
+		raise RowError(f"Неизвестный тип контента '{content_type}', допустимо: {', '.join(CONTENT_TYPES)}")
+	if content_type in ('photo', 'both') and not photo_file_id:
+		raise RowError("Для теста с картинкой нужен photo_file_id")
+	if not question:
+		raise RowError("Не заполнен вопрос")
+
+	options = row.get('options')
+	if isinstance(options, str):
+		# В CSV варианты приходят JSON-строкой или в формате мастера
+		try:
+			options = json.loads(options) if options.lstrip().startswith('{') else parse_options_text(options)
+		except json.JSONDecodeError as e:
+			raise RowError(f"Некорректный JSON в options: {e}")
+	if not isinstance(options, dict):
+		raise RowError("options должен быть объектом {\"Вариант\": \"Результат\"}")
+	options = validate_options({str(k).strip(): str(v).strip() for k, v in options.items()})
+
+	return (
+		title, content_type, text_content or None, photo_file_id or None, question,
+		json.dumps(options, ensure_ascii=False)
+	)
+
+
+def validate_schedule_row(row: dict) -> tuple:
+	"""Проверяет строку расписания; время приводится к UTC"""
+	try:
+		test_id = int(row.get('test_id'))
+	except (TypeError, ValueError):
+		raise RowError(f"Некорректный test_id '{row.get('test_id')}'")
+
+	channel_id = parse_channel_input(str(row.get('channel_id') or '').strip())
+	if not channel_id or not is_recognized_channel(channel_id):
+		raise RowError(f"Не удалось распознать канал '{row.get('channel_id')}'")
+
+	try:
+		scheduled_time = datetime.fromisoformat(str(row.get('scheduled_time')).strip())
+	except ValueError:
+		raise RowError(f"Некорректное время '{row.get('scheduled_time')}', нужен ISO формат")
+	if scheduled_time.tzinfo is None:
+		scheduled_time = pytz.utc.localize(scheduled_time)
+
+	return test_id, channel_id, scheduled_time.astimezone(pytz.utc).isoformat()
+
+
+def detect_format(filename: str) -> Optional[str]:
+	extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+	if extension in ('jsonl', 'ndjson'):
+		return 'jsonl'
+	if extension == 'csv':
+		return 'csv'
+	return None
+
+
+def read_rows(path: str, file_format: str) -> Iterator[Tuple[int, object]]:
+	"""Построчно отдаёт (номер строки, dict или RowError), не читая файл целиком"""
+	with open(path, encoding='utf-8-sig', newline='') as f:
+		if file_format == 'csv':
+			reader = csv.DictReader(f)
+			for row in reader:
+				yield reader.line_num, row
+			return
+
+		for line_no, line in enumerate(f, 1):
+			if not line.strip():
+				continue
+			try:
+				row = json.loads(line)
+			except json.JSONDecodeError as e:
+				yield line_no, RowError(f"Некорректный JSON: {e.msg}")
+				continue
+			yield line_no, row if isinstance(row, dict) else RowError("Строка должна быть JSON-объектом")
+
+
+@dataclass
+class ImportResult:
+	kind: str = 'tests'
+	processed: int = 0
+	imported: int = 0
+	skipped: int = 0
+	# Проверенные строки, которые не удалось записать в базу (входят в error_count)
+	failed: int = 0
+	error_count: int = 0
+	errors: List[Tuple[int, str]] = field(default_factory=list)
+
+	def add_error(self, line_no: int, message: str):
+		self.error_count += 1
+		if len(self.errors) < MAX_REPORTED_ERRORS:
+			self.errors.append((line_no, message))
+
+	def add_batch_error(self, line_numbers: List[int], message: str):
+		"""Пачка строк не записана в базу: одна ошибка в списке, в счётчиках - все строки"""
+		self.add_error(line_numbers[0], f"{message} (строки {line_numbers[0]}-{line_numbers[-1]} не добавлены)")
+		self.error_count += len(line_numbers) - 1
+		self.failed += len(line_numbers)
+
+
+async def import_file(db, path: str, file_format: str, batch_size: int = 500,
+					  on_progress: Optional[Callable[[ImportResult], Awaitable]] = None) -> ImportResult:
+	"""
+	Импортирует тесты или расписания из файла. Тип определяется по первой
+	разобранной строке (в CSV - по заголовку): есть scheduled_time - расписания,
+	иначе тесты. Каждая пачка вставляется отдельной транзакцией в потоке, чтобы
+	не блокировать цикл событий; пачка, которую не удалось записать, считается ошибкой
+	"""
+	result = ImportResult()
+	validate, insert = validate_test_row, db.add_tests
+	kind_detected = False
+	batch, batch_lines = [], []
+
+	async def flush():
+		if batch:
+			try:
+				inserted = await asyncio.to_thread(insert, batch)
+			except Exception as e:
+				result.add_batch_error(batch_lines, f"Ошибка записи в базу: {e}")
+			else:
+				result.imported += inserted
+				# Расписания на неизвестные или удалённые тесты пропускаются базой
+				result.skipped += len(batch) - inserted
+			batch.clear()
+			batch_lines.clear()
+		if on_progress:
+			await on_progress(result)
+
+	for line_no, row in read_rows(path, file_format):
+		if not kind_detected and isinstance(row, dict):
+			# Строки с некорректным JSON до первой разобранной не определяют тип
+			kind_detected = True
+			if 'scheduled_time' in row:
+				result.kind, validate, insert = 'schedules', validate_schedule_row, db.import_schedules
+
+		result.processed += 1
+		try:
+			if isinstance(row, RowError):
+				raise row
+			batch.append(validate(row))
+			batch_lines.append(line_no)
+		except RowError as e:
+			result.add_error(line_no, str(e))
+
+		if len(batch) >= batch_size:
+			await flush()
+
+	await flush()
+	logger.info(
+		f"Импорт {result.kind} из {os.path.basename(path)}: обработано {result.processed}, "
+		f"добавлено {result.imported}, ошибок {result.error_count} (не записано в базу {result.failed}), "
+		f"пропущено {result.skipped}"
+	)
+	return result
+
+
+def _write_rows(path: str, file_format: str, fields: tuple, rows: Iterator[dict]) -> int:
+	"""Пишет строки во временный файл и переименовывает его, чтобы не оставлять полуготовый экспорт"""
+	os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+	partial_path = path + '.part'
+	count = 0
+	with open(partial_path, 'w', encoding='utf-8', newline='') as f:
+		writer = csv.DictWriter(f, fieldnames=fields) if file_format == 'csv' else None
+		if writer:
+			writer.writeheader()
+		for row in rows:
+			if writer:
+				writer.writerow(row)
+			else:
+				f.write(json.dumps(row, ensure_ascii=False) + '\n')
+			count += 1
+	os.replace(partial_path, path)
+	return count
+
+
+def export_tests(db, path: str, file_format: str) -> int:
+	"""Экспорт активных тестов; файл можно загрузить обратно импортом"""
+
+	def rows():
+		for title, content_type, text_content, photo_file_id, question, options in db.iter_tests():
+			yield {
+				'title': title,
+				'content_type': content_type,
+				'text_content': text_content or '',
+				'photo_file_id': photo_file_id or '',
+				'question': question,
+				# В CSV варианты остаются JSON-строкой, в JSONL - объектом
+				'options': options if file_format == 'csv' else json.loads(options),
+			}
+
+	return _write_rows(path, file_format, TEST_FIELDS, rows())
+
+
+def export_schedules(db, path: str, file_format: str) -> int:
+	"""Экспорт ещё не отправленных расписаний"""
+	rows = (
+		{'test_id': test_id, 'channel_id': channel_id, 'scheduled_time': scheduled_time}
+		for test_id, channel_id, scheduled_time in db.iter_pending_schedules()
+	)
+	return _write_rows(path, file_format, SCHEDULE_FIELDS, rows)
+
+
+def export_path(kind: str, file_format: str) -> str:
+	timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+	return os.path.join(EXPORTS_DIR, f"{kind}_{timestamp}.{file_format}")
@@ -0,0 +1,85 @@
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from utils.database import Database
+from utils.metrics import metrics, MetricsRegistry
+
+
+@dataclass(frozen=True)
+class TestVersion:
+	"""Неизменяемое содержимое теста; options - пары (вариант, результат) в порядке кнопок"""
+	id: str
+	title: str
+	content_type: str
+	text_content: Optional[str]
+	photo_file_id: Optional[str]
+	question_text: str
+	options: Tuple[Tuple[str, str], ...]
+
+	@classmethod
+	def from_row(cls, row) -> 'TestVersion':
+		version_id, title, content_type, text_content, photo_file_id, question_text, options = row
+		return cls(
+			version_id, title, content_type, text_content, photo_file_id, question_text,
+			tuple(json.loads(options).items())
+		)
+
+	def option(self, index: int) -> Optional[Tuple[str, str]]:
+		return self.options[index] if 0 <= index < len(self.options) else None
+
+
+class VersionCache:
+	"""
+	Кэш версий тестов по id
+
+	Версия неизменяема, поэтому запись никогда не устаревает и не требует
+	сброса: при нехватке места вытесняются давно не использованные.
+	Промахи (неизвестный id) не кэшируются
+	"""
+
+	def __init__(self, db: Database, max_size: int = 4096, registry: MetricsRegistry = metrics):
+		self.db = db
+		self.max_size = max_size
+		self.registry = registry
+		self._versions: 'OrderedDict[str, TestVersion]' = OrderedDict()
+
+	def __len__(self):
+		return len(self._versions)
+
+	def remember(self, version: TestVersion) -> TestVersion:
+		self._versions[version.id] = version
+		self._versions.move_to_end(version.id)
+		if len(self._versions) > self.max_size:
+			self._versions.popitem(last=False)
+		return version
+
+	def get(self, version_id: str) -> Optional[TestVersion]:
+		version = self._versions.get(version_id)
+		if version is not None:
+			self._versions.move_to_end(version_id)
+			self.registry.inc('version_cache_hits')
+			return version
+
+		self.registry.inc('version_cache_misses')
+		row = self.db.get_test_version(version_id)
+		return self.remember(TestVersion.from_row(row)) if row else None
+
+	def peek(self, version_id: str) -> Optional[TestVersion]:
+		"""Версия, если она уже в кэше; базу не читает и статистику не меняет"""
+		return self._versions.get(version_id)
+
+	def current(self, db: Database, test_id: int) -> Optional[TestVersion]:
+		"""
+		Текущая версия теста бота db. Сопоставление тест -> версия меняется при
+		правке теста, поэтому каждый раз читается из базы; сама версия кэшируется
+		"""
+		row = db.get_current_version(test_id)
+		if row is None:
+			return None
+		return self._versions.get(row[0]) or self.remember(TestVersion.from_row(row))
+
+
+# Общий кэш версий процесса (для всех ботов)
+test_versions = VersionCache(Database())
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+from utils.emoji import Emoji as E
+from utils.metrics import metrics, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBatcher:
+	"""
+	Групповой коммит для записи статусов отправки
+
+	Запросы (отметки is_sent, сброс намерения для повтора, результаты рассылки)
+	копятся в памяти и записываются одной транзакцией раз в window секунд
+	или по достижении max_size. Вместо fsync на каждую публикацию получается
+	один на окно.
+
+	Потеря ещё не записанной пачки при падении безопасна только вместе с
+	журналом намерений: намерение отправки пишется в базу сразу, до запроса
+	к Telegram, поэтому неподтверждённая строка после перезапуска считается
+	прерванной и не отправляется повторно.
+	"""
+
+	def __init__(self, db, window: float = 0.5, max_size: int = 500, registry: MetricsRegistry = metrics):
+		self.db = db
+		self.window = window
+		self.max_size = max_size
+		self.registry = registry
+		self._pending: List[Tuple[str, tuple]] = []
+		self._timer: Optional[asyncio.TimerHandle] = None
+
+	def __len__(self):
+		return len(self._pending)
+
+	def add(self, sql: str, params: tuple = ()):
+		self._pending.append((sql, params))
+		if len(self._pending) >= self.max_size:
+			self.flush()
+		elif self._timer is None:
+			self._timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+
+	def flush(self) -> int:
+		"""Записывает накопленное одной транзакцией; при ошибке пачка остаётся до следующей попытки"""
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+		if not self._pending:
+			return 0
+
+		pending, self._pending = self._pending, []
+		try:
+			self.db.execute_batch(pending)
+		except Exception as e:
+			logger.error(f"{E.ERROR} Не удалось записать пачку из {len(pending)} изменений: {e}")
+			self._pending = pending + self._pending
+			try:
+				self._timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+			except RuntimeError:
+				# Цикл событий уже остановлен - повторить некому
+				pass
+			return 0
+
+		self.registry.inc('db_group_commits')
+		self.registry.inc('db_batched_writes', value=len(pending))
+		return len(pending)